@@ -0,0 +1,15 @@
+"""
+Воспроизводимые замеры производительности SobNotes.
+
+    python -m benchmarks run --sizes 1k,10k --output before.json
+    python -m benchmarks run --sizes 1k,10k --output after.json
+    python -m benchmarks compare before.json after.json
+
+Корпуса заметок синтетические и детерминированные (``--seed``), наборы
+замеров: ``storage``, ``compression`` (сжатие хранилища: байты на
+диске и в журнале, время записи и загрузки), ``search``, ``model`` (память заметок, теговые
+фильтры), ``similarity`` (похожие заметки и почти-дубликаты), ``history``
+(история версий: запись, размер, восстановление), ``list``
+и ``preview`` (Qt, платформа offscreen), ``gigachat`` (локальный
+поддельный сервер вместо API).
+"""
@@ -0,0 +1,103 @@
+import argparse
+import sys
+import tempfile
+from typing import List
+from benchmarks.corpus import SIZES, make_notes
+from benchmarks.runner import Runner, compare, environment, format_value, load_results, save_results
+from benchmarks.suites import SUITES, Context
+
+
+def _parse_list(value: str, known, what: str) -> List[str]:
+    items = [item.strip().lower() for item in value.split(",") if item.strip()]
+    unknown = [item for item in items if item not in known]
+    if unknown:
+        raise SystemExit(f"неизвестные {what}: {', '.join(unknown)} (есть: {', '.join(known)})")
+    return items
+
+
+def cmd_run(args) -> int:
+    sizes = _parse_list(args.sizes, SIZES, "размеры")
+    suites = _parse_list(args.suites, SUITES, "наборы")
+    try:
+        import PyQt5  # noqa: F401
+        has_qt = True
+    except ImportError:
+        has_qt = False
+    runner = Runner(repeat=args.repeat, warmup=args.warmup)
+    with tempfile.TemporaryDirectory(prefix="sobnotes-bench-", dir=args.workdir) as workdir:
+        unscaled_done = False
+        for size in sizes:
+            print(f"— корпус {size}: {SIZES[size]} заметок", flush=True)
+            notes = make_notes(SIZES[size], args.seed)
+            for name in suites:
+                suite = SUITES[name]
+                if suite.needs_qt and not has_qt:
+                    print(f"набор {name} пропущен: PyQt5 не установлен", file=sys.stderr)
+                    continue
+                if not suite.scaled and unscaled_done:
+                    continue
+                ctx = Context(runner, size if suite.scaled else "-", notes, workdir, args.seed, args.latency)
+                suite.run(ctx)
+            unscaled_done = True
+            del notes
+    save_results(args.output, runner.results, environment())
+    print(f"Результаты: {args.output}")
+    return 0
+
+
+def cmd_compare(args) -> int:
+    old, new = load_results(args.old), load_results(args.new)
+    regressions, improvements, unchanged = compare(old, new, args.threshold, args.min_delta)
+
+    def show(title: str, changes):
+        if not changes:
+            return
+        print(title)
+        for change in changes:
+            suite, name, size = change.key
+            print(f"  {suite:>9} {name:<32} {size:>5}  {format_value(change.old, change.unit):>12}"
+                  f" → {format_value(change.new, change.unit):>12}  ({(change.ratio - 1) * 100:+.1f}%)")
+
+    show("Регрессии:", regressions)
+    show("Улучшения:", improvements)
+    if args.verbose:
+        show("Без изменений:", unchanged)
+    missing = sorted(old.keys() - new.keys())
+    if missing:
+        print("Нет в новом прогоне: " + ", ".join("/".join(key) for key in missing))
+    print(f"Регрессий: {len(regressions)}, улучшений: {len(improvements)}, без изменений: {len(unchanged)}")
+    return 1 if regressions else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Замеры производительности SobNotes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("run", help="прогнать замеры и сохранить результаты в JSON")
+    p.add_argument("--sizes", default="1k,10k", help=f"размеры корпусов через запятую ({', '.join(SIZES)})")
+    p.add_argument("--suites", default=",".join(SUITES), help="наборы замеров через запятую")
+    p.add_argument("--repeat", type=int, default=5, help="повторов каждого замера")
+    p.add_argument("--warmup", type=int, default=1, help="прогревочных повторов, не входящих в результат")
+    p.add_argument("--seed", type=int, default=42, help="seed синтетического корпуса")
+    p.add_argument("--latency", type=float, default=0.0, help="задержка ответа поддельного GigaChat, с")
+    p.add_argument("--workdir", default=None, help="где создавать временные файлы (по умолчанию системный tmp)")
+    p.add_argument("--output", "-o", default="benchmark-results.json")
+    p.set_defaults(handler=cmd_run)
+
+    p = commands.add_parser("compare", help="сравнить два файла результатов; код 1 при регрессиях")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.10, help="порог значимого изменения (доля, 0.10 = 10%%)")
+    p.add_argument("--min-delta", type=float, default=1e-4, help="минимальная значимая разница времени, с")
+    p.add_argument("--verbose", "-v", action="store_true", help="показать и замеры без изменений")
+    p.set_defaults(handler=cmd_compare)
+    return parser
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
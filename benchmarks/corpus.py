@@ -0,0 +1,136 @@
+import random
+from typing import Iterator, List
+from core.models import Note
+
+# Размеры корпусов по имени, как их принимает ``--sizes``
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+TOPICS = [
+    "Python", "GIL", "asyncio", "Docker", "Kubernetes", "PostgreSQL", "Redis", "Kafka", "REST", "gRPC",
+    "HTTP/2", "TCP", "DNS", "OAuth2", "JWT", "Git", "CI/CD", "Linux", "Nginx", "GraphQL",
+    "SOLID", "ООП", "паттерны", "индексы", "транзакции", "репликация", "шардирование", "кэширование",
+    "очереди", "микросервисы", "балансировка", "контейнеры", "сборщик мусора", "замыкания", "декораторы",
+    "генераторы", "итераторы", "многопоточность", "мультипроцессинг", "сортировка", "хеш-таблица",
+    "бинарный поиск", "динамическое программирование", "графы", "деревья", "куча", "big O",
+]
+QUESTIONS = [
+    "Что такое {}", "Как работает {}", "{}: основы", "Зачем нужен {}", "{} на собеседовании",
+    "Плюсы и минусы: {}", "{} vs {}", "Типичные ошибки: {}",
+]
+WORDS = (
+    "данные запрос ответ сервер клиент память процесс поток функция объект класс метод модуль "
+    "пакет очередь задача событие цикл блокировка состояние ключ значение индекс таблица строка "
+    "столбец схема соединение протокол сообщение обработчик контекст ресурс ошибка исключение "
+    "тест производительность задержка пропускная способность масштабирование надёжность"
+).split()
+TAGS = ["python", "backend", "devops", "базы данных", "сети", "алгоритмы", "архитектура", "собеседование",
+        "linux", "безопасность", "frontend", "тестирование"]
+
+CODE_SNIPPETS = [
+    "```python\nasync def fetch(url):\n    async with httpx.AsyncClient() as client:\n"
+    "        return await client.get(url)\n```",
+    "```sql\nSELECT id, title FROM notes WHERE title LIKE '%gil%' ORDER BY id LIMIT 10;\n```",
+    "```bash\ndocker run --rm -p 8080:80 nginx:alpine\n```",
+    "```python\ndef memo(fn):\n    cache = {}\n    def wrapper(*args):\n        if args not in cache:\n"
+    "            cache[args] = fn(*args)\n        return cache[args]\n    return wrapper\n```",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(TOPICS))
+    return " ".join(words).capitalize() + "."
+
+
+def markdown_body(rng: random.Random, topic: str) -> str:
+    """Тело в духе ответов GigaChat: заголовки, абзацы, списки, иногда код и таблица."""
+    parts = [f"## {topic}", " ".join(_sentence(rng) for _ in range(rng.randint(2, 5)))]
+    for _ in range(rng.randint(1, 4)):
+        parts.append(f"### {rng.choice(['Применение', 'Как устроено', 'Пример', 'Нюансы', 'Итог'])}")
+        parts.append(" ".join(_sentence(rng) for _ in range(rng.randint(1, 4))))
+        if rng.random() < 0.6:
+            parts.append("\n".join(f"- **{rng.choice(WORDS)}** — {_sentence(rng)}" for _ in range(rng.randint(2, 6))))
+        if rng.random() < 0.3:
+            parts.append(rng.choice(CODE_SNIPPETS))
+        if rng.random() < 0.1:
+            rows = "\n".join(f"| {rng.choice(TOPICS)} | {rng.choice(WORDS)} |" for _ in range(rng.randint(2, 5)))
+            parts.append(f"| Понятие | Смысл |\n|---|---|\n{rows}")
+    return "\n\n".join(parts) + "\n"
+
+
+def edit_session(rng: random.Random, body: str, count: int) -> List[str]:
+    """
+    Последовательные версии тела, как при правке руками: дописать предложение,
+    удалить строку или заменить слово в случайном месте.
+    """
+    versions = []
+    for _ in range(count):
+        lines = body.split("\n")
+        line = rng.randrange(len(lines))
+        action = rng.random()
+        if action < 0.5:
+            lines[line] = (lines[line] + " " + _sentence(rng)).strip()
+        elif action < 0.7 and len(lines) > 1:
+            del lines[line]
+        else:
+            words = lines[line].split(" ")
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            lines[line] = " ".join(words)
+        body = "\n".join(lines)
+        versions.append(body)
+    return versions
+
+
+def iter_notes(count: int, seed: int = 42) -> Iterator[Note]:
+    """Детерминированный синтетический корпус: одинаковый seed даёт одинаковые заметки."""
+    rng = random.Random(seed)
+    for i in range(count):
+        topic = rng.choice(TOPICS)
+        template = rng.choice(QUESTIONS)
+        title = template.format(topic, rng.choice(TOPICS))
+        tags = rng.sample(TAGS, rng.randint(0, 3))
+        note_id = f"{rng.getrandbits(128):032x}"
+        yield Note(title=f"{title} #{i}", body=markdown_body(rng, topic), tags=tags, id=note_id)
+
+
+def make_notes(count: int, seed: int = 42) -> List[Note]:
+    return list(iter_notes(count, seed))
+
+
+def make_queries(rng: random.Random, count: int) -> List[str]:
+    """Запросы как из строки поиска: темы, слова из тел, префиксы и опечатки."""
+    queries = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            queries.append(rng.choice(TOPICS).lower())
+        elif kind == 1:
+            queries.append(f"{rng.choice(TOPICS).lower()} {rng.choice(WORDS)}")
+        elif kind == 2:
+            word = rng.choice(WORDS)
+            queries.append(word[:max(2, len(word) // 2)])
+        else:
+            # Опечатка: переставляем две соседние буквы
+            word = rng.choice([topic for topic in TOPICS if len(topic) > 4]).lower()
+            j = rng.randrange(1, len(word) - 1)
+            queries.append(word[:j - 1] + word[j] + word[j - 1] + word[j + 1:])
+    return queries
+
+
+def make_tag_queries(rng: random.Random, count: int) -> List[str]:
+    """Теговые фильтры: один тег, пересечение двух, вариант через запятую и исключение."""
+    tags = [tag for tag in TAGS if " " not in tag]
+    queries = []
+    for i in range(count):
+        first, second = rng.sample(tags, 2)
+        kind = i % 4
+        if kind == 0:
+            queries.append(f"tag:{first}")
+        elif kind == 1:
+            queries.append(f"tag:{first} tag:{second}")
+        elif kind == 2:
+            queries.append(f"tag:{first},{second}")
+        else:
+            queries.append(f"tag:{first} -tag:{second}")
+    return queries
@@ -0,0 +1,171 @@
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Ответ по умолчанию: Markdown примерно того же размера, что и у настоящего API
+DEFAULT_ANSWER = (
+    "## Что это\n\nКороткое определение понятия и его назначение.\n\n"
+    "### Где применяется\n\n- веб-сервисы\n- обработка данных\n- инфраструктура\n\n"
+    "### Пример\n\n```python\nprint('hello')\n```\n\n"
+    "### Итог\n\nПонятие стоит знать для собеседования и повседневной работы.\n"
+) * 3
+
+
+# Вид сбоя «оборвать соединение»; остальные сбои — HTTP-статус ответа
+DROP = "drop"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными write — без этого Nagle добавляет к ответу ~40 мс
+    disable_nagle_algorithm = True
+    server: "FakeGigaChatServer"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        fake = self.server
+        if self.path.startswith("/oauth"):
+            fake.count("oauth")
+            self._send_json({"access_token": "fake-token", "expires_at": int((time.time() + 1800) * 1000)})
+            return
+        fake.count("chat")
+        if self.headers.get("Authorization") != "Bearer fake-token":
+            self._send_json({"message": "Unauthorized"}, status=401)
+            return
+        request = json.loads(body)
+        fault = fake.next_fault()
+        if fault == DROP:
+            # Обрыв соединения без ответа — у клиента это сетевая ошибка
+            self.close_connection = True
+            return
+        if fault is not None:
+            headers = {"Retry-After": f"{fake.retry_after:g}"} if fake.retry_after is not None else {}
+            self._send_json({"message": "Too Many Requests" if fault == 429 else "Service Unavailable"},
+                            status=fault, headers=headers)
+            return
+        if fake.latency:
+            time.sleep(fake.latency)
+        if request.get("stream"):
+            self._send_stream(fake.answer, fake.stream_chunks)
+        else:
+            self._send_json({"choices": [{"message": {"role": "assistant", "content": fake.answer}}]})
+
+    def _send_json(self, data: dict, status: int = 200, headers: dict | None = None):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, answer: str, chunks: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, len(answer) // chunks)
+        events = [
+            "data: " + json.dumps({"choices": [{"delta": {"content": answer[i:i + step]}}]}, ensure_ascii=False)
+            for i in range(0, len(answer), step)
+        ]
+        events.append("data: [DONE]")
+        for event in events:
+            data = (event + "\n\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeGigaChatServer(ThreadingHTTPServer):
+    """
+    Локальная замена GigaChat API для замеров: OAuth выдаёт токен,
+    chat/completions отвечает заданным текстом (обычным JSON или потоком SSE)
+    после искусственной задержки ``latency`` секунд.
+
+    Сбои для проверки повторов: первые ``fail_first`` запросов и доля
+    ``error_rate`` остальных получают ``error_status`` (или обрыв соединения
+    при ``error_status=DROP``), а при ``rate_limit`` запросов в секунду лишние
+    получают 429. К ответам 429/5xx добавляется ``Retry-After: retry_after``.
+
+    Используется как контекстный менеджер: сервер работает в фоновом потоке
+    на свободном порту 127.0.0.1.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, answer: str = DEFAULT_ANSWER, latency: float = 0.0, stream_chunks: int = 20,
+                 fail_first: int = 0, error_rate: float = 0.0, error_status: int | str = 503,
+                 rate_limit: float | None = None, retry_after: float | None = None, seed: int = 0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.answer = answer
+        self.latency = latency
+        self.stream_chunks = stream_chunks
+        self.fail_first = fail_first
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.stats = {"oauth": 0, "chat": 0, "failed": 0, "throttled": 0}
+        self._stats_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        # Серверный token bucket для rate_limit: запас на одну секунду
+        self._tokens = rate_limit or 0.0
+        self._updated = time.monotonic()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def oauth_url(self) -> str:
+        return self.base_url + "/oauth"
+
+    @property
+    def chat_url(self) -> str:
+        return self.base_url + "/chat/completions"
+
+    def count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def next_fault(self) -> int | str | None:
+        """Сбой для очередного запроса chat/completions (None — ответить нормально)."""
+        with self._stats_lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    self.stats["throttled"] += 1
+                    return 429
+                self._tokens -= 1
+            if self.fail_first > 0 or (self.error_rate and self._rng.random() < self.error_rate):
+                self.fail_first = max(0, self.fail_first - 1)
+                self.stats["failed"] += 1
+                return self.error_status
+        return None
+
+    def start(self) -> "FakeGigaChatServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-gigachat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeGigaChatServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
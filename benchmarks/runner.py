@@ -0,0 +1,175 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Any, Callable, Dict, List
+
+# Формат файла результатов; compare отказывается сравнивать файлы разных версий
+RESULTS_FORMAT = 1
+
+
+@dataclass
+class Result:
+    suite: str
+    name: str
+    # Имя корпуса («1k», «10k», …) или «-», если замер не зависит от числа заметок
+    size: str
+    unit: str
+    # Медиана — основная величина для сравнения; для единичных значений все поля равны
+    median: float
+    min: float
+    mean: float
+    max: float
+    stdev: float
+    samples: int
+    # Сколько операций приходится на один замер (значения уже поделены на него)
+    ops: int = 1
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def key(self) -> tuple:
+        return self.suite, self.name, self.size
+
+
+class Runner:
+    """
+    Замеры по схеме «прогрев, затем ``repeat`` повторов»: каждый повтор
+    получает свежее состояние из ``setup`` (его время не учитывается),
+    сборщик мусора на время замера отключается.
+    """
+
+    def __init__(self, repeat: int = 5, warmup: int = 1, verbose: bool = True):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.verbose = verbose
+        self.results: List[Result] = []
+
+    def measure(self, suite: str, name: str, size: str, fn: Callable[[Any], Any],
+                setup: Callable[[], Any] | None = None, ops: int = 1, repeat: int | None = None) -> Result:
+        """Время ``fn(setup())`` в секундах на одну операцию."""
+        repeat = repeat or self.repeat
+        samples = []
+        for i in range(self.warmup + repeat):
+            state = setup() if setup is not None else None
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                fn(state)
+                elapsed = time.perf_counter() - started
+            finally:
+                gc.enable()
+            if i >= self.warmup:
+                samples.append(elapsed / ops)
+        return self._add(suite, name, size, "s", samples, ops)
+
+    def record(self, suite: str, name: str, size: str, value: float, unit: str, **extra) -> Result:
+        """Единичное значение, не время (например, размер файла в байтах)."""
+        return self._add(suite, name, size, unit, [value], 1, extra)
+
+    def _add(self, suite: str, name: str, size: str, unit: str, samples: List[float], ops: int,
+             extra: Dict[str, Any] | None = None) -> Result:
+        result = Result(
+            suite=suite, name=name, size=size, unit=unit,
+            median=statistics.median(samples), min=min(samples), mean=statistics.fmean(samples),
+            max=max(samples), stdev=statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            samples=len(samples), ops=ops, extra=extra or {},
+        )
+        self.results.append(result)
+        if self.verbose:
+            print(f"{suite:>9} {name:<32} {size:>5}  {format_value(result.median, unit):>12}", flush=True)
+        return result
+
+
+def format_value(value: float, unit: str) -> str:
+    if unit == "s":
+        if value >= 1:
+            return f"{value:.3f} s"
+        if value >= 1e-3:
+            return f"{value * 1e3:.2f} ms"
+        return f"{value * 1e6:.1f} µs"
+    if unit == "bytes":
+        return f"{value / (1024 * 1024):.2f} MB" if value >= 1024 * 1024 else f"{value / 1024:.1f} KB"
+    return f"{value:g} {unit}"
+
+
+def _git_commit() -> str | None:
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        out = subprocess.run(["git", "-C", base, "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment() -> dict:
+    """Окружение прогона: без него сравнивать результаты разных машин бессмысленно."""
+    try:
+        from PyQt5.QtCore import QT_VERSION_STR
+    except ImportError:
+        QT_VERSION_STR = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "qt": QT_VERSION_STR,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "argv": sys.argv[1:],
+    }
+
+
+def save_results(path: str, results: List[Result], meta: dict) -> None:
+    data = {"format": RESULTS_FORMAT, "meta": meta, "results": [asdict(result) for result in results]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> Dict[tuple, Result]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") != RESULTS_FORMAT:
+        raise ValueError(f"{path}: неизвестный формат результатов {data.get('format')!r}")
+    results = (Result(**item) for item in data["results"])
+    return {result.key: result for result in results}
+
+
+@dataclass
+class Change:
+    key: tuple
+    unit: str
+    old: float
+    new: float
+
+    @property
+    def ratio(self) -> float:
+        return self.new / self.old if self.old else float("inf") if self.new else 1.0
+
+
+def compare(old: Dict[tuple, Result], new: Dict[tuple, Result], threshold: float = 0.10,
+            min_delta: float = 1e-4) -> tuple[List[Change], List[Change], List[Change]]:
+    """
+    Сравнивает медианы одноимённых замеров. Больше — хуже для всех величин.
+    Изменение считается значимым, если оно больше ``threshold`` (доля)
+    и, для времени, больше ``min_delta`` секунд — иначе это шум таймера.
+    Возвращает (регрессии, улучшения, без изменений).
+    """
+    regressions, improvements, unchanged = [], [], []
+    for key in sorted(old.keys() & new.keys()):
+        change = Change(key, new[key].unit, old[key].median, new[key].median)
+        significant = abs(change.new - change.old) > (min_delta if change.unit == "s" else 0)
+        if significant and change.ratio > 1 + threshold:
+            regressions.append(change)
+        elif significant and change.ratio < 1 / (1 + threshold):
+            improvements.append(change)
+        else:
+            unchanged.append(change)
+    return regressions, improvements, unchanged
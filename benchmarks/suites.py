@@ -0,0 +1,557 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+from core.models import Note
+from core.storage import NoteStorage, open_storage
+from core.compression import COMPRESSION_MODES
+from core.sharded_storage import ShardedNoteStorage
+from core.search_index import SearchIndex
+from core.fuzzy_index import FuzzyIndex
+from core.tag_index import TagIndex, parse_tag_query
+from core.similarity import SimilarityIndex
+from core.history import RevisionHistory
+from benchmarks.corpus import edit_session, make_queries, make_tag_queries
+from benchmarks.runner import Runner
+
+# Те же лимиты, что у строки поиска в ui/main_window.py
+SEARCH_RESULT_LIMIT = 500
+FUZZY_RESULT_LIMIT = 50
+# Сколько запросов прогоняется в одном замере поиска
+QUERY_COUNT = 40
+# Сколько заметок правится в замере дописывания в журнал
+EDIT_COUNT = 100
+# Сколько заметок правится перед замером компакции журнала
+COMPACT_EDITS = 5
+# Сколько запросов набирается по символу в замере поиска по мере набора
+TYPING_QUERIES = 10
+# Сколько заметок подряд открывается в замере открытия заметки
+OPEN_NOTES = 20
+# История версий: сколько заметок правится и сколько версий у каждой
+HISTORY_NOTES = 200
+HISTORY_REVISIONS = 40
+BACKENDS = ("json", "sqlite", "indexed", "sharded")
+
+
+@dataclass
+class Context:
+    """Всё, что нужно наборам замеров: корпус, каталог для файлов и параметры прогона."""
+    runner: Runner
+    size: str
+    notes: List[Note]
+    workdir: str
+    seed: int = 42
+    # Задержка ответа поддельного GigaChat, секунды
+    latency: float = 0.0
+
+    def queries(self, count: int = QUERY_COUNT) -> List[str]:
+        return make_queries(random.Random(self.seed), count)
+
+    def tag_queries(self, count: int = QUERY_COUNT) -> List[str]:
+        return make_tag_queries(random.Random(self.seed), count)
+
+
+@dataclass
+class Suite:
+    run: Callable[[Context], None]
+    # False — результат не зависит от числа заметок, набор гоняется один раз
+    scaled: bool = True
+    needs_qt: bool = False
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+@contextmanager
+def _chdir(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# ———— Хранилище —————
+
+def run_storage(ctx: Context) -> None:
+    measure = ctx.runner.measure
+    for backend in BACKENDS:
+        directory = os.path.join(ctx.workdir, f"storage-{backend}-{ctx.size}")
+        os.makedirs(directory, exist_ok=True)
+        opened = []
+
+        def fresh():
+            # Каждый замер загрузки — с новым объектом хранилища, без тёплых кэшей в памяти
+            while opened:
+                opened.pop().close()
+            opened.append(open_storage(backend, directory))
+            return opened[-1]
+
+        writer = fresh()
+        measure("storage", f"{backend}.save_notes", ctx.size, lambda _: writer.save_notes(ctx.notes))
+        ctx.runner.record("storage", f"{backend}.disk_size", ctx.size, _dir_size(directory), "bytes")
+        measure("storage", f"{backend}.load_notes", ctx.size, lambda storage: storage.load_notes(), setup=fresh)
+        if backend == "indexed":
+            measure("storage", "indexed.load_notes+bodies", ctx.size,
+                    lambda storage: [note.body for note in storage.load_notes()], setup=fresh)
+        if backend == "sharded":
+            # Декодирование частей в процессах: выигрыш растёт с числом ядер
+            measure("storage", "sharded.load_notes.processes", ctx.size,
+                    lambda storage: storage.load_notes(),
+                    setup=lambda: ShardedNoteStorage(fresh().directory, processes=True))
+
+        storage = fresh()
+        loaded = storage.load_notes()
+        edited = random.Random(ctx.seed).sample(loaded, min(EDIT_COUNT, len(loaded)))
+
+        def edit(_):
+            for note in edited:
+                note.body += "\nПравка."
+                storage.save_note(note)
+            storage.flush()
+
+        measure("storage", f"{backend}.save_note+flush", ctx.size, edit, ops=len(edited))
+        if isinstance(storage, NoteStorage):
+            # Компакция после правки нескольких заметок: json переписывает весь снимок,
+            # sharded — только части с этими заметками
+            few = edited[:COMPACT_EDITS]
+
+            def edit_few():
+                for note in few:
+                    note.body += "\nПравка."
+                    storage.save_note(note)
+                storage.flush()
+                storage.wait_for_compaction()
+
+            def compact(_):
+                storage.compact_in_background()
+                storage.wait_for_compaction()
+
+            measure("storage", f"{backend}.compact", ctx.size, compact, setup=edit_few)
+
+        # Тот же каталог глазами второго экземпляра: сколько стоит подхватить чужие правки
+        tracked = open_storage(backend, directory, track_changes=True)
+        tracked.load_notes()
+        tracked.start_change_tracking()
+        measure("storage", f"{backend}.read_external_changes", ctx.size,
+                lambda _: tracked.read_external_changes(), setup=lambda: edit(None))
+        tracked.close()
+        if storage.supports_search:
+            queries = ctx.queries()
+            measure("storage", f"{backend}.search", ctx.size,
+                    lambda _: [storage.search(query, limit=SEARCH_RESULT_LIMIT) for query in queries],
+                    ops=len(queries))
+        while opened:
+            opened.pop().close()
+
+
+def run_compression(ctx: Context) -> None:
+    """
+    Сжатие хранилищ json и sharded: размер на диске и байты журнала на правку,
+    время полной записи и загрузки; ratio — доля от размера без сжатия.
+    """
+    measure = ctx.runner.measure
+    for backend in ("json", "sharded"):
+        baseline: Dict[str, float] = {}
+        for compression in COMPRESSION_MODES:
+            name = f"{backend}.{compression}"
+            directory = os.path.join(ctx.workdir, f"compression-{name}-{ctx.size}")
+            os.makedirs(directory, exist_ok=True)
+            opened = []
+
+            def fresh():
+                while opened:
+                    opened.pop().close()
+                opened.append(open_storage(backend, directory, compression=compression))
+                return opened[-1]
+
+            writer = fresh()
+            measure("compression", f"{name}.save_notes", ctx.size, lambda _: writer.save_notes(ctx.notes))
+            sizes = {"disk_size": _dir_size(directory)}
+            measure("compression", f"{name}.load_notes", ctx.size, lambda storage: storage.load_notes(),
+                    setup=fresh)
+
+            storage = fresh()
+            loaded = storage.load_notes()
+            edited = random.Random(ctx.seed).sample(loaded, min(EDIT_COUNT, len(loaded)))
+            before = os.path.getsize(storage.journal_path) if os.path.exists(storage.journal_path) else 0
+            for note in edited:
+                note.body += "\nПравка."
+                storage.save_note(note)
+            storage.flush()
+            storage.wait_for_compaction()
+            if edited and os.path.exists(storage.journal_path):
+                sizes["journal_bytes_per_edit"] = (os.path.getsize(storage.journal_path) - before) / len(edited)
+            while opened:
+                opened.pop().close()
+
+            for metric, value in sizes.items():
+                ctx.runner.record("compression", f"{name}.{metric}", ctx.size, value, "bytes")
+                if compression == "none":
+                    baseline[metric] = value
+                elif baseline.get(metric):
+                    ctx.runner.record("compression", f"{name}.{metric}.ratio", ctx.size,
+                                      value / baseline[metric], "ratio")
+
+
+# ———— Поиск без GUI —————
+
+def run_search(ctx: Context) -> None:
+    measure = ctx.runner.measure
+    queries = ctx.queries()
+    measure("search", "search_index.rebuild", ctx.size, lambda _: SearchIndex().rebuild(ctx.notes))
+    measure("search", "fuzzy_index.rebuild", ctx.size, lambda _: FuzzyIndex().rebuild(ctx.notes))
+    index = SearchIndex()
+    index.rebuild(ctx.notes)
+    fuzzy = FuzzyIndex()
+    fuzzy.rebuild(ctx.notes)
+    measure("search", "search_index.search", ctx.size,
+            lambda _: [index.search(query, limit=SEARCH_RESULT_LIMIT) for query in queries], ops=len(queries))
+    measure("search", "fuzzy_index.search", ctx.size,
+            lambda _: [fuzzy.search(query, limit=FUZZY_RESULT_LIMIT) for query in queries], ops=len(queries))
+
+
+def run_similarity(ctx: Context) -> None:
+    """Похожие заметки (TF-IDF), почти-дубликаты (MinHash) и проверка темы перед генерацией."""
+    measure = ctx.runner.measure
+    measure("similarity", "similarity.rebuild", ctx.size, lambda _: SimilarityIndex().rebuild(ctx.notes),
+            repeat=1)
+    index = SimilarityIndex()
+    index.rebuild(ctx.notes)
+    sample = random.Random(ctx.seed).sample(ctx.notes, min(QUERY_COUNT, len(ctx.notes)))
+    queries = ctx.queries()
+    measure("similarity", "similarity.related", ctx.size,
+            lambda _: [index.related(note) for note in sample], ops=len(sample))
+    measure("similarity", "similarity.duplicates_of", ctx.size,
+            lambda _: [index.duplicates_of(note) for note in sample], ops=len(sample))
+    measure("similarity", "similarity.existing_for_query", ctx.size,
+            lambda _: [index.existing_for_query(query) for query in queries], ops=len(queries))
+    measure("similarity", "similarity.update", ctx.size,
+            lambda _: [index.update(note) for note in sample], ops=len(sample))
+
+
+# ———— История версий —————
+
+def run_history(ctx: Context) -> None:
+    """Запись версий (кадры + дельты), размер истории против полных копий и восстановление версий."""
+    rng = random.Random(ctx.seed)
+    sample = rng.sample(ctx.notes, min(HISTORY_NOTES, len(ctx.notes)))
+    sessions = [(Note(title=note.title, body=note.body, tags=note.tags, id=note.id),
+                 edit_session(rng, note.body, HISTORY_REVISIONS)) for note in sample]
+    revisions = len(sessions) * (HISTORY_REVISIONS + 1)
+    directory = os.path.join(ctx.workdir, f"history-{ctx.size}")
+    os.makedirs(directory, exist_ok=True)
+    opened = []
+
+    def fresh():
+        while opened:
+            opened.pop().close()
+        path = os.path.join(directory, "history.sqlite3")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        # Без слияния: каждая правка — отдельная версия
+        opened.append(RevisionHistory(path, max_bytes=1 << 40, coalesce_seconds=0))
+        return opened[-1]
+
+    def record(history: RevisionHistory):
+        for note, versions in sessions:
+            body = note.body
+            history.track(note)
+            for version in versions:
+                note.body = version
+                history.record(note)
+                history.flush()
+            note.body = body
+
+    measure = ctx.runner.measure
+    measure("history", "history.record+flush", ctx.size, record, setup=fresh, ops=revisions, repeat=1)
+    history = fresh()
+    record(history)
+    stored = history.stats()["bytes"]
+    full = sum(len(note.body.encode("utf-8")) + sum(len(v.encode("utf-8")) for v in versions)
+               for note, versions in sessions)
+    corpus = sum(len(note.body.encode("utf-8")) for note in ctx.notes)
+    ctx.runner.record("history", "history.bytes_per_revision", ctx.size, stored / revisions, "bytes")
+    ctx.runner.record("history", "history.vs_full_copies", ctx.size, stored / full, "ratio")
+    ctx.runner.record("history", "history.vs_corpus", ctx.size, stored / corpus, "ratio",
+                      notes=len(sessions), revisions=revisions)
+    targets = [(note.id, rng.randint(1, HISTORY_REVISIONS + 1)) for note, _ in rng.sample(sessions, min(
+        QUERY_COUNT, len(sessions)))]
+    measure("history", "history.body_at", ctx.size,
+            lambda _: [history.body_at(note_id, rev) for note_id, rev in targets], ops=len(targets))
+    while opened:
+        opened.pop().close()
+
+
+# ———— Модель заметки и теги —————
+
+def run_model(ctx: Context) -> None:
+    """Память на заметку (без тела) после загрузки из JSON и теговые фильтры по фасетному индексу."""
+    # Как при чтении снимка: у каждой записи свои строки тегов, заметки строятся из словарей
+    data = json.dumps([{"title": note.title, "body": "", "tags": list(note.tags), "id": note.id}
+                       for note in ctx.notes], ensure_ascii=False)
+    tracemalloc.start()
+    try:
+        loaded = [Note(title=item["title"], body=item["body"], tags=item["tags"], id=item["id"])
+                  for item in json.loads(data)]
+        used = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    ctx.runner.record("model", "note.memory_per_note", ctx.size, used / max(1, len(loaded)), "bytes")
+    del loaded
+
+    measure = ctx.runner.measure
+    measure("model", "tag_index.rebuild", ctx.size, lambda _: TagIndex().rebuild(ctx.notes))
+    index = TagIndex()
+    index.rebuild(ctx.notes)
+    queries = [parse_tag_query(query) for query in ctx.tag_queries()]
+    measure("model", "tag_index.match", ctx.size,
+            lambda _: [index.match(query) for query in queries], ops=len(queries))
+
+
+# ———— Qt: список заметок и превью —————
+
+_qt_app = None
+
+
+def qt_app():
+    """QApplication для замеров; без дисплея используется платформа offscreen."""
+    global _qt_app
+    if _qt_app is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5 import QtWidgets
+        # Ссылка держится до конца процесса: иначе приложение удалится вместе с первым набором
+        _qt_app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(["sobnotes-bench"])
+    return _qt_app
+
+
+def run_list(ctx: Context) -> None:
+    """Главное окно поверх корпуса: запуск, filter_notes на запросах и сброс фильтра."""
+    app = qt_app()
+    from config import storage_backend
+    from ui.main_window import MainWindow
+
+    workdir = os.path.join(ctx.workdir, f"window-{ctx.size}")
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    storage = open_storage(storage_backend, os.path.join(workdir, "data"))
+    storage.save_notes(ctx.notes)
+    storage.close()
+
+    windows = []
+
+    def close_windows():
+        while windows:
+            window = windows.pop()
+            # Фоновая сборка индексов прошлого окна не должна отнимать время у следующего замера
+            wait_ready(window)
+            window.close()
+            window.deleteLater()
+        app.processEvents()
+
+    def start(_):
+        # До первого кадра окна: repaint рисует синхронно, не запуская отложенную
+        # загрузку заметок — она начнётся на следующем проходе цикла событий
+        window = MainWindow()
+        window.show()
+        window.repaint()
+        windows.append(window)
+
+    def wait_ready(window):
+        while not window.startup_complete:
+            app.processEvents()
+            time.sleep(0.001)
+
+    def start_until_ready(_):
+        start(None)
+        wait_ready(windows[-1])
+
+    queries = ctx.queries()
+
+    def filter_all(_):
+        for query in queries:
+            window.filter_notes(query)
+            window.search_runner.wait()
+            app.processEvents()
+
+    # Набор по символу и стирание обратно: каждое нажатие дожидается своего результата
+    keystrokes = [query[:i] for query in queries[:TYPING_QUERIES] for i in
+                  itertools.chain(range(1, len(query) + 1), range(len(query) - 1, 0, -1))]
+
+    def type_queries(_):
+        for text in keystrokes:
+            window.filter_notes(text)
+            window.search_runner.wait()
+            app.processEvents()
+
+    def filtered():
+        window.filter_notes(queries[0])
+        window.search_runner.wait()
+        app.processEvents()
+
+    def populate(_):
+        window.populate_note_list()
+        app.processEvents()
+
+    def open_notes(_):
+        for row in range(min(OPEN_NOTES, window.note_proxy.rowCount())):
+            window.load_selected_note(window.note_proxy.index(row))
+            app.processEvents()
+
+    def forget_previews():
+        # Холодное открытие: ни кэша превью, ни отложенной подготовки соседей
+        window.editor.body_edit.documents.clear()
+        window.editor.body_edit._prefetch_queue.clear()
+
+    measure = ctx.runner.measure
+    with _chdir(workdir):
+        try:
+            measure("list", "window.startup", ctx.size, start, setup=close_windows)
+            measure("list", "window.ready", ctx.size, start_until_ready, setup=close_windows)
+            window = windows[-1]
+            # Кэш запросов чистится перед каждым повтором, иначе повторы замеряли бы только его
+            measure("list", "filter_notes", ctx.size, filter_all, ops=len(queries),
+                    setup=window.search_runner.invalidate)
+            measure("list", "filter_notes.typing", ctx.size, type_queries, ops=len(keystrokes),
+                    setup=window.search_runner.invalidate)
+            measure("list", "populate_note_list", ctx.size, populate, setup=filtered)
+            # Открытие заметок подряд: заново разбирая Markdown и из кэша готовых превью
+            measure("list", "open_note.cold", ctx.size, open_notes, ops=OPEN_NOTES, setup=forget_previews)
+            measure("list", "open_note.cached", ctx.size, open_notes, ops=OPEN_NOTES)
+        finally:
+            close_windows()
+
+
+def run_preview(ctx: Context) -> None:
+    """MarkdownEditor._update_preview на телах из корпуса и разбор большого документа."""
+    qt_app()
+    from ui.markdown_editor import MarkdownEditor, build_markdown_document
+
+    editor = MarkdownEditor()
+    editor.resize(650, 600)
+    editor.show()
+    rng = random.Random(ctx.seed)
+    bodies = [note.body for note in rng.sample(ctx.notes, min(30, len(ctx.notes)))]
+    cycle = itertools.cycle(bodies)
+
+    def next_body():
+        editor.raw.blockSignals(True)
+        editor.raw.setPlainText(next(cycle))
+        editor.raw.blockSignals(False)
+
+    measure = ctx.runner.measure
+    measure("preview", "update_preview", ctx.size, lambda _: editor._update_preview(),
+            setup=next_body, repeat=len(bodies))
+    # Большой документ главное окно разбирает в пуле потоков — замеряем сам разбор
+    large = "\n\n".join(itertools.islice(itertools.cycle(bodies), 150))
+    font = editor.preview.font()
+    measure("preview", "build_document.large", ctx.size, lambda _: build_markdown_document(large, font))
+    ctx.runner.record("preview", "large_document.chars", ctx.size, len(large), "chars")
+    editor.close()
+    editor.deleteLater()
+
+
+# ———— GigaChat —————
+
+def run_gigachat(ctx: Context) -> None:
+    """
+    generate_note_with_gigachat против локального поддельного сервера GigaChat:
+    нормальная работа, повторы при сбоях, лимит скорости (429) и одинаковые запросы.
+    """
+    from core import gigachat
+    from core.request_scheduler import AdaptiveRateLimiter, RetryPolicy
+    from benchmarks.fake_gigachat import FakeGigaChatServer
+
+    queries = [note.title for note in ctx.notes[:20]]
+    loop = asyncio.new_event_loop()
+    previous_client = gigachat._default_client
+    measure = ctx.runner.measure
+    # Короткие паузы между повторами: замеряется логика повторов, а не ожидание
+    retry = RetryPolicy(max_attempts=8, base_delay=0.02, max_delay=0.5)
+
+    def use_client(server: FakeGigaChatServer, limiter: AdaptiveRateLimiter | None = None):
+        if gigachat._default_client is not None and gigachat._default_client is not previous_client:
+            loop.run_until_complete(gigachat._default_client.aclose())
+        gigachat._default_client = gigachat.GigaChatClient(
+            credentials="bench", rq_uid="bench", oauth_url=server.oauth_url, chat_url=server.chat_url,
+            retry=retry, limiter=limiter,
+        )
+
+    async def sequential(items=queries):
+        for query in items:
+            await gigachat.generate_note_with_gigachat(query)
+
+    async def concurrent(items=queries):
+        await asyncio.gather(*(gigachat.generate_note_with_gigachat(query) for query in items))
+
+    async def streamed():
+        for query in queries:
+            async for _ in gigachat.stream_note_with_gigachat(query):
+                pass
+
+    def api_calls_per_query(name: str, server: FakeGigaChatServer, before: int, result) -> None:
+        # Прогревочные прогоны тоже ходили на сервер
+        queries_sent = (result.samples + ctx.runner.warmup) * result.ops
+        ctx.runner.record("gigachat", name, ctx.size, (server.stats["chat"] - before) / queries_sent, "ratio")
+
+    try:
+        with FakeGigaChatServer(latency=ctx.latency) as server:
+            # Холодный вызов: новый клиент — OAuth и новое соединение
+            measure("gigachat", "generate.cold", ctx.size,
+                    lambda _: loop.run_until_complete(gigachat.generate_note_with_gigachat(queries[0])),
+                    setup=lambda: use_client(server))
+            measure("gigachat", "generate.sequential", ctx.size,
+                    lambda _: loop.run_until_complete(sequential()), ops=len(queries))
+            measure("gigachat", "generate.concurrent", ctx.size,
+                    lambda _: loop.run_until_complete(concurrent()), ops=len(queries))
+            measure("gigachat", "stream.sequential", ctx.size,
+                    lambda _: loop.run_until_complete(streamed()), ops=len(queries))
+            # Одинаковые одновременные запросы уходят в API один раз
+            duplicates = [queries[0]] * len(queries)
+            before = server.stats["chat"]
+            result = measure("gigachat", "generate.duplicates", ctx.size,
+                             lambda _: loop.run_until_complete(concurrent(duplicates)), ops=len(duplicates))
+            api_calls_per_query("duplicates.api_calls_per_query", server, before, result)
+
+        # Каждый пятый ответ — 503: запросы доходят за счёт повторов
+        with FakeGigaChatServer(latency=ctx.latency, error_rate=0.2, seed=ctx.seed) as server:
+            use_client(server)
+            before = server.stats["chat"]
+            result = measure("gigachat", "generate.flaky", ctx.size,
+                             lambda _: loop.run_until_complete(sequential()), ops=len(queries))
+            api_calls_per_query("flaky.api_calls_per_query", server, before, result)
+
+        # Сервер пропускает 20 запросов в секунду, клиент начинает с вдвое большей скорости
+        with FakeGigaChatServer(latency=ctx.latency, rate_limit=20, retry_after=0.1) as server:
+            before = server.stats["chat"]
+            result = measure("gigachat", "generate.rate_limited", ctx.size,
+                             lambda _: loop.run_until_complete(concurrent()),
+                             setup=lambda: use_client(server, AdaptiveRateLimiter(40, burst=4)), ops=len(queries))
+            api_calls_per_query("rate_limited.api_calls_per_query", server, before, result)
+    finally:
+        if gigachat._default_client is not previous_client:
+            loop.run_until_complete(gigachat._default_client.aclose())
+        gigachat._default_client = previous_client
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+SUITES: Dict[str, Suite] = {
+    "storage": Suite(run_storage),
+    "compression": Suite(run_compression),
+    "search": Suite(run_search),
+    "model": Suite(run_model),
+    "similarity": Suite(run_similarity),
+    "history": Suite(run_history),
+    "list": Suite(run_list, needs_qt=True),
+    "preview": Suite(run_preview, scaled=False, needs_qt=True),
+    "gigachat": Suite(run_gigachat, scaled=False),
+}
@@ -5,4 +5,51 @@ load_dotenv()
 
 creds = os.getenv("CREDS")
 client_id = os.getenv("CLIENT_ID")
-client_secret = os.getenv("CLIENT_SECRET")
\ No newline at end of file
+client_secret = os.getenv("CLIENT_SECRET")
+# HTTP/2 для запросов к GigaChat (нужен пакет h2: pip install "httpx[http2]")
+gigachat_http2 = os.getenv("GIGACHAT_HTTP2", "0") == "1"
+# Сколько запросов генерации выполняется параллельно (в пределах лимитов API)
+gigachat_max_concurrency = int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "4"))
+# Повторы запросов к GigaChat при 429/5xx и сетевых сбоях: всего попыток на запрос
+gigachat_max_attempts = int(os.getenv("GIGACHAT_MAX_ATTEMPTS", "4"))
+# Потолок скорости запросов генерации, в секунду (0 — без ограничения); после 429 скорость снижается сама
+gigachat_rate_limit = float(os.getenv("GIGACHAT_RATE_LIMIT", "5"))
+# Потоковая генерация (server-sent events): текст появляется в редакторе по мере прихода
+gigachat_stream = os.getenv("GIGACHAT_STREAM", "1") == "1"
+# Кэш ответов GigaChat: время жизни записи (дни) и лимит размера (МБ)
+response_cache_ttl_days = float(os.getenv("RESPONSE_CACHE_TTL_DAYS", "30"))
+response_cache_max_mb = float(os.getenv("RESPONSE_CACHE_MAX_MB", "32"))
+# Хранилище заметок: json (notes.json + журнал), sqlite (notes.db с FTS5),
+# indexed (при старте читается только индекс, тела — по требованию)
+# или sharded (notes.shards: части с контрольными суммами, параллельная загрузка)
+storage_backend = os.getenv("STORAGE_BACKEND", "json").lower()
+# Хранилище sharded: число частей и загрузка в процессах вместо потоков
+# (масштабируется с числом ядер, но запуск процессов стоит ~0.1 с)
+storage_shards = int(os.getenv("STORAGE_SHARDS", "16"))
+storage_load_processes = os.getenv("STORAGE_LOAD_PROCESSES", "0") == "1"
+# Сжатие хранилищ json и sharded: none, zlib (тела по отдельности с общим
+# обученным словарём) или lzma (файл снимка/части целиком, плотнее, но медленнее)
+storage_compression = os.getenv("STORAGE_COMPRESSION", "none").lower()
+# Сколько мегабайт тел заметок держать в памяти для хранилища indexed
+note_body_cache_mb = float(os.getenv("NOTE_BODY_CACHE_MB", "64"))
+# Сколько мегабайт готовых превью заметок (разобранный Markdown) держать в памяти;
+# 0 — разбирать при каждом открытии
+preview_cache_mb = float(os.getenv("PREVIEW_CACHE_MB", "32"))
+# Нечёткий поиск (с опечатками) также по телам заметок, а не только по заголовкам и тегам
+fuzzy_search_bodies = os.getenv("FUZZY_SEARCH_BODIES", "0") == "1"
+# Похожие заметки и почти-дубликаты (TF-IDF, MinHash; нужен numpy): панель под редактором
+# и предупреждение перед генерацией темы, которая уже есть в заметках
+similar_notes = os.getenv("SIMILAR_NOTES", "1") == "1"
+# Следить за файлами хранилища и подхватывать изменения, сделанные извне
+# (синхронизация, второй экземпляр SobNotes, скрипты)
+watch_storage = os.getenv("WATCH_STORAGE", "1") == "1"
+# История версий заметок: бюджет на диске (МБ) и окно (с), в котором правки сливаются в одну версию
+history_max_mb = float(os.getenv("HISTORY_MAX_MB", "16"))
+history_coalesce_seconds = float(os.getenv("HISTORY_COALESCE_SECONDS", "60"))
+# Замеры горячих путей (Настройки → Диагностика производительности)
+metrics_enabled = os.getenv("METRICS_ENABLED", "1") == "1"
+# Запись трассы (формат Chrome Trace) с момента запуска — для разбора медленного старта
+metrics_trace = os.getenv("METRICS_TRACE", "0") == "1"
+# Целевое время от запуска процесса до первого окна (мс); превышение видно в строке
+# состояния после запуска и в окне диагностики
+startup_target_ms = float(os.getenv("STARTUP_TARGET_MS", "1000"))
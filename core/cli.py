@@ -0,0 +1,389 @@
+"""
+Консольный интерфейс SobNotes без Qt: импорт, экспорт, пакетная генерация и поиск.
+
+    python -m core.cli import notes_dir/ dump.jsonl
+    python -m core.cli export out.jsonl
+    python -m core.cli export out_dir/ --format md
+    python -m core.cli generate topics.txt
+    python -m core.cli search "асинхронность python"
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import chain, islice
+from typing import Iterable, Iterator, List
+from core.models import Note
+from core.storage import BaseNoteStorage, open_storage
+
+# Сколько Markdown-файлов разбирает один процесс за задачу
+PARSE_CHUNK = 256
+# Меньше стольких файлов разбираем без пула процессов — его запуск дороже
+PARALLEL_MIN_FILES = 2000
+# Размер пачки записи в хранилище при импорте
+IMPORT_BATCH = 1000
+# Размер куска файла при потоковом чтении JSON-массива
+JSON_READ_CHUNK = 1024 * 1024
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+_SLUG_RE = re.compile(r"[^\w\-]+", re.UNICODE)
+_SEPARATOR_RE = re.compile(r"[\s,]*")
+
+
+# ———— Разбор Markdown —————
+
+def _parse_tags(value: str) -> List[str]:
+    value = value.strip().strip("[]")
+    return [tag.strip().strip("'\"") for tag in value.split(",") if tag.strip().strip("'\"")]
+
+
+def parse_markdown(text: str, fallback_title: str) -> dict:
+    """
+    Заметка из Markdown-файла. Необязательный front matter (``---``) задаёт
+    ``title`` и ``tags``; иначе заголовком становится первая строка ``# ...``
+    (она убирается из тела), а если её нет — имя файла.
+    """
+    title, tags = None, []
+    if text.startswith("---\n"):
+        end = text.find("\n---", 4)
+        if end != -1:
+            for line in text[4:end].splitlines():
+                key, _, value = line.partition(":")
+                key = key.strip().lower()
+                if key == "title":
+                    title = value.strip().strip("'\"")
+                elif key == "tags":
+                    tags = _parse_tags(value)
+            text = text[end + 4:].lstrip("\n")
+    if title is None:
+        first, _, rest = text.partition("\n")
+        if first.startswith("# "):
+            title, text = first[2:].strip(), rest.lstrip("\n")
+        else:
+            title = fallback_title
+    return {"title": title, "body": text.rstrip() + "\n" if text.strip() else "", "tags": tags}
+
+
+def _parse_markdown_files(paths: List[str]) -> List[dict]:
+    # Выполняется в процессе пула: чтение и разбор пачки файлов
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        records.append(parse_markdown(text, os.path.splitext(os.path.basename(path))[0]))
+    return records
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_markdown_files(directory: str) -> Iterator[str]:
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(MARKDOWN_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def iter_markdown_records(paths: Iterable[str], workers: int | None = None) -> Iterator[dict]:
+    """
+    Разбирает Markdown-файлы пачками в пуле процессов. В работе одновременно
+    не больше ``2 × workers`` пачек, поэтому память не зависит от числа файлов.
+    """
+    chunks = _chunks(paths, PARSE_CHUNK)
+    head = list(islice(chunks, PARALLEL_MIN_FILES // PARSE_CHUNK))
+    if workers == 1 or len(head) < PARALLEL_MIN_FILES // PARSE_CHUNK:
+        for chunk in chain(head, chunks):
+            yield from _parse_markdown_files(chunk)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chain(head, chunks):
+            pending.append(pool.submit(_parse_markdown_files, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# ———— Разбор JSON / JSONL —————
+
+def iter_json_array(path: str) -> Iterator[dict]:
+    """Потоково читает JSON-массив объектов (как notes.json), не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(JSON_READ_CHUNK).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path}: ожидался JSON-массив")
+        pos = 1
+        while True:
+            pos = _SEPARATOR_RE.match(buffer, pos).end()
+            if buffer.startswith("]", pos):
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Объект не поместился в буфер — дочитываем следующий кусок
+                chunk = f.read(JSON_READ_CHUNK)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield item
+
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_records(path: str, workers: int | None = None) -> Iterator[dict]:
+    """Записи заметок из каталога Markdown, файла .md, JSON-массива или JSONL."""
+    if os.path.isdir(path):
+        return iter_markdown_records(iter_markdown_files(path), workers)
+    lower = path.lower()
+    if lower.endswith(MARKDOWN_EXTENSIONS):
+        return iter_markdown_records([path], workers)
+    if lower.endswith(".jsonl"):
+        return iter_jsonl(path)
+    if lower.endswith(".json"):
+        return iter_json_array(path)
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def note_from_record(item: dict) -> Note:
+    # id из источника сохраняется; без id заметка получает новый
+    note = Note(title=item.get("title", ""), body=item.get("body", ""), tags=list(item.get("tags", [])))
+    if item.get("id"):
+        note.id = item["id"]
+    return note
+
+
+# ———— Команды —————
+
+def cmd_import(storage: BaseNoteStorage, args) -> int:
+    started = time.perf_counter()
+    total = 0
+    for path in args.paths:
+        notes = (note_from_record(item) for item in iter_records(path, args.workers))
+        count = storage.append_notes(notes, IMPORT_BATCH)
+        total += count
+        print(f"{path}: {count}", file=sys.stderr)
+    print(f"Импортировано заметок: {total} за {time.perf_counter() - started:.1f} с")
+    return 0
+
+
+def _export_filename(note: Note, used: set) -> str:
+    base = _SLUG_RE.sub("-", note.title).strip("-")[:80] or "note"
+    name = base
+    if name.lower() in used:
+        name = f"{base}-{note.id[:8]}"
+    used.add(name.lower())
+    return name + ".md"
+
+
+def format_markdown(note: Note) -> str:
+    tags = ", ".join(note.tags)
+    return f"---\ntitle: {note.title}\ntags: [{tags}]\n---\n\n{note.body}"
+
+
+def cmd_export(storage: BaseNoteStorage, args) -> int:
+    notes = storage.load_notes()
+    fmt = args.format or ("md" if not os.path.splitext(args.output)[1] else
+                          os.path.splitext(args.output)[1].lstrip(".").lower())
+    if fmt == "md":
+        os.makedirs(args.output, exist_ok=True)
+        used: set = set()
+        for note in notes:
+            path = os.path.join(args.output, _export_filename(note, used))
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(format_markdown(note))
+    elif fmt in ("json", "jsonl"):
+        with open(args.output, "w", encoding="utf-8") as f:
+            if fmt == "json":
+                f.write("[\n")
+            for i, note in enumerate(notes):
+                record = json.dumps({"id": note.id, "title": note.title, "body": note.body, "tags": note.tags},
+                                    ensure_ascii=False)
+                if fmt == "json":
+                    f.write(("  " if i == 0 else ",\n  ") + record)
+                else:
+                    f.write(record + "\n")
+            if fmt == "json":
+                f.write("\n]\n")
+    else:
+        print(f"Неизвестный формат экспорта: {fmt}", file=sys.stderr)
+        return 2
+    print(f"Экспортировано заметок: {len(notes)}")
+    return 0
+
+
+def cmd_generate(storage: BaseNoteStorage, args) -> int:
+    # Сеть и кэш ответов нужны только этой команде
+    from config import gigachat_max_concurrency, response_cache_ttl_days, response_cache_max_mb
+    from core.gigachat import generate_note_with_gigachat, get_default_client, PROMPT_TEMPLATE
+    from core.generation_queue import GenerationQueue, PRIORITY_BATCH, DONE, FAILED, CANCELLED
+    from core.response_cache import ResponseCache, CachedGenerator
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    if args.skip_existing and queries:
+        # Темы, по которым уже есть заметки, не отправляются в API
+        from core.similarity import SimilarityIndex
+        notes = storage.load_notes()
+        titles = {note.id: note.title for note in notes}
+        index = SimilarityIndex()
+        index.rebuild(notes)
+        fresh = []
+        for query in queries:
+            existing = index.existing_for_query(query, limit=1)
+            if existing:
+                print(f"пропущено: {query} — есть «{titles[existing[0].note_id]}» ({existing[0].score:.0%})",
+                      file=sys.stderr)
+            else:
+                fresh.append(query)
+        if not fresh:
+            print("Все темы уже есть в заметках", file=sys.stderr)
+            return 0
+        queries = fresh
+    if not queries:
+        print("В файле нет запросов", file=sys.stderr)
+        return 1
+
+    generate = generate_note_with_gigachat
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(os.path.join(args.data_dir, "response_cache.sqlite3"),
+                              max_bytes=int(response_cache_max_mb * 1024 * 1024),
+                              ttl=response_cache_ttl_days * 24 * 3600)
+        generate = CachedGenerator(cache, generate, None, PROMPT_TEMPLATE, get_default_client().model).generate
+
+    finished = threading.Event()
+    counts = {DONE: 0, FAILED: 0, CANCELLED: 0}
+
+    def on_progress(job):
+        if job.state in counts:
+            counts[job.state] += 1
+            done = sum(counts.values())
+            print(f"[{done}/{len(queries)}] {job.state}: {job.query}", file=sys.stderr)
+            if done >= len(queries):
+                finished.set()
+
+    def on_result(job, title, body):
+        storage.save_note(Note(title=title, body=body))
+
+    def on_error(job, tb):
+        print(tb, file=sys.stderr)
+
+    queue = GenerationQueue(generate, max_concurrency=args.concurrency or gigachat_max_concurrency,
+                            on_progress=on_progress, on_result=on_result, on_error=on_error)
+    queue.submit_many(queries, PRIORITY_BATCH)
+    try:
+        finished.wait()
+    except KeyboardInterrupt:
+        queue.cancel_all()
+        print("Генерация прервана", file=sys.stderr)
+    finally:
+        queue.run_coroutine(get_default_client().aclose()).result(5)
+        queue.shutdown()
+        if cache is not None:
+            cache.close()
+    print(f"Сгенерировано: {counts[DONE]}, ошибок: {counts[FAILED]}")
+    return 1 if counts[FAILED] else 0
+
+
+def cmd_search(storage: BaseNoteStorage, args) -> int:
+    from core.tag_index import TagIndex, parse_tag_query
+    notes = storage.load_notes()
+    by_id = {note.id: note for note in notes}
+    # Фильтры «tag:docker tag:k8s» отбирают заметки, остальной текст ищется среди них
+    tag_query = parse_tag_query(args.query, complete=True)
+    query, allowed = tag_query.text, None
+    if tag_query:
+        tag_index = TagIndex()
+        tag_index.rebuild(notes)
+        allowed = tag_index.match(tag_query)
+    limit = args.limit if allowed is None else None
+    if not query.strip():
+        note_ids = allowed.ids(args.limit) if allowed is not None else []
+    elif storage.supports_search:
+        note_ids = storage.search(query, limit=limit)
+    else:
+        from core.search_index import SearchIndex
+        index = SearchIndex()
+        index.rebuild(notes)
+        note_ids = [note_id for note_id, _ in index.search_scored(query, limit=limit)]
+    if allowed is not None and query.strip():
+        note_ids = [note_id for note_id in note_ids if note_id in allowed][:args.limit]
+    if not note_ids and query.strip():
+        # Возможно, опечатка — пробуем нечёткий поиск по заголовкам и тегам
+        from core.fuzzy_index import FuzzyIndex
+        fuzzy = FuzzyIndex()
+        fuzzy.rebuild(notes)
+        matches = fuzzy.search(query, limit=limit)
+        note_ids = [match.note_id for match in matches if allowed is None or match.note_id in allowed][:args.limit]
+    for note_id in note_ids:
+        note = by_id[note_id]
+        tags = f"  [{', '.join(note.tags)}]" if note.tags else ""
+        print(f"{note.id}\t{note.title}{tags}")
+    return 0 if note_ids else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    from config import storage_backend
+    parser = argparse.ArgumentParser(prog="python -m core.cli", description="SobNotes без графического интерфейса")
+    parser.add_argument("--data-dir", default="data", help="каталог с данными (по умолчанию data)")
+    parser.add_argument("--backend", default=storage_backend, choices=("json", "sqlite", "indexed", "sharded"),
+                        help="тип хранилища (по умолчанию STORAGE_BACKEND)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import", help="импорт из каталогов Markdown, JSON и JSONL")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--workers", type=int, default=None, help="процессов для разбора Markdown")
+    p.set_defaults(handler=cmd_import)
+
+    p = commands.add_parser("export", help="экспорт в JSON, JSONL или каталог Markdown")
+    p.add_argument("output")
+    p.add_argument("--format", choices=("json", "jsonl", "md"))
+    p.set_defaults(handler=cmd_export)
+
+    p = commands.add_parser("generate", help="сгенерировать заметки по списку запросов (по одному в строке)")
+    p.add_argument("queries")
+    p.add_argument("--concurrency", type=int, default=None)
+    p.add_argument("--no-cache", action="store_true", help="не использовать кэш ответов")
+    p.add_argument("--skip-existing", action="store_true",
+                   help="не генерировать темы, по которым уже есть похожие заметки")
+    p.set_defaults(handler=cmd_generate)
+
+    p = commands.add_parser("search", help="поиск заметок")
+    p.add_argument("query", help="текст запроса; tag:имя, tag:a,b и -tag:имя — фильтры по тегам")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(handler=cmd_search)
+    return parser
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    storage = open_storage(args.backend, args.data_dir)
+    try:
+        return args.handler(storage, args)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
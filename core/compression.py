@@ -0,0 +1,163 @@
+import base64
+import lzma
+import os
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable
+
+# Сжатие хранилища:
+# - none — как раньше;
+# - zlib — каждое тело заметки отдельный zlib-фрейм с общим обученным словарём,
+#   поэтому любую заметку можно распаковать независимо (и в журнале тоже);
+# - lzma — файл снимка (части хранилища sharded) сжимается целиком: плотнее,
+#   но только пофайлово (у lzma в стандартной библиотеке нет предустановленного словаря)
+COMPRESSION_MODES = ("none", "zlib", "lzma")
+
+ZLIB_LEVEL = 6
+LZMA_PRESET = 1
+XZ_MAGIC = b"\xfd7zXZ\x00"
+# zlib использует не больше 32 КБ словаря, а длинный словарь замедляет каждый фрейм
+DICT_MAX_BYTES = 16 * 1024
+# По скольким телам обучается словарь и сколько их нужно, чтобы обучение имело смысл
+TRAIN_SAMPLE = 2000
+MIN_TRAIN_NOTES = 50
+
+# Словарь до обучения: разметка и обороты, типичные для ответов GigaChat на промпт заметки
+DEFAULT_DICTIONARY = (
+    "```python\n```\n\n- **\n- \n1. 2. 3. \n\n### Пример\n\n### Итог\n\n### Где применяется\n\n"
+    "используется для позволяет например также является основные преимущества особенности "
+    "данных запросов приложения сервера системы производительность масштабирование "
+    "## Что это\n\n"
+).encode("utf-8")
+
+
+def train_dictionary(texts: Iterable[str], max_bytes: int = DICT_MAX_BYTES) -> bytes:
+    """
+    Словарь для zlib по образцу тел: строки, повторяющиеся в разных заметках
+    (заголовки разделов, шаблонные фразы), и самые частые слова. Самое частое
+    кладётся в конец — совпадения ближе к концу словаря кодируются короче.
+    """
+    lines: Counter = Counter()
+    words: Counter = Counter()
+    for text in texts:
+        # Считаем, в скольких заметках встречается строка, а не сколько раз всего
+        lines.update({line for line in text.splitlines(keepends=True) if len(line.strip()) > 3})
+        words.update(set(text.split()))
+    pieces: list[bytes] = []
+    size = 0
+    for line, count in lines.most_common():
+        data = line.encode("utf-8")
+        if count < 2 or size + len(data) > max_bytes // 2:
+            break
+        pieces.append(data)
+        size += len(data)
+    line_count = len(pieces)
+    for word, count in words.most_common():
+        data = word.encode("utf-8") + b" "
+        if count < 2 or size + len(data) > max_bytes:
+            break
+        pieces.append(data)
+        size += len(data)
+    # Слова (их много, каждое ценно меньше) — в начало, строки — в конец
+    return b"".join(reversed(pieces[line_count:])) + b"".join(reversed(pieces[:line_count]))
+
+
+def dictionary_id(zdict: bytes) -> int:
+    """Идентификатор словаря — тот же adler32, что zlib пишет в заголовок фрейма (DICTID)."""
+    return zlib.adler32(zdict)
+
+
+class BodyCodec:
+    """
+    Тела заметок в виде отдельных zlib-фреймов (base64 для JSON) с общим словарём.
+
+    Словари лежат в ``directory`` под именем ``<adler32>.zdict`` и не меняются;
+    каким словарём сжат фрейм, записано в его заголовке, поэтому после
+    переобучения старые фреймы остаются читаемыми. Какой словарь текущий
+    (для новых записей), хранит файл ``current``. Потокобезопасно.
+    """
+
+    def __init__(self, directory: str, level: int = ZLIB_LEVEL):
+        self.directory = directory
+        self.level = level
+        self._lock = threading.Lock()
+        self._dicts: Dict[int, bytes] = {dictionary_id(DEFAULT_DICTIONARY): DEFAULT_DICTIONARY}
+        self._current: bytes | None = None
+
+    def _path(self, dict_id: int) -> str:
+        return os.path.join(self.directory, f"{dict_id:08x}.zdict")
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def dictionary(self, dict_id: int) -> bytes:
+        with self._lock:
+            zdict = self._dicts.get(dict_id)
+            if zdict is None:
+                with open(self._path(dict_id), "rb") as f:
+                    zdict = self._dicts[dict_id] = f.read()
+            return zdict
+
+    @property
+    def current(self) -> bytes:
+        """Словарь для новых фреймов: последний обученный или встроенный."""
+        if self._current is None:
+            try:
+                with open(os.path.join(self.directory, "current"), "r", encoding="ascii") as f:
+                    self._current = self.dictionary(int(f.read().strip(), 16))
+            except (OSError, ValueError):
+                self._current = DEFAULT_DICTIONARY
+        return self._current
+
+    def use(self, zdict: bytes) -> int:
+        """Сделать словарь текущим (записав его на диск) и вернуть его id."""
+        dict_id = dictionary_id(zdict)
+        with self._lock:
+            if not os.path.exists(self._path(dict_id)):
+                self._write(self._path(dict_id), zdict)
+            self._write(os.path.join(self.directory, "current"), f"{dict_id:08x}".encode("ascii"))
+            self._dicts[dict_id] = zdict
+            self._current = zdict
+        return dict_id
+
+    def prune(self) -> None:
+        """Удалить словари, кроме текущего (когда на них больше не ссылается ни одна запись)."""
+        keep = f"{dictionary_id(self.current):08x}.zdict"
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".zdict") and name != keep:
+                os.remove(os.path.join(self.directory, name))
+
+    def encode(self, text: str) -> str:
+        compressor = zlib.compressobj(self.level, zdict=self.current)
+        frame = compressor.compress(text.encode("utf-8")) + compressor.flush()
+        return base64.b64encode(frame).decode("ascii")
+
+    def decode(self, value: str) -> str:
+        frame = base64.b64decode(value)
+        # Заголовок zlib: 2 байта, при флаге FDICT за ними 4 байта adler32 словаря
+        zdict = self.dictionary(int.from_bytes(frame[2:6], "big")) if frame[1] & 0x20 else b""
+        decompressor = zlib.decompressobj(zdict=zdict)
+        return (decompressor.decompress(frame) + decompressor.flush()).decode("utf-8")
+
+
+def pack_file(data: bytes, compression: str) -> bytes:
+    """Содержимое файла снимка/части в выбранной упаковке (lzma — целиком)."""
+    if compression == "lzma":
+        return lzma.compress(data, preset=LZMA_PRESET)
+    return data
+
+
+def unpack_file(data: bytes) -> bytes:
+    """Обратное к ``pack_file``; упаковка определяется по сигнатуре, а не по настройке."""
+    if data.startswith(XZ_MAGIC):
+        return lzma.decompress(data)
+    return data
@@ -0,0 +1,249 @@
+import heapq
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set, Tuple
+from core.models import Note
+from core.search_index import tokenize
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Веса полей при нечётком совпадении
+TITLE_WEIGHT, TAGS_WEIGHT, BODY_WEIGHT = 1.0, 0.8, 0.4
+# Если совпадений не больше стольких, счёт просто суммируется по всем заметкам
+ACCUMULATE_MAX_POSTINGS = 8000
+# Перебор сочетаний уровней применяется к запросам не длиннее стольких слов
+MAX_LATTICE_WORDS = 6
+
+
+def trigrams(word: str) -> Set[str]:
+    """Триграммы слова с выравниванием пробелами: начало и конец слова тоже дают триграммы."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def match_spans(text: str, words: Iterable[str], prefix: str | None = None) -> List[Tuple[int, int]]:
+    """
+    Позиции (начало, конец) слов текста, совпавших с ``words`` без учёта регистра,
+    а также — если задан ``prefix`` — слов, начинающихся с него.
+    """
+    words = set(words)
+    if not words and not prefix:
+        return []
+    spans = []
+    for m in _TOKEN_RE.finditer(text):
+        word = m.group().lower()
+        if word in words or (prefix and word.startswith(prefix)):
+            spans.append(m.span())
+    return spans
+
+
+@dataclass
+class FuzzyMatch:
+    note_id: str
+    score: float
+    # Слова заметки, которые совпали с запросом (для подсветки через match_spans)
+    words: Tuple[str, ...]
+
+
+class FuzzyIndex:
+    """
+    Индекс для поиска с опечатками («kubernets» → «kubernetes»).
+
+    Словарь слов из заголовков и тегов (по желанию и тел) индексируется
+    по триграммам. Для слова запроса кандидаты из словаря набираются по общим
+    триграммам и ранжируются по коэффициенту Дайса; заметки получают сумму
+    лучших сходств по словам запроса с учётом веса поля.
+    Обновляется инкрементально, как и :class:`~core.search_index.SearchIndex`.
+    """
+
+    def __init__(self, threshold: float = 0.4, max_candidates: int = 8, include_bodies: bool = False):
+        """
+        :param threshold: минимальное сходство слова (коэффициент Дайса по триграммам)
+        :param max_candidates: сколько похожих слов словаря брать на одно слово запроса
+        :param include_bodies: индексировать ли слова тел заметок
+        """
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.include_bodies = include_bodies
+        self._reset()
+
+    def _reset(self) -> None:
+        # trigram -> слова словаря, где она встречается
+        self._gram_words: Dict[str, Set[str]] = {}
+        # слово -> {note_id: вес лучшего поля}
+        self._word_notes: Dict[str, Dict[str, float]] = {}
+        # слово -> {вес: заметки} — те же данные, сгруппированные для обхода по убыванию вклада
+        self._word_buckets: Dict[str, Dict[float, Set[str]]] = {}
+        # note_id -> слова заметки
+        self._doc_words: Dict[str, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_words)
+
+    # ———— Обновление индекса —————
+
+    def rebuild(self, notes: Iterable[Note]) -> None:
+        self._reset()
+        for note in notes:
+            self._add(note)
+
+    def update(self, note: Note) -> None:
+        """Добавляет заметку или переиндексирует её после изменения."""
+        self.remove(note.id)
+        self._add(note)
+
+    def remove(self, note_id: str) -> None:
+        for word in self._doc_words.pop(note_id, ()):
+            notes = self._word_notes.get(word)
+            if notes is None:
+                continue
+            weight = notes.pop(note_id, None)
+            buckets = self._word_buckets[word]
+            if weight is not None:
+                buckets[weight].discard(note_id)
+                if not buckets[weight]:
+                    del buckets[weight]
+            if not notes:
+                del self._word_notes[word]
+                del self._word_buckets[word]
+                for gram in trigrams(word):
+                    words = self._gram_words.get(gram)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self._gram_words[gram]
+
+    def _add(self, note: Note) -> None:
+        weights: Dict[str, float] = {}
+        fields = [(note.title, TITLE_WEIGHT), (" ".join(note.tags), TAGS_WEIGHT)]
+        if self.include_bodies:
+            fields.append((note.body, BODY_WEIGHT))
+        for text, weight in fields:
+            for word in tokenize(text):
+                if weights.get(word, 0.0) < weight:
+                    weights[word] = weight
+        for word, weight in weights.items():
+            notes = self._word_notes.get(word)
+            if notes is None:
+                notes = self._word_notes[word] = {}
+                self._word_buckets[word] = {}
+                for gram in trigrams(word):
+                    self._gram_words.setdefault(gram, set()).add(word)
+            notes[note.id] = weight
+            self._word_buckets[word].setdefault(weight, set()).add(note.id)
+        self._doc_words[note.id] = tuple(weights)
+
+    # ———— Поиск —————
+
+    def similar_words(self, word: str) -> List[Tuple[str, float]]:
+        """Слова словаря, похожие на ``word``, по убыванию сходства."""
+        grams = trigrams(word)
+        counts: Counter = Counter()
+        for gram in grams:
+            words = self._gram_words.get(gram)
+            if words:
+                counts.update(words)
+        # Слова сильно другой длины не могут быть достаточно похожи — отсекаем сразу
+        slack = max(2, len(word) // 3)
+        candidates = []
+        for candidate, common in counts.items():
+            if abs(len(candidate) - len(word)) > slack:
+                continue
+            similarity = 2.0 * common / (len(grams) + len(trigrams(candidate)))
+            if similarity >= self.threshold:
+                candidates.append((candidate, similarity))
+        return heapq.nlargest(self.max_candidates, candidates, key=lambda item: item[1])
+
+    def search(self, query: str, limit: int | None = None) -> List[FuzzyMatch]:
+        """Заметки, похожие на запрос с учётом опечаток, по убыванию сходства."""
+        groups = [group for group in map(self.similar_words, dict.fromkeys(tokenize(query))) if group]
+        if not groups:
+            return []
+        buckets = [self._buckets(group) for group in groups]
+        postings = sum(len(note_ids) for group_buckets in buckets for _, _, note_ids in group_buckets)
+        if limit is None or len(groups) > MAX_LATTICE_WORDS or postings <= ACCUMULATE_MAX_POSTINGS:
+            return self._accumulate(buckets, limit)
+        return self._best_first(buckets, limit)
+
+    def _buckets(self, group: List[Tuple[str, float]]) -> List[Tuple[float, str, Set[str]]]:
+        """(вклад, слово, заметки) для одного слова запроса по убыванию вклада."""
+        return sorted(
+            ((similarity * weight, word, note_ids)
+             for word, similarity in group
+             for weight, note_ids in self._word_buckets[word].items()),
+            key=lambda bucket: bucket[0], reverse=True,
+        )
+
+    @staticmethod
+    def _accumulate(buckets, limit: int | None) -> List[FuzzyMatch]:
+        # Совпадений немного: считаем полный счёт каждой заметки
+        per_word = []
+        for group_buckets in buckets:
+            best: Dict[str, Tuple[float, str]] = {}
+            # По возрастанию вклада: лучшее совпадение перезаписывает худшие
+            for value, word, note_ids in reversed(group_buckets):
+                best.update(dict.fromkeys(note_ids, (value, word)))
+            per_word.append(best)
+        scores: Dict[str, float] = {}
+        for best in per_word:
+            for note_id, (value, _) in best.items():
+                scores[note_id] = scores.get(note_id, 0.0) + value
+        if limit is None:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [
+            FuzzyMatch(note_id, score, tuple(best[note_id][1] for best in per_word if note_id in best))
+            for note_id, score in ranked
+        ]
+
+    @staticmethod
+    def _best_first(buckets, limit: int) -> List[FuzzyMatch]:
+        """
+        Совпадений много: перебираем сочетания корзин (по одной на слово запроса
+        или «слово не совпало») в порядке убывания суммы вкладов. Заметка впервые
+        встречается в сочетании со своим настоящим счётом, более поздние вхождения
+        пропускаются. Пересечения корзин строятся на стороне C и кэшируются по
+        префиксу сочетания, поэтому пустое пересечение отсекает все продолжения.
+        """
+        def total(combo: Tuple[int, ...]) -> float:
+            return sum(group_buckets[i][0] for group_buckets, i in zip(buckets, combo) if i < len(group_buckets))
+
+        intersections: Dict[tuple, Set[str]] = {}
+
+        def members(key: tuple) -> Set[str]:
+            cached = intersections.get(key)
+            if cached is None:
+                g, i = key[-1]
+                note_ids = buckets[g][i][2]
+                if len(key) > 1:
+                    parent = members(key[:-1])
+                    note_ids = parent & note_ids if len(parent) <= len(note_ids) else note_ids & parent
+                cached = intersections[key] = note_ids
+            return cached
+
+        start = (0,) * len(buckets)
+        heap = [(-total(start), start)]
+        visited = {start}
+        emitted: Set[str] = set()
+        results: List[FuzzyMatch] = []
+        while heap and len(results) < limit:
+            neg_score, combo = heapq.heappop(heap)
+            key = tuple((g, i) for g, i in enumerate(combo) if i < len(buckets[g]))
+            if key:
+                words = tuple(buckets[g][i][1] for g, i in key)
+                for note_id in members(key):
+                    if note_id in emitted:
+                        continue
+                    emitted.add(note_id)
+                    results.append(FuzzyMatch(note_id, -neg_score, words))
+                    if len(results) >= limit:
+                        break
+            for g, i in enumerate(combo):
+                if i < len(buckets[g]):
+                    following = combo[:g] + (i + 1,) + combo[g + 1:]
+                    if following not in visited:
+                        visited.add(following)
+                        heapq.heappush(heap, (-total(following), following))
+        return results
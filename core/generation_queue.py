@@ -0,0 +1,209 @@
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+import traceback
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List
+
+# Приоритеты: меньше — раньше. Интерактивный запрос обгоняет пакетную генерацию.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Состояния задачи, передаются в on_progress
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+@dataclass(order=True)
+class GenerationJob:
+    priority: int
+    seq: int
+    job_id: str = field(compare=False)
+    query: str = field(compare=False)
+    state: str = field(default=QUEUED, compare=False)
+    stream: bool = field(default=False, compare=False)
+    # Дополнительные аргументы для generate/stream (например, force_refresh)
+    options: dict = field(default_factory=dict, compare=False)
+    # Уже полученный текст потоковой генерации (остаётся и при ошибке)
+    partial: str = field(default="", compare=False)
+
+
+class GenerationQueue:
+    """
+    Долгоживущий фоновый поток со своим event loop, который выполняет задачи
+    генерации заметок из очереди с приоритетами и ограничением параллелизма.
+
+    Колбэки вызываются из фонового потока; Qt-обёртка превращает их в сигналы.
+    """
+
+    def __init__(self, generate: Callable[[str], Awaitable[tuple[str, str]]],
+                 max_concurrency: int = 4,
+                 on_progress: Callable[[GenerationJob], None] | None = None,
+                 on_result: Callable[[GenerationJob, str, str], None] | None = None,
+                 on_error: Callable[[GenerationJob, str], None] | None = None,
+                 stream: Callable[[str], AsyncIterator[str]] | None = None,
+                 on_delta: Callable[[GenerationJob, str], None] | None = None):
+        """
+        :param generate: корутина query -> (title, body)
+        :param max_concurrency: сколько запросов к API может выполняться одновременно
+        :param on_progress: вызывается при каждой смене состояния задачи
+        :param on_result: вызывается с (job, title, body) после успешной генерации
+        :param on_error: вызывается с (job, traceback) при ошибке
+        :param stream: асинхронный генератор кусочков тела для потоковых задач
+        :param on_delta: вызывается с (job, text) на каждый кусочек потоковой задачи
+        """
+        self.generate = generate
+        self.stream = stream
+        self.on_delta = on_delta
+        self.max_concurrency = max(1, max_concurrency)
+        self.on_progress = on_progress
+        self.on_result = on_result
+        self.on_error = on_error
+
+        self._seq = itertools.count()
+        self._jobs: dict[str, GenerationJob] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._cancel_requested: set[str] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.PriorityQueue | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+
+    # ———— Жизненный цикл —————
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name="GenerationQueue", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        workers = [loop.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            for task in workers + list(self._tasks.values()):
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*workers, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def run_coroutine(self, coro) -> concurrent.futures.Future:
+        """Выполнить произвольную корутину в цикле очереди (например, закрытие клиента)."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ———— Постановка и отмена —————
+
+    @property
+    def pending(self) -> int:
+        """Сколько задач ещё не завершено (в очереди или выполняется)."""
+        return sum(1 for job in list(self._jobs.values()) if job.state in (QUEUED, RUNNING))
+
+    def submit(self, query: str, priority: int = PRIORITY_INTERACTIVE, stream: bool = False,
+               **options) -> str:
+        return self.submit_many([query], priority, stream, **options)[0]
+
+    def submit_many(self, queries: Iterable[str], priority: int = PRIORITY_BATCH,
+                    stream: bool = False, **options) -> List[str]:
+        self.start()
+        stream = stream and self.stream is not None
+        jobs = []
+        for query in queries:
+            seq = next(self._seq)
+            job = GenerationJob(priority=priority, seq=seq, job_id=str(seq), query=query, stream=stream,
+                                options=options)
+            self._jobs[job.job_id] = job
+            jobs.append(job)
+        self._loop.call_soon_threadsafe(self._enqueue, jobs)
+        return [job.job_id for job in jobs]
+
+    def _enqueue(self, jobs: List[GenerationJob]) -> None:
+        for job in jobs:
+            self._queue.put_nowait(job)
+            self._notify(job)
+
+    def cancel(self, job_id: str) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cancel, job_id)
+
+    def cancel_all(self) -> None:
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+
+    def _cancel(self, job_id: str) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        task = self._tasks.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+        elif job.state == QUEUED:
+            # Из PriorityQueue не удалить, поэтому воркер просто пропустит задачу
+            self._finish(job, CANCELLED)
+
+    # ———— Выполнение —————
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.state != QUEUED:
+                    continue
+                job.state = RUNNING
+                self._notify(job)
+                if job.stream:
+                    task = asyncio.ensure_future(self._consume_stream(job))
+                else:
+                    task = asyncio.ensure_future(self.generate(job.query, **job.options))
+                self._tasks[job.job_id] = task
+                try:
+                    title, body = await task
+                except asyncio.CancelledError:
+                    # Отмена самого воркера (остановка цикла) пробрасывается дальше
+                    if job.job_id not in self._cancel_requested:
+                        raise
+                    self._finish(job, CANCELLED)
+                except Exception:
+                    self._finish(job, FAILED)
+                    if self.on_error:
+                        self.on_error(job, traceback.format_exc())
+                else:
+                    self._finish(job, DONE)
+                    if self.on_result:
+                        self.on_result(job, title, body)
+                finally:
+                    self._tasks.pop(job.job_id, None)
+                    self._cancel_requested.discard(job.job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _consume_stream(self, job: GenerationJob) -> tuple[str, str]:
+        async for delta in self.stream(job.query, **job.options):
+            job.partial += delta
+            if self.on_delta:
+                self.on_delta(job, delta)
+        return job.query.strip(), job.partial.strip()
+
+    def _finish(self, job: GenerationJob, state: str) -> None:
+        job.state = state
+        self._jobs.pop(job.job_id, None)
+        self._notify(job)
+
+    def _notify(self, job: GenerationJob) -> None:
+        if self.on_progress:
+            self.on_progress(job)
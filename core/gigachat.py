@@ -1,58 +1,354 @@
+import asyncio
+import json
+import random
+import time
+from typing import AsyncIterator
 import httpx
-from config import creds, client_secret
+from config import (
+    creds, client_secret, gigachat_http2, gigachat_max_attempts, gigachat_max_concurrency, gigachat_rate_limit
+)
+from core.metrics import metrics
+from core.request_scheduler import (
+    RETRY_STATUSES, AdaptiveRateLimiter, RetryPolicy, SingleFlight, parse_retry_after
+)
 
 API_OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
 API_CHAT_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
 
-async def generate_note_with_gigachat(query: str) -> tuple[str, str]:
+# Сетевые сбои, после которых запрос повторяется (ответа от сервера не было или он оборвался)
+RETRY_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+DEFAULT_MODEL = "GigaChat"
+DEFAULT_SCOPE = "GIGACHAT_API_PERS"
+
+PROMPT_TEMPLATE = (
+    "Ты эксперт в области IT-технологий и программирования. "
+    "Дай кратко и по делу ответ, что это такое, где применяется и тд в формате Markdown на запрос: «{query}»"
+)
+
+
+def build_prompt(query: str) -> str:
+    return PROMPT_TEMPLATE.format(query=query)
+
+
+class GigaChatClient:
     """
-    Генерирует развернутый Markdown-ответ по запросу через GigaChat.
-    Возвращает (title, body), где title == query, body == Markdown-текст.
+    Долгоживущий клиент GigaChat.
+
+    - держит один пул соединений httpx (keep-alive, по желанию HTTP/2);
+    - кэширует access_token до момента незадолго до ``expires_at``
+      и обновляет его заранее в фоне;
+    - параллельные вызовы ждут одно и то же обновление токена;
+    - повторяет запросы при 429/5xx и сетевых сбоях (``retry``) с учётом Retry-After,
+      а ``limiter`` сбавляет скорость запросов после 429;
+    - одинаковые одновременные запросы заметки уходят в API один раз.
+
+    Пул соединений привязан к event loop, поэтому при вызове из другого
+    цикла он пересоздаётся (токен при этом переиспользуется).
     """
-    if not creds or not client_secret:
-        raise RuntimeError(
-            "Не заданы параметры в config.py: creds и client_secret обязательны."
-        )
-
-    # Промпт
-    user_prompt = (
-        "Ты эксперт в области IT-технологий и программирования. "
-        f"Дай кратко и по делу ответ, что это такое, где применяется и тд в формате Markdown на запрос: «{query}»"
-    )
-
-    # 1) Получаем OAuth-токен
-    payload = 'scope=GIGACHAT_API_PERS'
-    oauth_headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'Accept': 'application/json',
-        'RqUID': client_secret,
-        'Authorization': f'Basic {creds}',
-    }
-    async with httpx.AsyncClient(verify=False) as client:
-        auth = await client.post(API_OAUTH_URL, headers=oauth_headers, data=payload, timeout=30.0)
+
+    def __init__(self, credentials: str | None = None, rq_uid: str | None = None,
+                 scope: str = DEFAULT_SCOPE, model: str = DEFAULT_MODEL,
+                 oauth_url: str = API_OAUTH_URL, chat_url: str = API_CHAT_URL,
+                 http2: bool = False, verify: bool = False, refresh_margin: float = 60.0,
+                 retry: RetryPolicy | None = None, limiter: AdaptiveRateLimiter | None = None):
+        """
+        :param credentials: ключ авторизации (Basic), по умолчанию ``config.creds``
+        :param rq_uid: значение заголовка RqUID, по умолчанию ``config.client_secret``
+        :param refresh_margin: за сколько секунд до истечения токена его обновлять
+        :param retry: политика повторов, по умолчанию ``RetryPolicy()``
+        :param limiter: ограничитель скорости запросов к chat/completions; None — без ограничения
+        """
+        self.credentials = credentials if credentials is not None else creds
+        self.rq_uid = rq_uid if rq_uid is not None else client_secret
+        self.scope = scope
+        self.model = model
+        self.oauth_url = oauth_url
+        self.chat_url = chat_url
+        self.http2 = http2
+        self.verify = verify
+        self.refresh_margin = refresh_margin
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.limiter = limiter
+        self._inflight = SingleFlight("gigachat")
+        self._rng = random.Random()
+
+        self._token: str | None = None
+        self._expires_at = 0.0  # time.time(), в секундах
+        self._http: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._proactive_task: asyncio.Task | None = None
+
+    def _check_config(self) -> None:
+        if not self.credentials or not self.rq_uid:
+            raise RuntimeError(
+                "Не заданы параметры в config.py: creds и client_secret обязательны."
+            )
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop or self._http.is_closed:
+            # Задачи прошлого цикла больше не исполнятся — забываем их
+            self._refresh_task = None
+            self._proactive_task = None
+            self._loop = loop
+            self._http = httpx.AsyncClient(
+                verify=self.verify,
+                http2=self.http2,
+                limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=120.0),
+            )
+        return self._http
+
+    # ———— Токен —————
+
+    @property
+    def token_valid(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    async def get_token(self) -> str:
+        """Вернуть действующий токен, при необходимости дождавшись единственного обновления."""
+        if self.token_valid:
+            return self._token
+        self._client()
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_token())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _refresh_token(self) -> str:
+        self._check_config()
+        oauth_headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            'RqUID': self.rq_uid,
+            'Authorization': f'Basic {self.credentials}',
+        }
+        with metrics.span("gigachat.oauth") as span:
+            auth = await self._client().post(
+                self.oauth_url, headers=oauth_headers, data=f'scope={self.scope}', timeout=30.0
+            )
+            span.args["status"] = auth.status_code
         auth.raise_for_status()
-        token = auth.json().get('access_token')
+        data = auth.json()
+        token = data.get('access_token')
         if not token:
             raise RuntimeError("GigaChat: не удалось получить access_token")
 
-        # 2) Запрашиваем генерацию текста
-        chat_headers = {
+        expires_at = float(data.get('expires_at') or 0)
+        if expires_at > 1e12:
+            # API отдаёт время истечения в миллисекундах
+            expires_at /= 1000.0
+        if expires_at <= time.time():
+            # Без срока действия считаем токен живущим стандартные 30 минут
+            expires_at = time.time() + 30 * 60
+        self._token = token
+        self._expires_at = expires_at
+        self._schedule_proactive_refresh()
+        return token
+
+    def _schedule_proactive_refresh(self) -> None:
+        if self._proactive_task is not None and not self._proactive_task.done():
+            self._proactive_task.cancel()
+        self._proactive_task = asyncio.ensure_future(self._refresh_before_expiry())
+
+    async def _refresh_before_expiry(self) -> None:
+        delay = self._expires_at - self.refresh_margin - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._proactive_task = None
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_token())
+        try:
+            await asyncio.shield(self._refresh_task)
+        except Exception:
+            # Ошибку увидит следующий реальный запрос
+            pass
+
+    # ———— Запросы —————
+
+    def _chat_headers(self, token: str) -> dict:
+        return {
             'Content-Type': 'application/json',
             'Accept': 'application/json',
-            'RqUID': client_secret,
+            'RqUID': self.rq_uid,
             'Authorization': f'Bearer {token}',
         }
-        payload_json = {
-            "model": "GigaChat",
-            "messages": [{"role": "user", "content": user_prompt}]
-        }
-        resp = await client.post(API_CHAT_URL, headers=chat_headers, json=payload_json, timeout=60.0)
-        resp.raise_for_status()
-        data = resp.json()
 
-    # Берём весь ответ как Markdown
-    content = data.get('choices', [])[0].get('message', {}).get('content', '')
-    title = query.strip()
-    body = content.strip()
+    async def _before_attempt(self) -> str:
+        """Дождаться очереди у ограничителя скорости и вернуть действующий токен."""
+        if self.limiter is not None:
+            waited = await self.limiter.acquire()
+            if waited:
+                metrics.observe("gigachat.throttle_wait", waited * 1000, "ms")
+        return await self.get_token()
+
+    def _retry_delay(self, attempt: int, status: int | None = None, retry_after: float | None = None) -> float | None:
+        """Пауза перед следующей попыткой или None, если повторять больше не нужно."""
+        if status == 429:
+            metrics.count("gigachat.throttled")
+            if self.limiter is not None:
+                self.limiter.on_throttled(retry_after)
+        if not self.retry.should_retry(attempt, retry_after):
+            metrics.count("gigachat.gave_up")
+            metrics.observe("gigachat.attempts", attempt + 1)
+            return None
+        delay = self.retry.delay(attempt, retry_after, self._rng)
+        metrics.count("gigachat.retry")
+        metrics.observe("gigachat.backoff", delay * 1000, "ms")
+        return delay
+
+    def _on_success(self, attempt: int) -> None:
+        if self.limiter is not None:
+            self.limiter.on_success()
+        metrics.observe("gigachat.attempts", attempt + 1)
+
+    async def chat(self, messages: list[dict], timeout: float = 60.0) -> dict:
+        """
+        Запрос chat/completions. При 401 токен обновляется и запрос повторяется сразу,
+        429/5xx и сетевые сбои — по политике ``retry`` (каждая попытка — отдельный
+        замер ``gigachat.chat`` с номером попытки и статусом).
+        """
+        client = self._client()
+        payload_json = {"model": self.model, "messages": messages}
+        attempt = 0
+        refreshed = False
+        while True:
+            token = await self._before_attempt()
+            try:
+                with metrics.span("gigachat.chat", attempt=attempt) as span:
+                    resp = await client.post(self.chat_url, headers=self._chat_headers(token), json=payload_json,
+                                             timeout=timeout)
+                    span.args["status"] = resp.status_code
+            except RETRY_ERRORS:
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                if resp.status_code == 401 and not refreshed:
+                    self._token = None
+                    refreshed = True
+                    continue
+                if resp.status_code not in RETRY_STATUSES:
+                    resp.raise_for_status()
+                    self._on_success(attempt)
+                    return resp.json()
+                delay = self._retry_delay(attempt, resp.status_code, parse_retry_after(resp.headers.get("Retry-After")))
+                if delay is None:
+                    resp.raise_for_status()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream_chat(self, messages: list[dict], timeout: float = 60.0) -> AsyncIterator[str]:
+        """
+        Потоковый chat/completions (``stream: true``): отдаёт кусочки текста
+        по мере прихода server-sent events. Повторы — как в ``chat``, но только
+        до первого кусочка: начатый ответ не повторяется, чтобы текст не задвоился.
+        """
+        client = self._client()
+        payload_json = {"model": self.model, "messages": messages, "stream": True}
+        attempt = 0
+        refreshed = False
+        received = False
+        while True:
+            token = await self._before_attempt()
+            headers = self._chat_headers(token)
+            headers['Accept'] = 'text/event-stream'
+            started = time.perf_counter()
+            try:
+                with metrics.span("gigachat.stream", attempt=attempt) as span:
+                    async with client.stream('POST', self.chat_url, headers=headers, json=payload_json,
+                                             timeout=timeout) as resp:
+                        span.args["status"] = resp.status_code
+                        if resp.status_code == 401 and not refreshed:
+                            self._token = None
+                            refreshed = True
+                            continue
+                        if resp.status_code in RETRY_STATUSES:
+                            delay = self._retry_delay(attempt, resp.status_code,
+                                                      parse_retry_after(resp.headers.get("Retry-After")))
+                            if delay is None:
+                                resp.raise_for_status()
+                        else:
+                            resp.raise_for_status()
+                            self._on_success(attempt)
+                            async for line in resp.aiter_lines():
+                                if not line.startswith('data:'):
+                                    continue
+                                data = line[len('data:'):].strip()
+                                if data == '[DONE]':
+                                    return
+                                chunk = json.loads(data)
+                                for choice in chunk.get('choices', []):
+                                    content = choice.get('delta', {}).get('content')
+                                    if content:
+                                        if not received:
+                                            # Время до первого кусочка текста — то, что видит пользователь
+                                            metrics.observe("gigachat.first_chunk",
+                                                            (time.perf_counter() - started) * 1000, "ms")
+                                            received = True
+                                        yield content
+                            return
+            except RETRY_ERRORS:
+                if received:
+                    raise
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream_note(self, query: str) -> AsyncIterator[str]:
+        """
+        Markdown-тело заметки по запросу, кусочками по мере генерации.
+        Тот же запрос, уже идущий в API, не повторяется: подписчик получает его текст.
+        """
+        self._check_config()
+        messages = [{"role": "user", "content": build_prompt(query)}]
+        async for delta in self._inflight.stream(("stream", self.model, messages[0]["content"]),
+                                                 lambda: self.stream_chat(messages)):
+            yield delta
+
+    async def generate_note(self, query: str) -> tuple[str, str]:
+        self._check_config()
+        messages = [{"role": "user", "content": build_prompt(query)}]
+        data = await self._inflight.run(("chat", self.model, messages[0]["content"]), lambda: self.chat(messages))
+        # Берём весь ответ как Markdown
+        content = data.get('choices', [])[0].get('message', {}).get('content', '')
+        return query.strip(), content.strip()
+
+    async def aclose(self) -> None:
+        for task in (self._proactive_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+
+_default_client: GigaChatClient | None = None
+
+
+def get_default_client() -> GigaChatClient:
+    """Общий для приложения клиент с настройками из config.py."""
+    global _default_client
+    if _default_client is None:
+        limiter = None
+        if gigachat_rate_limit > 0:
+            limiter = AdaptiveRateLimiter(gigachat_rate_limit, burst=gigachat_max_concurrency)
+        _default_client = GigaChatClient(http2=gigachat_http2, retry=RetryPolicy(max_attempts=gigachat_max_attempts),
+                                         limiter=limiter)
+    return _default_client
+
+
+async def generate_note_with_gigachat(query: str) -> tuple[str, str]:
+    """
+    Генерирует развернутый Markdown-ответ по запросу через GigaChat.
+    Возвращает (title, body), где title == query, body == Markdown-текст.
+    """
+    return await get_default_client().generate_note(query)
+
 
-    return title, body
+async def stream_note_with_gigachat(query: str) -> AsyncIterator[str]:
+    """Потоковый вариант generate_note_with_gigachat: асинхронный генератор кусочков тела заметки."""
+    async for delta in get_default_client().stream_note(query):
+        yield delta
@@ -0,0 +1,452 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Dict, List, Tuple
+from core.metrics import metrics
+from core.models import Note
+
+# Каждая KEYFRAME_INTERVAL-я версия заметки хранится целиком, остальные — дельтой
+# к предыдущей: восстановление любой версии — не больше стольких применений дельт
+KEYFRAME_INTERVAL = 16
+# Правки, записанные в пределах этого окна (с начала версии), сливаются в одну версию
+COALESCE_SECONDS = 60
+# Несохранённая в историю правка записывается не позже чем через столько секунд
+MAX_PENDING_SECONDS = 10
+# Не больше стольких версий на заметку: лишние старые группы удаляются
+MAX_REVISIONS_PER_NOTE = 256
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# При превышении бюджета история урезается до этой доли — чтобы не чистить на каждой записи
+PRUNE_TARGET = 0.8
+
+# Причины версий. Сливаются между собой только обычные правки
+REASON_BASELINE = "baseline"
+REASON_EDIT = "edit"
+REASON_RENAME = "rename"
+REASON_DELETE = "delete"
+REASON_RESTORE = "restore"
+# Версия, пришедшая с диска от другого процесса
+REASON_EXTERNAL = "external"
+
+# Текст режется на куски по концам строк и предложений: правка внутри абзаца
+# стоит в дельте одного предложения, а не всего абзаца
+_CHUNK_RE = re.compile(r"(?<=\n)|(?<=[.!?] )")
+_MAX_REV = 2 ** 62
+
+
+@dataclass
+class Revision:
+    """Версия заметки без тела (для списка версий)."""
+    note_id: str
+    rev: int
+    reason: str
+    title: str
+    tags: List[str]
+    created_at: float
+    updated_at: float
+    # Длина тела в символах и размер записи на диске в байтах
+    size: int
+    stored_bytes: int
+    keyframe: bool
+
+
+@dataclass
+class _Head:
+    """Последняя записанная версия заметки."""
+    note_id: str
+    rev: int
+    # Номер опорного кадра, от которого считаются дельты
+    keyframe_rev: int
+    reason: str
+    created_at: float
+    title: str
+    tags: Tuple[str, ...]
+    body: str
+
+
+def _chunks(text: str) -> List[str]:
+    return [chunk for chunk in _CHUNK_RE.split(text) if chunk]
+
+
+def make_delta(base: str, text: str) -> list:
+    """
+    Дельта ``base`` → ``text`` по кускам текста: ``[i, j]`` — взять куски
+    ``base[i:j]``, строка — вставить как есть.
+    """
+    a, b = _chunks(base), _chunks(text)
+    # Обычно правят одно место: общие начало и конец отрезаются до SequenceMatcher
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    ops: list = []
+
+    def copy(i: int, j: int):
+        if i == j:
+            return
+        if ops and isinstance(ops[-1], list) and ops[-1][1] == i:
+            ops[-1][1] = j
+        else:
+            ops.append([i, j])
+
+    def insert(chunks: List[str]):
+        if not chunks:
+            return
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += "".join(chunks)
+        else:
+            ops.append("".join(chunks))
+
+    copy(0, start)
+    matcher = SequenceMatcher(None, a[start:end_a], b[start:end_b], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            copy(start + i1, start + i2)
+        else:
+            insert(b[start + j1:start + j2])
+    copy(end_a, len(a))
+    return ops
+
+
+def apply_delta(base: str, delta: list) -> str:
+    chunks = _chunks(base)
+    parts = []
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(chunks[op[0]:op[1]])
+    return "".join(parts)
+
+
+def _encode(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def _decode(data: bytes):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class RevisionHistory:
+    """
+    Персистентная история версий заметок на SQLite.
+
+    Версия — заголовок, теги и тело заметки в какой-то момент. Тела хранятся
+    как опорные кадры (целиком, zlib) раз в :data:`KEYFRAME_INTERVAL` версий
+    и дельты к предыдущей версии между ними, поэтому история занимает малую
+    долю корпуса, а восстановление версии — распаковка кадра и до 15 дельт.
+
+    ``record`` на каждое нажатие клавиши только запоминает состояние в памяти;
+    на диск версия попадает при ``flush`` (после паузы в наборе), причём правки
+    в пределах :data:`COALESCE_SECONDS` сливаются в одну версию. Удаление
+    заметки тоже записывается версией — удалённую заметку можно восстановить.
+    При превышении ``max_bytes`` удаляются самые старые группы «кадр + дельты».
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 coalesce_seconds: float = COALESCE_SECONDS):
+        """
+        :param path: путь к файлу базы (создаётся при необходимости)
+        :param max_bytes: бюджет на суммарный размер записей истории
+        :param coalesce_seconds: окно слияния правок в одну версию
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.coalesce_seconds = coalesce_seconds
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS revisions ("
+            " note_id TEXT NOT NULL,"
+            " rev INTEGER NOT NULL,"
+            " reason TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " tags TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " keyframe INTEGER NOT NULL,"
+            " data BLOB NOT NULL,"
+            " PRIMARY KEY (note_id, rev)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        # Заметки, у которых уже есть история
+        self._known = {row[0] for row in self._conn.execute("SELECT DISTINCT note_id FROM revisions")}
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM revisions").fetchone()[0]
+        # note_id -> последняя записанная версия: чтобы не читать её с диска на каждую запись
+        self._heads: Dict[str, _Head] = {}
+        # note_id -> (заголовок, тело, теги) до первой правки — для заметок без истории
+        self._baselines: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+        # note_id -> (заголовок, тело, теги, причина, время первой правки, время последней)
+        self._pending: Dict[str, tuple] = {}
+
+    # ———— Запись —————
+
+    def track(self, note: Note) -> None:
+        """
+        Запомнить состояние заметки, открытой для правки. Если истории у неё
+        ещё нет, это состояние станет первой версией при первой правке.
+        """
+        with self._lock:
+            if note.id not in self._known and note.id not in self._pending:
+                self._baselines[note.id] = (note.title, note.body, note.tags)
+
+    def record(self, note: Note, reason: str = REASON_EDIT) -> None:
+        """
+        Новая версия заметки. Обычные правки копятся в памяти до ``flush``,
+        остальные причины (переименование, удаление, восстановление, версия с диска)
+        пишутся сразу.
+        """
+        now = time.time()
+        with self._lock:
+            pending = self._pending.get(note.id)
+            if pending is not None and (reason != REASON_EDIT or now - pending[4] > MAX_PENDING_SECONDS):
+                self._flush_one(note.id)
+                pending = None
+            first = pending[4] if pending is not None else now
+            self._pending[note.id] = (note.title, note.body, note.tags, reason, first, now)
+            if reason != REASON_EDIT:
+                self._flush_one(note.id)
+                self._conn.commit()
+
+    def flush(self) -> None:
+        """Записать накопленные правки."""
+        with self._lock:
+            if not self._pending:
+                return
+            with metrics.span("history.flush", notes=len(self._pending)):
+                for note_id in list(self._pending):
+                    self._flush_one(note_id)
+                self._conn.commit()
+            if self._total_bytes > self.max_bytes:
+                self.prune()
+
+    def _flush_one(self, note_id: str) -> None:
+        title, body, tags, reason, first, now = self._pending.pop(note_id)
+        baseline = self._baselines.pop(note_id, None)
+        if note_id not in self._known and baseline is not None:
+            self._insert(note_id, REASON_BASELINE, *baseline, first, first)
+        head = self._head(note_id)
+        if head is not None and reason == REASON_EDIT:
+            if (head.body, head.title, head.tags) == (body, title, tuple(tags)):
+                return
+            # Правки подряд в пределах окна — та же версия, только новее
+            if head.reason == REASON_EDIT and now - head.created_at < self.coalesce_seconds:
+                self._replace_head(head, title, body, tags, now)
+                return
+        self._insert(note_id, reason, title, body, tags, now, now)
+
+    def _head(self, note_id: str) -> "_Head | None":
+        head = self._heads.get(note_id)
+        if head is None and note_id in self._known:
+            row = self._conn.execute(
+                "SELECT rev, reason, title, tags, created_at FROM revisions WHERE note_id = ?"
+                " ORDER BY rev DESC LIMIT 1", (note_id,)).fetchone()
+            if row is None:
+                self._known.discard(note_id)
+                return None
+            rev, reason, title, tags, created_at = row
+            keyframe_rev = self._conn.execute(
+                "SELECT MAX(rev) FROM revisions WHERE note_id = ? AND keyframe = 1", (note_id,)).fetchone()[0]
+            head = self._heads[note_id] = _Head(note_id, rev, keyframe_rev, reason, created_at, title,
+                                                tuple(json.loads(tags)), self.body_at(note_id, rev))
+        return head
+
+    def _encode_body(self, body: str, base: str | None, since_keyframe: int) -> Tuple[bytes, bool]:
+        """(данные, опорный ли кадр): дельта к ``base``, если она заметно меньше кадра."""
+        keyframe = _encode(body)
+        if base is None or since_keyframe >= KEYFRAME_INTERVAL - 1:
+            return keyframe, True
+        delta = _encode(make_delta(base, body))
+        if len(delta) * 2 > len(keyframe):
+            return keyframe, True
+        return delta, False
+
+    def _insert(self, note_id: str, reason: str, title: str, body: str, tags, created_at: float,
+                updated_at: float) -> None:
+        head = self._head(note_id)
+        if head is None:
+            rev, data, keyframe = 1, _encode(body), True
+        else:
+            rev = head.rev + 1
+            data, keyframe = self._encode_body(body, head.body, head.rev - head.keyframe_rev)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO revisions"
+            " (note_id, rev, reason, title, tags, created_at, updated_at, size, keyframe, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (note_id, rev, reason, title, json.dumps(list(tags), ensure_ascii=False), created_at, updated_at,
+             len(body), int(keyframe), data),
+        )
+        self._total_bytes += len(data)
+        self._known.add(note_id)
+        self._heads[note_id] = _Head(note_id, rev, rev if keyframe else head.keyframe_rev, reason, created_at,
+                                     title, tuple(tags), body)
+        metrics.observe("history.revision_bytes", len(data), "B")
+        if keyframe and head is not None:
+            first = self._conn.execute("SELECT MIN(rev) FROM revisions WHERE note_id = ?", (note_id,)).fetchone()[0]
+            if rev - first >= MAX_REVISIONS_PER_NOTE:
+                self._drop_oldest_group(note_id)
+
+    def _replace_head(self, head: "_Head", title: str, body: str, tags, updated_at: float) -> None:
+        note_id, rev = head.note_id, head.rev
+        old_size = self._conn.execute(
+            "SELECT LENGTH(data) FROM revisions WHERE note_id = ? AND rev = ?", (note_id, rev)).fetchone()[0]
+        if rev == head.keyframe_rev:
+            data, keyframe = _encode(body), True
+        else:
+            # Дельта пересчитывается от предыдущей версии — она не менялась
+            data, keyframe = self._encode_body(body, self.body_at(note_id, rev - 1),
+                                               rev - 1 - head.keyframe_rev)
+        self._conn.execute(
+            "UPDATE revisions SET title = ?, tags = ?, updated_at = ?, size = ?, keyframe = ?, data = ?"
+            " WHERE note_id = ? AND rev = ?",
+            (title, json.dumps(list(tags), ensure_ascii=False), updated_at, len(body), int(keyframe), data,
+             note_id, rev),
+        )
+        self._total_bytes += len(data) - old_size
+        head.title, head.tags, head.body = title, tuple(tags), body
+        if keyframe:
+            head.keyframe_rev = rev
+
+    # ———— Чтение —————
+
+    def has_history(self, note_id: str) -> bool:
+        with self._lock:
+            return note_id in self._known or note_id in self._pending
+
+    def revisions(self, note_id: str) -> List[Revision]:
+        """Версии заметки, новые — первыми (с учётом ещё не записанных правок)."""
+        with self._lock:
+            if note_id in self._pending:
+                self.flush()
+            rows = self._conn.execute(
+                "SELECT rev, reason, title, tags, created_at, updated_at, size, LENGTH(data), keyframe"
+                " FROM revisions WHERE note_id = ? ORDER BY rev DESC", (note_id,)).fetchall()
+        return [Revision(note_id, rev, reason, title, json.loads(tags), created, updated, size, stored,
+                         bool(keyframe))
+                for rev, reason, title, tags, created, updated, size, stored, keyframe in rows]
+
+    def body_at(self, note_id: str, rev: int) -> str:
+        """Тело заметки в версии ``rev``: опорный кадр и дельты после него."""
+        with self._lock, metrics.span("history.reconstruct"):
+            rows = self._conn.execute(
+                "SELECT keyframe, data FROM revisions WHERE note_id = ? AND rev <= ?"
+                " AND rev >= (SELECT MAX(rev) FROM revisions WHERE note_id = ? AND rev <= ? AND keyframe = 1)"
+                " ORDER BY rev", (note_id, rev, note_id, rev)).fetchall()
+        if not rows:
+            raise KeyError(f"{note_id}@{rev}")
+        body = ""
+        for keyframe, data in rows:
+            value = _decode(data)
+            body = value if keyframe else apply_delta(body, value)
+        return body
+
+    def note_at(self, note_id: str, rev: int) -> Note:
+        """Заметка (с тем же id) в состоянии версии ``rev``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, tags FROM revisions WHERE note_id = ? AND rev = ?", (note_id, rev)).fetchone()
+            if row is None:
+                raise KeyError(f"{note_id}@{rev}")
+            return Note(title=row[0], body=self.body_at(note_id, rev), tags=json.loads(row[1]), id=note_id)
+
+    def deleted_notes(self) -> List[Revision]:
+        """Удалённые заметки (их последняя версия — удаление), недавние — первыми."""
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT r.note_id, r.rev, r.title, r.tags, r.created_at, r.size, LENGTH(r.data), r.keyframe"
+                " FROM revisions r WHERE r.reason = ?"
+                " AND r.rev = (SELECT MAX(rev) FROM revisions WHERE note_id = r.note_id)"
+                " ORDER BY r.created_at DESC", (REASON_DELETE,)).fetchall()
+        return [Revision(note_id, rev, REASON_DELETE, title, json.loads(tags), created, created, size, stored,
+                         bool(keyframe))
+                for note_id, rev, title, tags, created, size, stored, keyframe in rows]
+
+    # ———— Очистка —————
+
+    def _drop_oldest_group(self, note_id: str) -> None:
+        """Удаляет самый старый опорный кадр заметки вместе с его дельтами."""
+        keys = [row[0] for row in self._conn.execute(
+            "SELECT rev FROM revisions WHERE note_id = ? AND keyframe = 1 ORDER BY rev LIMIT 2", (note_id,))]
+        if len(keys) < 2:
+            return
+        self._delete_range(note_id, keys[0], keys[1])
+
+    def _delete_range(self, note_id: str, start: int, end: int) -> None:
+        freed = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM revisions WHERE note_id = ? AND rev >= ? AND rev < ?",
+            (note_id, start, end)).fetchone()[0]
+        self._conn.execute("DELETE FROM revisions WHERE note_id = ? AND rev >= ? AND rev < ?",
+                           (note_id, start, end))
+        self._total_bytes -= freed
+
+    def prune(self) -> int:
+        """
+        Урезает историю до доли :data:`PRUNE_TARGET` от бюджета, удаляя самые
+        старые группы «кадр + дельты». Последняя группа заметки удаляется,
+        только если старших групп ни у кого не осталось. Возвращает число
+        освобождённых байт.
+        """
+        with self._lock, metrics.span("history.prune"):
+            target = self.max_bytes * PRUNE_TARGET
+            before = self._total_bytes
+            # Группы: (note_id, первый rev, конец (не включая), время последней правки, байты)
+            groups: List[list] = []
+            current = None
+            for note_id, rev, keyframe, updated_at, stored in self._conn.execute(
+                    "SELECT note_id, rev, keyframe, updated_at, LENGTH(data) FROM revisions ORDER BY note_id, rev"):
+                if current is None or current[0] != note_id or keyframe:
+                    if current is not None and current[0] == note_id:
+                        current[2] = rev
+                    current = [note_id, rev, None, updated_at, 0]
+                    groups.append(current)
+                current[3] = updated_at
+                current[4] += stored
+            latest = {}
+            for group in groups:
+                latest[group[0]] = group
+            older = sorted((group for group in groups if latest[group[0]] is not group), key=lambda g: g[3])
+            newest = sorted(latest.values(), key=lambda g: g[3])
+            for note_id, start, end, _, _ in older + newest:
+                if self._total_bytes <= target:
+                    break
+                self._delete_range(note_id, start, end if end is not None else _MAX_REV)
+                if end is None:
+                    self._known.discard(note_id)
+                    self._heads.pop(note_id, None)
+            self._conn.commit()
+            freed = before - self._total_bytes
+        metrics.count("history.pruned_bytes", freed)
+        return freed
+
+    # ———— Служебное —————
+
+    def stats(self) -> dict:
+        with self._lock:
+            notes, revisions, keyframes = self._conn.execute(
+                "SELECT COUNT(DISTINCT note_id), COUNT(*), COALESCE(SUM(keyframe), 0) FROM revisions").fetchone()
+        return {"notes": notes, "revisions": revisions, "keyframes": keyframes, "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
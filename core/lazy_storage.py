@@ -0,0 +1,308 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+from core.models import LazyNote, Note
+from core.metrics import metrics
+from core.storage import (
+    ExternalChanges, NoteStorage, atomic_write, DEFAULT_COMMIT_LATENCY, DEFAULT_COMPACT_THRESHOLD
+)
+
+# Сколько байт тел заметок держать в памяти по умолчанию
+DEFAULT_BODY_BUDGET = 64 * 1024 * 1024
+# Файл тел переписывается при загрузке, если мёртвых данных в нём больше живых
+# в столько раз (и больше GARBAGE_MIN_BYTES)
+GARBAGE_RATIO = 2
+GARBAGE_MIN_BYTES = 1024 * 1024
+
+
+class BodyStore:
+    """
+    Файл тел заметок: тела дописываются в конец (UTF-8 подряд, без разделителей),
+    а читаются через mmap по смещению и длине из индекса.
+
+    Прочитанные тела учитываются в LRU; когда их суммарный размер превышает
+    ``budget``, самые давно открытые выгружаются из заметок. Тела с ещё
+    не записанными правками не выгружаются.
+    """
+
+    def __init__(self, path: str, budget: int = DEFAULT_BODY_BUDGET):
+        self.path = path
+        self.budget = budget
+        self._lock = threading.RLock()
+        self._refs: Dict[str, tuple[int, int]] = {}
+        self._file = None
+        self._map: mmap.mmap | None = None
+        self._loaded: OrderedDict[str, tuple[LazyNote, int]] = OrderedDict()
+        self._loaded_bytes = 0
+        # id -> номер последней правки, которая ещё не попала на диск
+        self._dirty: Dict[str, int] = {}
+        self._version = 0
+
+    # ———— Ссылки на тела —————
+
+    def ref(self, note_id: str) -> tuple[int, int]:
+        with self._lock:
+            return self._refs.get(note_id, (0, 0))
+
+    def set_ref(self, note_id: str, offset: int, length: int) -> None:
+        with self._lock:
+            self._refs[note_id] = (offset, length)
+
+    def forget(self, note_id: str) -> None:
+        with self._lock:
+            self._refs.pop(note_id, None)
+            self._dirty.pop(note_id, None)
+            entry = self._loaded.pop(note_id, None)
+            if entry is not None:
+                self._loaded_bytes -= entry[1]
+
+    @property
+    def live_bytes(self) -> int:
+        with self._lock:
+            return sum(length for _, length in self._refs.values())
+
+    @property
+    def loaded_bytes(self) -> int:
+        return self._loaded_bytes
+
+    # ———— Чтение —————
+
+    def _mapped(self, end: int) -> mmap.mmap:
+        # Файл растёт дописыванием — переоткрываем отображение, если оно короче нужного
+        if self._map is None or len(self._map) < end:
+            self._close_map()
+            self._file = open(self.path, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _close_map(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self, note_id: str) -> str:
+        with self._lock:
+            offset, length = self._refs.get(note_id, (0, 0))
+            if length == 0:
+                return ""
+            return self._mapped(offset + length)[offset:offset + length].decode('utf-8')
+
+    def load_body(self, note: LazyNote) -> str:
+        """Колбэк LazyNote: прочитать тело, отдать его заметке и учесть в бюджете памяти."""
+        with self._lock, metrics.span("storage.load_body"):
+            if note._body is not None:
+                # Другой поток успел прочитать тело, пока мы ждали замок
+                return note._body
+            body = self.read(note.id)
+            note._body = body
+            self._account(note, len(body))
+            return body
+
+    def body_changed(self, note: LazyNote, body: str) -> None:
+        """Колбэк LazyNote: тело изменено в памяти и до записи не должно выгружаться."""
+        with self._lock:
+            note._body = body
+            self._version += 1
+            self._dirty[note.id] = self._version
+            self._account(note, len(body))
+
+    def dirty_version(self, note_id: str) -> int | None:
+        with self._lock:
+            return self._dirty.get(note_id)
+
+    def mark_committed(self, note_id: str, version: int | None) -> None:
+        with self._lock:
+            # Более поздняя правка, пришедшая во время записи, остаётся «грязной»
+            if version is not None and self._dirty.get(note_id) == version:
+                del self._dirty[note_id]
+
+    def _account(self, note: LazyNote, size: int) -> None:
+        previous = self._loaded.pop(note.id, None)
+        if previous is not None:
+            self._loaded_bytes -= previous[1]
+        self._loaded[note.id] = (note, size)
+        self._loaded_bytes += size
+        self._evict_over_budget(keep=note.id)
+
+    def _evict_over_budget(self, keep: str) -> None:
+        if self._loaded_bytes <= self.budget:
+            return
+        for note_id in list(self._loaded):
+            if self._loaded_bytes <= self.budget:
+                break
+            if note_id == keep or note_id in self._dirty:
+                continue
+            note, size = self._loaded.pop(note_id)
+            note.evict_body()
+            self._loaded_bytes -= size
+
+    # ———— Запись —————
+
+    def append(self, bodies: List[str]) -> List[tuple[int, int]]:
+        """Дописывает тела в конец файла (с fsync) и возвращает их (смещение, длина)."""
+        refs = []
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                for body in bodies:
+                    data = body.encode('utf-8')
+                    f.write(data)
+                    refs.append((offset, len(data)))
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+        metrics.observe("storage.bytes_written", sum(length for _, length in refs), "B")
+        return refs
+
+    def rewrite(self, notes: List[Note]) -> Dict[str, tuple[int, int]]:
+        """Переписывает файл только с живыми телами и возвращает новые ссылки."""
+        refs: Dict[str, tuple[int, int]] = {}
+
+        def write(f):
+            offset = 0
+            for note in notes:
+                data = note.body.encode('utf-8')
+                f.write(data)
+                refs[note.id] = (offset, len(data))
+                offset += len(data)
+            # Старое отображение держит файл, который сейчас будет заменён
+            self._close_map()
+
+        with self._lock:
+            atomic_write(self.path, write, mode='wb')
+            self._refs = dict(refs)
+            self._dirty.clear()
+        return refs
+
+    def reopen(self) -> None:
+        """Файл могли заменить извне — следующее чтение откроет его заново."""
+        with self._lock:
+            self._close_map()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_map()
+
+
+class IndexedNoteStorage(NoteStorage):
+    """
+    Хранилище с ленивой загрузкой тел.
+
+    - индекс (``notes.idx.json`` + журнал) — id, заголовок, теги и
+      смещение/длина тела; при старте читается только он;
+    - тела (``notes.bodies``) — один файл, куда новые версии тел дописываются
+      в конец; читаются через mmap при первом обращении к ``LazyNote.body``.
+
+    Индекс ведётся тем же механизмом снимок + журнал, что и :class:`NoteStorage`.
+    Накопившиеся старые версии тел выбрасываются при загрузке.
+    """
+    lazy_bodies = True
+
+    def __init__(self, index_path: str, bodies_path: str, body_budget: int = DEFAULT_BODY_BUDGET,
+                 compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+                 commit_latency: float = DEFAULT_COMMIT_LATENCY):
+        super().__init__(index_path, compact_threshold, commit_latency)
+        self.bodies = BodyStore(bodies_path, body_budget)
+
+    # ———— Загрузка —————
+
+    def load_notes(self) -> List[Note]:
+        notes = super().load_notes()
+        if not os.path.exists(self.bodies.path):
+            open(self.bodies.path, 'ab').close()
+        size = os.path.getsize(self.bodies.path)
+        if size > GARBAGE_MIN_BYTES and size > GARBAGE_RATIO * self.bodies.live_bytes:
+            self.save_notes(notes)
+        return notes
+
+    def peek_body(self, note: LazyNote) -> str:
+        """Тело для построения индексов: с диска, минуя кэш тел, чтобы не вытеснять открытые заметки."""
+        if self.bodies.dirty_version(note.id) is not None:
+            # Несохранённая правка есть только в памяти
+            return note.body
+        return self.bodies.read(note.id)
+
+    def import_notes(self, notes: List[Note]) -> List[Note]:
+        """Записывает готовые заметки (например, из notes.json) и возвращает их ленивые версии."""
+        self.save_notes(notes)
+        return super().load_notes()
+
+    def _note_from_record(self, item: dict) -> Note:
+        self.bodies.set_ref(item['id'], item.get('offset', 0), item.get('length', 0))
+        return LazyNote(title=item.get('title', ''), tags=item.get('tags', []), id=item['id'],
+                        body_source=self.bodies)
+
+    def _record_hash(self, record: dict) -> int:
+        # Новое тело всегда дописывается в новое место — хватает ссылки на него
+        return hash((record.get('title', ''), tuple(record.get('tags', ())),
+                     record.get('offset', 0), record.get('length', 0)))
+
+    def read_external_changes(self) -> ExternalChanges:
+        changes = super().read_external_changes()
+        if changes:
+            # Другой процесс мог переписать файл тел целиком (сборка мусора при загрузке)
+            self.bodies.reopen()
+        return changes
+
+    # ———— Запись —————
+
+    def _upsert_entry(self, note: Note) -> dict:
+        entry = {'op': 'upsert', 'note': {'id': note.id, 'title': note.title, 'tags': list(note.tags)}}
+        if not isinstance(note, LazyNote):
+            entry['body'] = note.body
+        else:
+            version = self.bodies.dirty_version(note.id)
+            if version is not None and note.body_loaded:
+                # Тело переписываем только после правки, иначе хватает старой ссылки
+                entry['body'] = note.body
+                entry['version'] = version
+        return entry
+
+    def _commit_batch(self, entries: List[dict]) -> None:
+        self._ensure_directory()
+        with_body = [entry for entry in entries if 'body' in entry]
+        new_refs = dict(zip((entry['note']['id'] for entry in with_body),
+                            self.bodies.append([entry['body'] for entry in with_body])))
+        records = []
+        for entry in entries:
+            if entry['op'] == 'upsert':
+                record = dict(entry['note'])
+                offset, length = new_refs.get(record['id']) or self.bodies.ref(record['id'])
+                record.update(offset=offset, length=length)
+                records.append({'op': 'upsert', 'note': record})
+            else:
+                records.append(entry)
+        super()._commit_batch(records)
+        for entry in with_body:
+            note_id = entry['note']['id']
+            self.bodies.set_ref(note_id, *new_refs[note_id])
+            self.bodies.mark_committed(note_id, entry.get('version'))
+        for entry in entries:
+            if entry['op'] == 'delete':
+                self.bodies.forget(entry['id'])
+
+    def save_notes(self, notes: List[Note]) -> None:
+        """Полностью переписывает файл тел и снимок индекса, очищает журнал."""
+        self.flush()
+        self.wait_for_compaction()
+        self._ensure_directory()
+        with self._lock:
+            refs = self.bodies.rewrite(notes)
+            records = [{'id': note.id, 'title': note.title, 'tags': list(note.tags),
+                        'offset': refs[note.id][0], 'length': refs[note.id][1]}
+                       for note in notes]
+            self._write_snapshot(records)
+            for path in (self.journal_path, self._rotated_journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._adopt_files()
+        self._remember_records({record['id']: record for record in records}, replace=True)
+
+    def close(self) -> None:
+        super().close()
+        self.bodies.close()
@@ -0,0 +1,224 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, List
+from config import metrics_enabled, metrics_trace
+
+# Сколько последних значений каждой метрики хранится для перцентилей
+DEFAULT_WINDOW = 1000
+# Сколько событий трассы держится в памяти (старые вытесняются)
+DEFAULT_TRACE_LIMIT = 200_000
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу; ``sorted_values`` должен быть отсортирован."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+@dataclass
+class SeriesStats:
+    name: str
+    unit: str
+    count: int
+    total: float
+    last: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+class _Series:
+    __slots__ = ("unit", "values", "count", "total")
+
+    def __init__(self, unit: str, window: int):
+        self.unit = unit
+        self.values: deque = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+
+class _Span:
+    """Замер одного участка кода; работает и в async-коде (время — настенное)."""
+    __slots__ = ("_metrics", "name", "args", "_start")
+
+    def __init__(self, metrics: "Metrics", name: str, args: dict):
+        self._metrics = metrics
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self._metrics._finish_span(self.name, self._start, end, self.args)
+
+
+class _NullSpan:
+    __slots__ = ("args",)
+
+    def __init__(self):
+        self.args = {}
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.args.clear()
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """
+    Лёгкие замеры горячих путей: длительности участков кода (``span``),
+    произвольные величины (``observe``: байты, число кандидатов) и счётчики
+    (``count``: попадания в кэш). Для каждой метрики хранится окно последних
+    значений, по которому считаются перцентили.
+
+    При включённой записи трассы каждый замер также сохраняется как событие,
+    которое можно выгрузить в формате Chrome Trace (chrome://tracing, Perfetto).
+    Потокобезопасно: метрики пишут GUI-поток, писатель хранилища и цикл GigaChat.
+    """
+
+    def __init__(self, enabled: bool = True, window: int = DEFAULT_WINDOW,
+                 tracing: bool = False, trace_limit: int = DEFAULT_TRACE_LIMIT):
+        self.enabled = enabled
+        self.window = window
+        self.tracing = tracing
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+        self._counters: Dict[str, int] = {}
+        self._events: deque = deque(maxlen=trace_limit)
+        self._thread_names: Dict[int, str] = {}
+        self._epoch_ns = time.perf_counter_ns()
+
+    # ———— Запись —————
+
+    def span(self, name: str, **args):
+        """
+        Контекстный менеджер замера: ``with metrics.span("search.query", query=text):``.
+        Аргументы попадают в событие трассы; их можно дополнить внутри блока через ``span.args``.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def timed(self, name: str):
+        """Декоратор: замер каждого вызова функции под именем ``name``."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, name: str, value: float, unit: str = "") -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._add(name, value, unit)
+            if self.tracing:
+                self._events.append(("C", name, time.perf_counter_ns(), 0, threading.get_ident(), value))
+
+    def count(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def _finish_span(self, name: str, start: int, end: int, args: dict) -> None:
+        with self._lock:
+            self._add(name, (end - start) / 1e6, "ms")
+            if self.tracing:
+                tid = threading.get_ident()
+                if tid not in self._thread_names:
+                    self._thread_names[tid] = threading.current_thread().name
+                self._events.append(("X", name, start, end - start, tid, args))
+
+    def _add(self, name: str, value: float, unit: str) -> None:
+        series = self._series.get(name)
+        if series is None:
+            series = self._series[name] = _Series(unit, self.window)
+        series.values.append(value)
+        series.count += 1
+        series.total += value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+            self._events.clear()
+
+    # ———— Чтение —————
+
+    def snapshot(self) -> List[SeriesStats]:
+        """Сводка по всем метрикам: перцентили считаются по окну последних значений."""
+        with self._lock:
+            items = [(name, series.unit, series.count, series.total, list(series.values))
+                     for name, series in self._series.items()]
+        stats = []
+        for name, unit, count, total, values in sorted(items):
+            ordered = sorted(values)
+            stats.append(SeriesStats(
+                name=name, unit=unit, count=count, total=total, last=values[-1],
+                p50=percentile(ordered, 50), p90=percentile(ordered, 90), p99=percentile(ordered, 99),
+                max=ordered[-1],
+            ))
+        return stats
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    @property
+    def trace_events(self) -> int:
+        return len(self._events)
+
+    def chrome_trace(self) -> dict:
+        """Записанные события в формате Chrome Trace Event (JSON Object Format)."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+            counters = dict(self._counters)
+        trace = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in thread_names.items()
+        ]
+        for phase, name, start, duration, tid, payload in events:
+            event = {"name": name, "cat": name.split(".", 1)[0], "ph": phase, "pid": pid, "tid": tid,
+                     "ts": (start - self._epoch_ns) / 1000}
+            if phase == "X":
+                event["dur"] = duration / 1000
+                if payload:
+                    event["args"] = payload
+            else:
+                event["args"] = {"value": payload}
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms", "otherData": {"counters": counters}}
+
+    def export_chrome_trace(self, path: str) -> int:
+        """Записывает трассу в файл и возвращает число событий."""
+        trace = self.chrome_trace()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False, default=str)
+        return len(trace["traceEvents"])
+
+
+# Общий для приложения набор метрик (METRICS_ENABLED, METRICS_TRACE в config.py)
+metrics = Metrics(enabled=metrics_enabled, tracing=metrics_trace)
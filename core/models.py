@@ -1,8 +1,146 @@
-from dataclasses import dataclass, field
-from typing import List
+import sys
+import uuid
+from typing import Iterable, List, Tuple
+
+
+def new_note_id() -> str:
+    """Генерирует стабильный идентификатор заметки."""
+    return uuid.uuid4().hex
+
+
+def normalize_tag(tag: str) -> str:
+    """Ключ тега для сравнения и фасетного индекса: без пробелов по краям и без учёта регистра."""
+    return sys.intern(tag.strip().casefold())
+
 
-@dataclass
 class Note:
-    title: str
-    body: str
-    tags: List[str] = field(default_factory=list)
\ No newline at end of file
+    """
+    Заметка. Хранится компактно: ``__slots__`` вместо ``__dict__``,
+    теги — кортеж интернированных строк (одинаковые теги тысяч заметок
+    ссылаются на один объект), нормализованные ключи тегов и заголовка
+    считаются один раз и сбрасываются при присваивании.
+    """
+
+    __slots__ = ("_title", "_title_key", "body", "_tags", "_tag_keys", "id")
+
+    def __init__(self, title: str, body: str, tags: Iterable[str] = (), id: str | None = None):
+        self.title = title
+        self.body = body
+        self.tags = tags
+        self.id = id if id is not None else new_note_id()
+
+    @property
+    def title(self) -> str:
+        return self._title
+
+    @title.setter
+    def title(self, value: str) -> None:
+        self._title = value
+        self._title_key = None
+
+    @property
+    def title_key(self) -> str:
+        """Заголовок в нижнем регистре (casefold) для поиска по вхождению."""
+        if self._title_key is None:
+            self._title_key = self._title.casefold()
+        return self._title_key
+
+    @property
+    def tags(self) -> Tuple[str, ...]:
+        return self._tags
+
+    @tags.setter
+    def tags(self, value: Iterable[str]) -> None:
+        tags = tuple(sys.intern(tag) for tag in value)
+        keys = tuple(normalize_tag(tag) for tag in tags)
+        self._tags = tags
+        # Обычно теги уже в нижнем регистре — тогда ключи не занимают отдельного кортежа
+        self._tag_keys = tags if keys == tags else keys
+
+    @property
+    def tag_keys(self) -> Tuple[str, ...]:
+        """Нормализованные теги (см. :func:`normalize_tag`), в том же порядке."""
+        return self._tag_keys
+
+    def assign(self, other: "Note") -> None:
+        """Принять заголовок, тело и теги другой версии этой заметки (объект остаётся тем же)."""
+        self.title = other.title
+        self.body = other.body
+        self.tags = other.tags
+
+    def mark_dirty(self) -> None:
+        """Тело должно быть записано заново при следующем сохранении (обычная заметка пишется целиком всегда)."""
+
+    def to_dict(self) -> dict:
+        """Запись для хранилища и экспорта."""
+        return {'title': self.title, 'body': self.body, 'tags': list(self._tags), 'id': self.id}
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.id, self.title, self._tags, self.body) == (other.id, other.title, other._tags, other.body)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(title={self.title!r}, tags={list(self._tags)!r}, id={self.id!r})"
+
+
+class LazyNote(Note):
+    """
+    Заметка, у которой при загрузке известны только заголовок, теги и id.
+    Тело читает ``body_source`` при первом обращении к ``body``;
+    источник же может выгрузить его обратно (``evict_body``), чтобы уложиться в бюджет памяти.
+    Поле ``_body`` источник ставит и сбрасывает под своим замком: тела читают
+    и GUI-поток, и фоновые (построение индексов).
+    """
+
+    __slots__ = ("_body", "_body_source")
+
+    def __init__(self, title: str, tags: List[str], id: str, body_source):
+        self._body: str | None = None
+        self._body_source = None
+        super().__init__(title=title, body=None, tags=tags, id=id)
+        self._body_source = body_source
+
+    @property
+    def body(self) -> str:
+        # Другой поток может выгрузить тело в любой момент — поле читаем один раз
+        body = self._body
+        if body is None:
+            body = self._body_source.load_body(self)
+        return body
+
+    @body.setter
+    def body(self, value: str | None) -> None:
+        if value is None or self._body_source is None:
+            # Так конструктор Note передаёт «тело ещё не прочитано»
+            self._body = value
+            return
+        self._body_source.body_changed(self, value)
+
+    @property
+    def body_loaded(self) -> bool:
+        return self._body is not None
+
+    def evict_body(self) -> None:
+        self._body = None
+
+    def mark_dirty(self) -> None:
+        # Иначе хранилище сохранит только заголовок и теги, сославшись на тело на диске
+        self._body_source.body_changed(self, self.body)
+
+    def assign(self, other: Note) -> None:
+        if isinstance(other, LazyNote) and other._body_source is self._body_source and not other.body_loaded:
+            # Ссылка на новое тело уже у источника — прежнее тело достаточно выгрузить
+            self.title = other.title
+            self.tags = other.tags
+            self._body = None
+        else:
+            super().assign(other)
+
+    # Сравнение по значению потребовало бы прочитать тела — сравниваем объекты
+    def __eq__(self, other):
+        return self is other
+
+    __hash__ = None
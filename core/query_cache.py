@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, FrozenSet, Tuple
+
+# Сколько последних запросов помнить: хватает, чтобы стереть набранное слово
+# и вернуться к любому его префиксу без повторного поиска
+QUERY_CACHE_SIZE = 32
+
+
+class QueryCancelled(Exception):
+    """Запрос устарел (набран следующий) — поиск прерван на полпути."""
+
+
+@dataclass(frozen=True)
+class QueryResult:
+    """Готовый результат поиска: что показать в списке и что подсветить."""
+    # Сначала точные совпадения (по релевантности), за ними нечёткие
+    note_ids: Tuple[str, ...]
+    exact_count: int
+    words: FrozenSet[str]
+    prefix: str | None
+    # Точные совпадения не обрезаны лимитом — это все заметки, подходящие под запрос,
+    # и уточнение запроса можно искать только среди них
+    complete: bool
+
+    @property
+    def exact_ids(self) -> Tuple[str, ...]:
+        return self.note_ids[:self.exact_count]
+
+
+class QueryCache:
+    """
+    LRU последних запросов и их результатов. Кроме точного попадания
+    (стёрли символ — результат уже есть) умеет найти среди сохранённых
+    запрос, уточнением которого является новый: тогда новый ищется только
+    среди его результатов. Что считается уточнением, решает вызывающий
+    (зависит от способа поиска).
+
+    Любое изменение заметок или индексов должно вызывать ``clear``; результат,
+    посчитанный до очистки, ``put`` отбрасывает по ``generation``. Потокобезопасно.
+    """
+
+    def __init__(self, capacity: int = QUERY_CACHE_SIZE):
+        self.capacity = capacity
+        self.generation = 0
+        self._entries: OrderedDict[str, QueryResult] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, query: str) -> QueryResult | None:
+        with self._lock:
+            result = self._entries.get(query)
+            if result is not None:
+                self._entries.move_to_end(query)
+            return result
+
+    def put(self, query: str, result: QueryResult, generation: int) -> None:
+        """:param generation: ``self.generation`` на момент начала поиска"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[query] = result
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def refinement_base(self, query: str, refines: Callable[[str, str], bool]) -> QueryResult | None:
+        """
+        Самый узкий полный результат среди запросов, которые ``query`` уточняет
+        (``refines(старый, новый)``); None — искать заново по всем заметкам.
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        best = None
+        for old, result in entries:
+            if result.complete and old != query and (best is None or result.exact_count < best.exact_count) \
+                    and refines(old, query):
+                best = result
+        return best
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
@@ -0,0 +1,261 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List
+from core.metrics import metrics
+
+# Ответы, после которых запрос имеет смысл повторить: перегрузка и временные сбои сервера
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """
+    Значение заголовка Retry-After в секундах: число секунд или HTTP-дата.
+    None, если заголовка нет или он не разбирается.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment is None:
+        return None
+    return max(0.0, moment.timestamp() - (time.time() if now is None else now))
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Экспоненциальная задержка с полным джиттером: перед попыткой ``n``
+    ждём случайное время из ``[0, min(max_delay, base_delay * multiplier ** n)]``,
+    чтобы одновременно упавшие запросы не вернулись к серверу разом.
+    Retry-After сервера — нижняя граница задержки; если он больше
+    ``max_retry_after``, повторять бессмысленно.
+    """
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    multiplier: float = 2.0
+    max_retry_after: float = 60.0
+
+    def delay(self, attempt: int, retry_after: float | None = None,
+              rng: random.Random | None = None) -> float:
+        """Пауза перед попыткой ``attempt + 1`` (``attempt`` считается с нуля)."""
+        cap = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        jittered = (rng or random).uniform(0, cap)
+        if retry_after is not None:
+            return max(retry_after, jittered)
+        return jittered
+
+    def should_retry(self, attempt: int, retry_after: float | None = None) -> bool:
+        if attempt + 1 >= self.max_attempts:
+            return False
+        return retry_after is None or retry_after <= self.max_retry_after
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket, подстраивающийся под ответы 429 (AIMD): 429 уменьшает
+    скорость вдвое и приостанавливает выдачу жетонов на время Retry-After,
+    каждый успешный ответ понемногу возвращает скорость к ``max_rate``.
+    Пачка 429 на запросы, отправленные одновременно, — один сигнал
+    перегрузки, поэтому скорость снижается не чаще раза в ``cooldown`` секунд.
+
+    Жетоны выдаются «в долг»: ``reserve`` сразу возвращает время ожидания
+    своей очереди, поэтому ожидающие не толкаются и не нужен asyncio.Lock,
+    привязанный к одному event loop. Потокобезопасно.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0, min_rate: float = 0.2,
+                 increase: float = 0.05, decrease: float = 0.5, cooldown: float = 1.0):
+        """
+        :param rate: запросов в секунду в установившемся режиме (потолок)
+        :param burst: сколько запросов можно отправить разом после простоя
+        :param min_rate: ниже этой скорости 429 её больше не снижают
+        :param increase: на сколько запросов в секунду скорость растёт после успеха
+        :param decrease: во сколько раз скорость падает после 429
+        :param cooldown: минимальный интервал между снижениями скорости, секунды
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._decreased_at = float("-inf")
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def reserve(self) -> float:
+        """Занять жетон; возвращает, сколько секунд подождать до его появления."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = max(0.0, self._paused_until - now)
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+            return wait
+
+    async def acquire(self) -> float:
+        """Дождаться своей очереди; возвращает время ожидания в секундах."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(self, retry_after: float | None = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._decreased_at >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._decreased_at = now
+            # Набранный запас жетонов после 429 уже не действителен
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """Один источник кусочков текста на нескольких подписчиков; опоздавшие получают уже пришедшее."""
+    __slots__ = ("chunks", "done", "error", "changed", "waiters", "task")
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.changed = asyncio.Event()
+        self.waiters = 0
+        self.task: asyncio.Task | None = None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых запросов, выполняющихся одновременно: второй
+    вызов с тем же ключом не идёт в сеть, а ждёт результат первого.
+    Общая задача отменяется, только когда отказались все ожидающие.
+    Ключи действуют в пределах одного event loop.
+    """
+
+    def __init__(self, name: str | None = None):
+        """:param name: префикс счётчика объединённых запросов в метриках (``<name>.coalesced``)"""
+        self.name = name
+        self.coalesced = 0
+        self._calls: Dict[tuple, _Flight] = {}
+        self._streams: Dict[tuple, _SharedStream] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    @staticmethod
+    def _key(key: Hashable) -> tuple:
+        return id(asyncio.get_running_loop()), key
+
+    def _joined(self) -> None:
+        self.coalesced += 1
+        if self.name:
+            metrics.count(f"{self.name}.coalesced")
+
+    def _forget(self, table: dict, full_key: tuple, entry) -> None:
+        # Под тем же ключом мог уже начаться новый запрос — его не трогаем
+        if table.get(full_key) is entry:
+            del table[full_key]
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """Результат ``factory()``; одновременные вызовы с тем же ключом получают его же."""
+        full_key = self._key(key)
+        flight = self._calls.get(full_key)
+        if flight is None:
+            flight = self._calls[full_key] = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, full_key, flight))
+        else:
+            self._joined()
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                self._forget(self._calls, full_key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Кусочки ``factory()``; подписчик, пришедший позже, сначала получает уже полученный текст."""
+        full_key = self._key(key)
+        shared = self._streams.get(full_key)
+        if shared is None:
+            shared = self._streams[full_key] = _SharedStream()
+            shared.task = asyncio.ensure_future(self._pump(full_key, shared, factory()))
+        else:
+            self._joined()
+        shared.waiters += 1
+        position = 0
+        try:
+            while True:
+                while position < len(shared.chunks):
+                    yield shared.chunks[position]
+                    position += 1
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                shared.changed.clear()
+                await shared.changed.wait()
+        finally:
+            shared.waiters -= 1
+            if shared.waiters == 0 and not shared.done:
+                # Отказались все: новый подписчик с тем же ключом начнёт запрос заново
+                self._forget(self._streams, full_key, shared)
+                shared.task.cancel()
+
+    async def _pump(self, full_key: tuple, shared: _SharedStream, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                shared.chunks.append(chunk)
+                shared.changed.set()
+        except asyncio.CancelledError:
+            shared.error = asyncio.CancelledError()
+            raise
+        except Exception as exc:
+            shared.error = exc
+        finally:
+            shared.done = True
+            shared.changed.set()
+            self._forget(self._streams, full_key, shared)
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
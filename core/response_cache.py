@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable
+from core.metrics import metrics
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Вежливые вставки, которые не меняют вопроса («Docker, пожалуйста» == «Docker»).
+# Вопросительные слова сюда не входят: «зачем нужен Docker» и «что такое Docker» — разные заметки
+FILLER_PHRASES = (
+    ("пожалуйста",), ("будь", "добр"), ("будьте", "добры"), ("please",),
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Нормализует запрос для ключа кэша: нижний регистр, ё→е, без пунктуации
+    и вежливых вставок (``FILLER_PHRASES``). Порядок слов сохраняется.
+    """
+    words = _WORD_RE.findall(query.lower().replace("ё", "е"))
+    kept, i = [], 0
+    while i < len(words):
+        phrase = next((p for p in FILLER_PHRASES if tuple(words[i:i + len(p)]) == p), None)
+        if phrase is None:
+            kept.append(words[i])
+            i += 1
+        else:
+            i += len(phrase)
+    # Запрос только из вставок («пожалуйста») оставляем как есть
+    return " ".join(kept or words)
+
+
+class ResponseCache:
+    """
+    Персистентный кэш ответов GigaChat на SQLite.
+
+    Ключ — хэш от нормализованного запроса, шаблона промпта и модели.
+    Записи вытесняются по LRU при превышении числа записей или суммарного
+    размера, а также по истечении TTL.
+    """
+
+    def __init__(self, path: str, max_entries: int = 2000, max_bytes: int = 32 * 1024 * 1024,
+                 ttl: float = 30 * 24 * 3600):
+        """
+        :param path: путь к файлу базы (создаётся при необходимости)
+        :param max_entries: максимум записей
+        :param max_bytes: максимум суммарного размера тел ответов
+        :param ttl: время жизни записи в секундах
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " query TEXT NOT NULL,"
+            " body TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(query: str, template: str, model: str) -> str:
+        raw = "\x1f".join((normalize_query(query), template, model))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, template: str, model: str) -> str | None:
+        """Тело закэшированного ответа или None (промах / истёк TTL)."""
+        key = self.make_key(query, template, model)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                metrics.count("response_cache.miss")
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            metrics.count("response_cache.hit")
+            return row[0]
+
+    def put(self, query: str, template: str, model: str, body: str) -> None:
+        key = self.make_key(query, template, model)
+        now = time.time()
+        size = len(body.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, query, body, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, query, body, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Удаляем самые давно использованные, пока не уложимся в оба лимита
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def invalidate(self, query: str, template: str, model: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (self.make_key(query, template, model),))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedGenerator:
+    """
+    Обёртка над генерацией заметки с кэшем перед GigaChat.
+    ``force_refresh=True`` идёт в API в обход кэша и перезаписывает запись.
+    """
+
+    def __init__(self, cache: ResponseCache,
+                 generate: Callable[[str], Awaitable[tuple[str, str]]],
+                 stream: Callable[[str], AsyncIterator[str]] | None,
+                 template: str, model: str):
+        self.cache = cache
+        self._generate = generate
+        self._stream = stream
+        self.template = template
+        self.model = model
+
+    async def _cached(self, query: str) -> str | None:
+        # SQLite блокирует — обращения к кэшу уходят в пул потоков, цикл событий не ждёт диска
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.cache.get, query, self.template, self.model)
+
+    async def _remember(self, query: str, body: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.cache.put, query, self.template, self.model, body)
+
+    async def generate(self, query: str, force_refresh: bool = False) -> tuple[str, str]:
+        if not force_refresh:
+            body = await self._cached(query)
+            if body is not None:
+                return query.strip(), body
+        title, body = await self._generate(query)
+        if body:
+            await self._remember(query, body)
+        return title, body
+
+    async def stream(self, query: str, force_refresh: bool = False) -> AsyncIterator[str]:
+        if not force_refresh:
+            body = await self._cached(query)
+            if body is not None:
+                yield body
+                return
+        parts = []
+        async for delta in self._stream(query):
+            parts.append(delta)
+            yield delta
+        body = "".join(parts).strip()
+        # Кэшируем только полностью полученный ответ
+        if body:
+            await self._remember(query, body)
@@ -0,0 +1,323 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Set, Tuple
+from core.models import Note
+from core.metrics import metrics
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Индексы полей в кортежах частот
+TITLE, TAGS, BODY = 0, 1, 2
+# Веса полей: совпадение в заголовке и тегах важнее, чем в теле
+FIELD_BOOSTS = (3.0, 2.0, 1.0)
+# Списки постингов длиннее этого порога сортируются по вкладу уже при построении
+PRESORT_MIN_POSTINGS = 256
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на слова в нижнем регистре (кириллица поддерживается)."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def term_counts(text: str) -> Tuple[Counter, int]:
+    """Частоты слов текста и число слов в нём — то, что индекс берёт из тела заметки."""
+    tokens = tokenize(text)
+    return Counter(tokens), len(tokens)
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по заголовку, тегам и телу заметок с ранжированием BM25F.
+
+    Для каждого терма хранится «вклад» (impact) заметки — нормализованная по длине
+    полей и насыщенная частота. Постинги дополнительно держатся отсортированными
+    по убыванию вклада, поэтому top-k ищется алгоритмом порогов (Fagin TA) без
+    обхода всех заметок, содержащих частый терм.
+
+    Индекс обновляется инкрементально: ``update`` переиндексирует только одну
+    заметку, ``remove`` убирает её постинги. Последний токен запроса
+    трактуется как префикс, чтобы результаты появлялись по мере набора.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75, prefix_expansions: int = 16,
+                 prefix_weight: float = 0.6):
+        """
+        :param k1: насыщение частоты терма (BM25)
+        :param b: сила нормализации по длине поля (BM25)
+        :param prefix_expansions: сколько словарных термов максимум подставлять вместо префикса
+        :param prefix_weight: множитель для совпадений по префиксу, а не по целому слову
+        """
+        self.k1 = k1
+        self.b = b
+        self.prefix_expansions = prefix_expansions
+        self.prefix_weight = prefix_weight
+        self._reset()
+
+    def _reset(self) -> None:
+        # term -> {note_id: impact}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # term -> [(-impact, note_id)], отсортировано; может отставать от _postings
+        self._impact_order: Dict[str, List[Tuple[float, str]]] = {}
+        # term -> заметки, чей вклад изменился после последней сортировки
+        self._stale: Dict[str, Set[str]] = {}
+        # Отсортированный словарь для поиска по префиксу
+        self._vocabulary: List[str] = []
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self._doc_lengths: Dict[str, Tuple[int, int, int]] = {}
+        self._total_lengths = [0, 0, 0]
+        self._notes: Dict[str, Note] = {}
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._notes
+
+    def get(self, note_id: str) -> Note | None:
+        return self._notes.get(note_id)
+
+    # ———— Обновление индекса —————
+
+    def rebuild(self, notes: Iterable[Note],
+                body_terms: Callable[[Note], Tuple[Counter, int]] | None = None) -> None:
+        """
+        :param body_terms: ``term_counts`` тела вместо разбора ``note.body`` — например,
+            пустые частоты для индекса только по заголовкам и тегам
+        """
+        self._reset()
+        analyzed = [(note, self._analyze(note, body_terms)) for note in notes]
+        for _, (_, lengths) in analyzed:
+            for i, length in enumerate(lengths):
+                self._total_lengths[i] += length
+        # Средние длины известны заранее, поэтому вклады сразу точные
+        avg = self._averages(len(analyzed))
+        for note, analysis in analyzed:
+            self._add(note, analysis, avg)
+        self._vocabulary.sort()
+        # Длинные списки сортируем заранее, чтобы первый запрос не платил за сортировку
+        for term, postings in self._postings.items():
+            if len(postings) >= PRESORT_MIN_POSTINGS:
+                self._ordered(term)
+
+    def update(self, note: Note) -> None:
+        """Добавляет заметку в индекс или переиндексирует её после изменения."""
+        if note.id in self._notes:
+            self._remove_postings(note.id)
+        analysis = self._analyze(note)
+        for i, length in enumerate(analysis[1]):
+            self._total_lengths[i] += length
+        self._add(note, analysis, self._averages(len(self._notes) + 1), keep_sorted=True)
+
+    def remove(self, note_id: str) -> None:
+        if note_id in self._notes:
+            self._remove_postings(note_id)
+            del self._notes[note_id]
+
+    @staticmethod
+    def _analyze(note: Note, body_terms: Callable[[Note], Tuple[Counter, int]] | None = None
+                 ) -> Tuple[List[Counter], Tuple[int, int, int]]:
+        title, tags = tokenize(note.title), tokenize(" ".join(note.tags))
+        body_tf, body_length = term_counts(note.body) if body_terms is None else body_terms(note)
+        return [Counter(title), Counter(tags), body_tf], (len(title), len(tags), body_length)
+
+    def _averages(self, n_docs: int) -> List[float]:
+        return [max(total / n_docs, 1.0) if n_docs else 1.0 for total in self._total_lengths]
+
+    def _add(self, note: Note, analysis, avg: List[float], keep_sorted: bool = False) -> None:
+        counters, lengths = analysis
+        title_tf, tags_tf, body_tf = counters
+        k1, b = self.k1, self.b
+        # BM25F: частоты полей нормализуются по длине и складываются с весами
+        norms = [boost / (1.0 - b + b * length / a) for boost, length, a in zip(FIELD_BOOSTS, lengths, avg)]
+        terms = tuple(set(title_tf).union(tags_tf, body_tf))
+        for term in terms:
+            tf = title_tf[term] * norms[TITLE] + tags_tf[term] * norms[TAGS] + body_tf[term] * norms[BODY]
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if keep_sorted:
+                    insort(self._vocabulary, term)
+                else:
+                    self._vocabulary.append(term)
+            postings[note.id] = tf / (k1 + tf)
+            stale = self._stale.get(term)
+            if stale is not None:
+                stale.add(note.id)
+        self._doc_terms[note.id] = terms
+        self._doc_lengths[note.id] = lengths
+        self._notes[note.id] = note
+
+    def _remove_postings(self, note_id: str) -> None:
+        for term in self._doc_terms.pop(note_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(note_id, None)
+            if not postings:
+                del self._postings[term]
+                self._impact_order.pop(term, None)
+                self._stale.pop(term, None)
+                i = bisect_left(self._vocabulary, term)
+                if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                    del self._vocabulary[i]
+        for i, length in enumerate(self._doc_lengths.pop(note_id, (0, 0, 0))):
+            self._total_lengths[i] -= length
+
+    def _ordered(self, term: str) -> Tuple[List[Tuple[float, str]], Set[str]]:
+        """Постинги терма по убыванию вклада и множество заметок, изменённых после сортировки."""
+        order = self._impact_order.get(term)
+        stale = self._stale.get(term)
+        postings = self._postings[term]
+        if order is None or len(stale) * 8 > len(postings):
+            order = sorted((-impact, note_id) for note_id, impact in postings.items())
+            stale = set()
+            self._impact_order[term] = order
+            self._stale[term] = stale
+        return order, stale
+
+    # ———— Поиск —————
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self._vocabulary, prefix)
+        result = []
+        for term in self._vocabulary[start:start + self.prefix_expansions + 1]:
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                result.append(term)
+        return result
+
+    def _query_groups(self, query: str) -> List[List[Tuple[str, float]]]:
+        """
+        Разбивает запрос на группы термов с весами. Каждое слово — отдельная группа;
+        последнее слово ещё набирают, поэтому его группа дополняется словами
+        словаря с таким префиксом (с пониженным весом). Внутри группы
+        засчитывается лучшее совпадение, группы суммируются.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        groups = [[(token, 1.0)] for token in tokens]
+        if tokens and len(tokens[-1]) > 1:
+            groups[-1].extend((term, self.prefix_weight) for term in self._expand_prefix(tokens[-1]))
+        return groups
+
+    def _prefix_complete(self, prefix: str) -> bool:
+        """В подстановку префикса попали все слова словаря с ним (лимит ``prefix_expansions`` не сработал)."""
+        end = bisect_left(self._vocabulary, prefix) + self.prefix_expansions + 1
+        return end >= len(self._vocabulary) or not self._vocabulary[end].startswith(prefix)
+
+    def refines(self, old: str, new: str) -> bool:
+        """
+        Все результаты ``new`` есть среди результатов ``old``: запрос отличается
+        только продолжением последнего слова, а прежний префикс подставлялся целиком.
+        Добавленное слово результат расширяет (слова запроса объединяются через ИЛИ).
+        """
+        old_tokens = list(dict.fromkeys(tokenize(old)))
+        new_tokens = list(dict.fromkeys(tokenize(new)))
+        if not old_tokens or len(old_tokens) != len(new_tokens) or old_tokens[:-1] != new_tokens[:-1]:
+            return False
+        last = old_tokens[-1]
+        if new_tokens[-1] == last:
+            return True
+        return new_tokens[-1].startswith(last) and len(last) > 1 and self._prefix_complete(last)
+
+    def search(self, query: str, limit: int | None = None) -> List[Note]:
+        """Возвращает заметки, подходящие под запрос, в порядке убывания релевантности."""
+        return [self._notes[note_id] for note_id, _ in self.search_scored(query, limit)]
+
+    def search_scored(self, query: str, limit: int | None = None,
+                      within: Collection[str] | None = None) -> List[Tuple[str, float]]:
+        """
+        :param within: оценивать только эти заметки — результаты запроса, который
+            ``query`` уточняет (см. ``refines``), вместо обхода постингов
+        """
+        n_docs = len(self._notes)
+        groups = []
+        for group in self._query_groups(query):
+            weighted = []
+            for term, weight in group:
+                postings = self._postings.get(term)
+                if postings:
+                    df = len(postings)
+                    idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)) * weight
+                    weighted.append((term, idf, postings))
+            if weighted:
+                groups.append(weighted)
+        if not groups:
+            return []
+
+        def score(note_id: str) -> float:
+            return sum(max(idf * postings.get(note_id, 0.0) for _, idf, postings in group)
+                       for group in groups)
+
+        if within is not None:
+            scored = []
+            for note_id in within:
+                value = score(note_id) if note_id in self._notes else 0.0
+                if value > 0.0:
+                    scored.append((value, note_id))
+            metrics.observe("search.candidates", len(within))
+            # Тот же порядок, что у _top_k
+            scored.sort(reverse=True)
+            return [(note_id, value) for value, note_id in scored[:limit]]
+        if limit is None:
+            candidates = set()
+            for group in groups:
+                for _, _, postings in group:
+                    candidates.update(postings)
+            metrics.observe("search.candidates", len(candidates))
+            return sorted(((nid, score(nid)) for nid in candidates), key=lambda item: item[1], reverse=True)
+        return self._top_k(groups, score, limit)
+
+    def _sorted_access(self, group, seen: Set[str], offer) -> Iterator[Tuple[float, str]]:
+        """Итератор (-вклад·idf, note_id) по группе; изменённые после сортировки заметки сразу оцениваются."""
+        streams = []
+        for term, idf, _ in group:
+            order, stale = self._ordered(term)
+            for note_id in stale:
+                if note_id not in seen and note_id in self._notes:
+                    offer(note_id)
+            streams.append(self._scaled(order, idf))
+        return heapq.merge(*streams) if len(streams) > 1 else streams[0]
+
+    @staticmethod
+    def _scaled(order: List[Tuple[float, str]], idf: float) -> Iterator[Tuple[float, str]]:
+        for neg_impact, note_id in order:
+            yield neg_impact * idf, note_id
+
+    def _top_k(self, groups, score, limit: int) -> List[Tuple[str, float]]:
+        # Алгоритм порогов: идём по спискам в порядке убывания вклада и
+        # останавливаемся, когда k-й результат не хуже максимально возможного
+        # счёта ещё не просмотренной заметки.
+        heap: List[Tuple[float, str]] = []
+        seen: Set[str] = set()
+
+        def offer(note_id: str) -> None:
+            seen.add(note_id)
+            item = (score(note_id), note_id)
+            if len(heap) < limit:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        streams = [self._sorted_access(group, seen, offer) for group in groups]
+        while streams:
+            threshold = 0.0
+            alive = []
+            for stream in streams:
+                entry = next(stream, None)
+                if entry is None:
+                    continue
+                alive.append(stream)
+                neg_score, note_id = entry
+                threshold -= neg_score
+                if note_id not in seen and note_id in self._notes:
+                    offer(note_id)
+            streams = alive
+            if len(heap) >= limit and heap[0][0] >= threshold:
+                break
+
+        # Сколько заметок пришлось оценить — мера того, насколько рано сработал порог
+        metrics.observe("search.candidates", len(seen))
+        return [(note_id, s) for s, note_id in sorted(heap, reverse=True) if s > 0.0]
@@ -0,0 +1,369 @@
+import concurrent.futures
+import hashlib
+import heapq
+import json
+import os
+import re
+import zlib
+from lzma import LZMAError
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List
+from core.models import Note
+from core.metrics import metrics
+from core.compression import BodyCodec, pack_file, unpack_file
+from core.storage import (
+    NoteStorage, atomic_write, file_fingerprint, DEFAULT_COMMIT_LATENCY, DEFAULT_COMPACT_THRESHOLD
+)
+
+# Формат манифеста; другой формат не читается
+MANIFEST_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+JOURNAL_NAME = "notes.journal"
+DEFAULT_SHARD_COUNT = 16
+# shard-<номер части, hex>.<поколение>.json
+_SHARD_FILE_RE = re.compile(r"^shard-([0-9a-f]+)\.(\d+)\.json$")
+
+_seq = itemgetter('seq')
+
+
+def shard_of(note_id: str, shard_count: int) -> int:
+    """Номер части заметки: стабилен между запусками (crc32, а не hash() с солью)."""
+    return zlib.crc32(note_id.encode('utf-8')) % shard_count
+
+
+class ShardError(ValueError):
+    """Файл части не читается, повреждён или не совпадает с контрольной суммой манифеста."""
+
+
+def _read_shard(path: str, checksum: str | None) -> List[dict]:
+    """Читает и проверяет одну часть; выполняется в пуле потоков или процессов."""
+    name = os.path.basename(path)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as exc:
+        raise ShardError(f"{name}: {exc.strerror or exc}") from exc
+    # sha256 и чтение файла отпускают GIL — эта часть работы идёт параллельно и в потоках
+    if checksum is not None and hashlib.sha256(data).hexdigest() != checksum:
+        raise ShardError(f"{name}: контрольная сумма не совпадает")
+    try:
+        records = json.loads(unpack_file(data))
+    except (ValueError, LZMAError) as exc:
+        raise ShardError(f"{name}: {exc}") from exc
+    if not isinstance(records, list):
+        raise ShardError(f"{name}: ожидался список заметок")
+    return records
+
+
+class ShardedNoteStorage(NoteStorage):
+    """
+    Хранилище для очень больших коллекций: заметки разложены по ``shard_count``
+    файлам-частям по crc32 от id, а небольшой манифест хранит для каждой части
+    имя файла, sha256 и число заметок.
+
+    - при загрузке части читаются и проверяются параллельно (пул потоков или,
+      с ``processes=True``, процессов) и сливаются по порядковому номеру
+      ``seq`` — порядок заметок в списке тот же, что и без разбиения;
+    - повреждённая часть не мешает загрузке остальных: её файл откладывается
+      с суффиксом ``.corrupt`` (см. ``damaged``), а хранилище переписывается
+      без неё — заметки из журнала при этом не теряются;
+    - правки идут в журнал, как у :class:`NoteStorage`, а компакция
+      переписывает только части, которых касались записи журнала. Часть
+      пишется в новый файл (следующее поколение), манифест заменяется
+      последним, поэтому сбой посреди записи оставляет прежнее состояние;
+    - ``compression="lzma"`` сжимает каждую часть целиком (``framing`` в
+      манифесте), ``zlib`` — тела по отдельности со словарями в ``dicts/``.
+    """
+
+    def __init__(self, directory: str, shard_count: int = DEFAULT_SHARD_COUNT, workers: int | None = None,
+                 processes: bool = False, compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+                 commit_latency: float = DEFAULT_COMMIT_LATENCY, compression: str = "none"):
+        """
+        :param directory: каталог частей, манифеста и журнала
+        :param shard_count: на сколько частей раскладывать заметки при записи
+        :param workers: размер пула загрузки, по умолчанию по числу ядер
+        :param processes: декодировать JSON в процессах — на многоядерных машинах
+            загрузка масштабируется с числом ядер (в потоках декодирование держит GIL)
+        :param compression: none, zlib или lzma (см. :mod:`core.compression`)
+        """
+        super().__init__(os.path.join(directory, MANIFEST_NAME), compact_threshold, commit_latency, compression)
+        self.directory = directory
+        self.codec = BodyCodec(os.path.join(directory, "dicts"))
+        self.journal_path = os.path.join(directory, JOURNAL_NAME)
+        self.shard_count = shard_count
+        self.workers = workers or min(shard_count, (os.cpu_count() or 1) + 4)
+        self.processes = processes
+        self._manifest: dict = self._empty_manifest()
+        # Повреждённые части при загрузке откладываются, а не прерывают её
+        self._salvage = False
+
+    def _empty_manifest(self) -> dict:
+        return {'format': MANIFEST_FORMAT, 'shard_count': self.shard_count, 'generation': 0, 'next_seq': 0,
+                'shards': [None] * self.shard_count}
+
+    def _shard_path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # ———— Загрузка —————
+
+    def load_notes(self) -> List[Note]:
+        self.damaged = []
+        if not os.path.exists(self.file_path) and os.path.isdir(self.directory) \
+                and any(_SHARD_FILE_RE.match(name) for name in os.listdir(self.directory)):
+            # Манифест потерян, а части остались — восстанавливаем его по файлам
+            manifest = self._scan_manifest()
+            atomic_write(self.file_path, lambda f: json.dump(manifest, f, ensure_ascii=False, indent=2))
+        self._salvage = True
+        try:
+            return super().load_notes()
+        finally:
+            self._salvage = False
+
+    def _read_manifest(self) -> dict | None:
+        """Манифест с диска; None — его нет; ShardError — он повреждён."""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            raise ShardError(f"{MANIFEST_NAME}: {exc}") from exc
+        if not isinstance(manifest, dict) or manifest.get('format') != MANIFEST_FORMAT \
+                or len(manifest.get('shards') or ()) != manifest.get('shard_count'):
+            raise ShardError(f"{MANIFEST_NAME}: неизвестный формат")
+        return manifest
+
+    def _scan_manifest(self) -> dict:
+        """Манифест по файлам частей (последнее поколение каждой) — когда сам манифест повреждён."""
+        latest: Dict[int, tuple[int, str]] = {}
+        for name in os.listdir(self.directory):
+            match = _SHARD_FILE_RE.match(name)
+            if match:
+                index, generation = int(match.group(1), 16), int(match.group(2))
+                if index not in latest or latest[index][0] < generation:
+                    latest[index] = (generation, name)
+        count = max([self.shard_count] + [index + 1 for index in latest])
+        manifest = {'format': MANIFEST_FORMAT, 'shard_count': count,
+                    'generation': max((generation for generation, _ in latest.values()), default=0),
+                    'next_seq': 0, 'shards': [None] * count}
+        for index, (_, name) in latest.items():
+            # Контрольной суммы нет: проверкой остаётся разбор JSON
+            manifest['shards'][index] = {'file': name, 'sha256': None}
+        return manifest
+
+    def _read_snapshot(self) -> tuple[Dict[str, dict], bool]:
+        """
+        Все части, слитые по ``seq``. Второй элемент (как «legacy» у NoteStorage) —
+        хранилище нужно переписать целиком: манифест восстановлен по файлам,
+        часть отложена как повреждённая или изменилось число частей.
+        """
+        rewrite = False
+        for attempt in range(3):
+            try:
+                manifest = self._read_manifest()
+            except ShardError as exc:
+                if not self._salvage:
+                    raise
+                self._quarantine(self.file_path, str(exc))
+                manifest, rewrite = self._scan_manifest(), True
+            if manifest is None:
+                self._manifest = self._empty_manifest()
+                return {}, False
+            shards, failed = self._load_shards(manifest, range(manifest['shard_count']))
+            if failed:
+                # Другой процесс мог заменить часть между чтением манифеста и файла
+                try:
+                    if not rewrite and attempt < 2 and self._read_manifest() != manifest:
+                        continue
+                except ShardError:
+                    pass
+                if not self._salvage:
+                    raise ShardError("; ".join(failed.values()))
+                for index, reason in failed.items():
+                    self._quarantine(self._shard_path(manifest['shards'][index]['file']), reason)
+                rewrite = True
+            break
+        with metrics.span("storage.shards_merge", shards=len(shards)):
+            records = {record['id']: record for record in heapq.merge(*shards.values(), key=_seq)}
+        if records:
+            manifest['next_seq'] = max(manifest['next_seq'], max(map(_seq, records.values())) + 1)
+        self._manifest = manifest
+        # Части без контрольной суммы (манифест восстановлен по файлам) переписываются с ней
+        rewrite = rewrite or any(entry and entry.get('sha256') is None for entry in manifest['shards'])
+        return records, rewrite or manifest['shard_count'] != self.shard_count
+
+    def _load_shards(self, manifest: dict, indexes: Iterable[int]) -> tuple[Dict[int, List[dict]], Dict[int, str]]:
+        """Части ``indexes`` параллельно: (номер -> записи по возрастанию seq, номер -> причина ошибки)."""
+        jobs = {index: manifest['shards'][index] for index in indexes if manifest['shards'][index]}
+        shards: Dict[int, List[dict]] = {}
+        failed: Dict[int, str] = {}
+        if not jobs:
+            return shards, failed
+        pool_type = concurrent.futures.ProcessPoolExecutor if self.processes and len(jobs) > 1 \
+            else concurrent.futures.ThreadPoolExecutor
+        with metrics.span("storage.shards_load", shards=len(jobs), processes=self.processes) as span, \
+                pool_type(max_workers=min(self.workers, len(jobs))) as pool:
+            futures = {pool.submit(_read_shard, self._shard_path(entry['file']), entry.get('sha256')): index
+                       for index, entry in jobs.items()}
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                try:
+                    shards[index] = future.result()
+                except ShardError as exc:
+                    failed[index] = str(exc)
+            span.args["failed"] = len(failed)
+        return shards, failed
+
+    def _quarantine(self, path: str, reason: str) -> None:
+        """Откладывает повреждённый файл рядом (для ручного восстановления), а не удаляет его."""
+        target = path + ".corrupt"
+        try:
+            os.replace(path, target)
+        except FileNotFoundError:
+            target = path
+        self.damaged.append(f"{os.path.basename(target)}: {reason}")
+        metrics.count("storage.shards_damaged")
+
+    def _snapshot_packed(self) -> bool:
+        return self._manifest.get('framing') == "lzma"
+
+    # ———— Запись —————
+
+    def _write_snapshot(self, records: Iterable[dict]) -> None:
+        """Полная запись: порядок ``records`` становится порядком seq; совпадающие части не переписываются."""
+        shards: Dict[int, List[dict]] = {index: [] for index in range(self.shard_count)}
+        seq = 0
+        for record in records:
+            shards[shard_of(record['id'], self.shard_count)].append(dict(record, seq=seq))
+            seq += 1
+        manifest = self._manifest
+        if manifest['shard_count'] != self.shard_count:
+            # Переразбиение: все старые файлы уходят, номера частей значат другое
+            manifest = dict(self._empty_manifest(), generation=manifest['generation'],
+                            obsolete=[entry['file'] for entry in manifest['shards'] if entry])
+        self._manifest = self._write_shards(manifest, shards, next_seq=seq)
+
+    def _write_shards(self, manifest: dict, shards: Dict[int, List[dict]], next_seq: int) -> dict:
+        """
+        Записывает изменившиеся части в файлы следующего поколения, затем манифест,
+        затем удаляет заменённые файлы. Возвращает новый манифест.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        generation = manifest['generation'] + 1
+        entries = list(manifest['shards'])
+        obsolete = list(manifest.get('obsolete', ()))
+        written = 0
+        for index, records in shards.items():
+            old = entries[index]
+            if not records:
+                if old:
+                    obsolete.append(old['file'])
+                entries[index] = None
+                continue
+            data = pack_file(json.dumps(records, ensure_ascii=False).encode('utf-8'), self.compression)
+            checksum = hashlib.sha256(data).hexdigest()
+            if old and old.get('sha256') == checksum:
+                continue
+            name = f"shard-{index:02x}.{generation}.json"
+            atomic_write(self._shard_path(name), lambda f: f.write(data), mode='wb')
+            if old:
+                obsolete.append(old['file'])
+            entries[index] = {'file': name, 'sha256': checksum, 'notes': len(records), 'bytes': len(data)}
+            written += 1
+        new_manifest = {'format': MANIFEST_FORMAT, 'shard_count': len(entries), 'generation': generation,
+                        'next_seq': next_seq, 'framing': "lzma" if self.compression == "lzma" else "none",
+                        'shards': entries}
+        atomic_write(self.file_path, lambda f: json.dump(new_manifest, f, ensure_ascii=False, indent=2))
+        for name in obsolete:
+            try:
+                os.remove(self._shard_path(name))
+            except FileNotFoundError:
+                pass
+        metrics.count("storage.shards_written", written)
+        return new_manifest
+
+    # ———— Компакция —————
+
+    def _journal_changes(self, path: str) -> tuple[Dict[str, dict], set]:
+        """
+        Итог журнала: (id -> последняя версия в порядке, в котором заметки займут
+        места в списке; id, удалённые хотя бы раз). Повторно созданная после удаления
+        заметка переезжает в конец — как при проигрывании журнала в ``load_notes``.
+        """
+        upserted: Dict[str, dict] = {}
+        deleted: set = set()
+        with open(path, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if entry.get('op') == 'upsert':
+                    note = entry.get('note') or {}
+                    if note.get('id'):
+                        upserted[note['id']] = note
+                elif entry.get('op') == 'delete':
+                    upserted.pop(entry.get('id'), None)
+                    deleted.add(entry.get('id'))
+        return upserted, deleted
+
+    def _compact_rotated(self) -> None:
+        with self._lock:
+            unchanged = self._files_unchanged()
+        upserted, deleted = self._journal_changes(self._rotated_journal_path)
+        manifest = self._read_manifest() or self._empty_manifest()
+        count = manifest['shard_count']
+        dirty = {shard_of(note_id, count) for note_id in upserted.keys() | deleted}
+        loaded, failed = self._load_shards(manifest, dirty)
+        if failed:
+            # Части не откладываем — это сделает следующая загрузка; записи для них
+            # остаются в .old, и следующая компакция вернёт их в журнал и попробует снова
+            # Причина уже начинается с имени файла; повторные компакции её не дублируют
+            self.damaged.extend(reason for reason in failed.values() if reason not in self.damaged)
+            metrics.count("storage.shards_damaged", len(failed))
+            self._keep_rotated_entries(lambda note_id: shard_of(note_id, count) in failed)
+            dirty -= failed.keys()
+            upserted = {note_id: note for note_id, note in upserted.items() if shard_of(note_id, count) in dirty}
+            deleted = {note_id for note_id in deleted if shard_of(note_id, count) in dirty}
+        shards = {index: {record['id']: record for record in loaded.get(index, ())} for index in dirty}
+        for note_id in deleted:
+            shards[shard_of(note_id, count)].pop(note_id, None)
+        next_seq = manifest['next_seq']
+        for note_id, note in upserted.items():
+            shard = shards[shard_of(note_id, count)]
+            current = shard.get(note_id)
+            if current is None or note_id in deleted:
+                seq, next_seq = next_seq, next_seq + 1
+            else:
+                seq = current['seq']
+            shard[note_id] = dict(note, seq=seq)
+        with metrics.span("storage.shards_compact", dirty=len(dirty), shards=count):
+            manifest = self._write_shards(
+                manifest, {index: sorted(shard.values(), key=_seq) for index, shard in shards.items()}, next_seq
+            )
+        if not failed:
+            os.remove(self._rotated_journal_path)
+        with self._lock:
+            self._manifest = manifest
+            if unchanged:
+                # Манифест и части теперь содержат то же, что манифест + .old, — это не чужое изменение
+                self._fingerprints[self.file_path] = file_fingerprint(self.file_path)
+                self._fingerprints[self._rotated_journal_path] = file_fingerprint(self._rotated_journal_path)
+
+    def _keep_rotated_entries(self, keep: Callable[[str], bool]) -> None:
+        """Оставляет в .old только записи заметок, для которых ``keep(id)`` истинно (порядок сохраняется)."""
+        kept = []
+        with open(self._rotated_journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                note_id = (entry.get('note') or {}).get('id') if entry.get('op') == 'upsert' else entry.get('id')
+                if note_id and keep(note_id):
+                    # Файл потом допишется перед журналом — каждая запись с переводом строки
+                    kept.append(line if line.endswith(b"\n") else line + b"\n")
+        atomic_write(self._rotated_journal_path, lambda f: f.writelines(kept), mode='wb')
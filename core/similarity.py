@@ -0,0 +1,398 @@
+import heapq
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+import numpy as np
+from core.models import Note
+from core.search_index import tokenize
+
+# Сколько самых весомых термов заметки попадает в её вектор TF-IDF
+TOP_TERMS = 64
+# Термы заголовка и тегов считаются повторёнными: они описывают тему точнее тела
+TITLE_BOOST, TAGS_BOOST = 3, 2
+# Сколько изменённых заметок копится вне основной матрицы, прежде чем она пересобирается
+MERGE_THRESHOLD = 512
+# Сколько постингов одного терма (самых весомых) просматривает запрос
+MAX_POSTINGS_PER_TERM = 2000
+# Почти-дубликаты ищутся по шинглам из стольких слов тела и символов заголовка
+BODY_SHINGLE_WORDS = 3
+TITLE_SHINGLE_CHARS = 3
+# Почти-дубликат: оценка Жаккара по шинглам тела не ниже этой
+DUPLICATE_THRESHOLD = 0.8
+# Тема запроса уже есть в заметках, если так похож заголовок (Жаккар по триграммам)
+# или текст заметки близок к запросу (косинус TF-IDF)
+TITLE_DUPLICATE_THRESHOLD = 0.7
+QUERY_SIMILARITY_THRESHOLD = 0.5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = 0xFFFFFFFF
+_SHINGLE_MULTIPLIER = np.uint64(1_000_003)
+
+
+@dataclass
+class SimilarNote:
+    note_id: str
+    # Косинус TF-IDF или оценка коэффициента Жаккара по MinHash, от 0 до 1
+    score: float
+
+
+def _hashes(items: Iterable[str], count: int) -> np.ndarray:
+    # Подписи живут только в памяти процесса, поэтому хватает встроенного hash
+    return np.fromiter(map(hash, items), dtype=np.int64, count=count).view(np.uint64) & np.uint64(_MAX_HASH)
+
+
+def body_shingles(tokens: List[str]) -> np.ndarray:
+    """Уникальные хэши шинглов тела — по ``BODY_SHINGLE_WORDS`` слов подряд."""
+    hashes = _hashes(tokens, len(tokens))
+    if len(tokens) >= BODY_SHINGLE_WORDS:
+        # Хэш шингла собирается из хэшей слов, без склейки строк
+        n = len(tokens) - BODY_SHINGLE_WORDS + 1
+        combined = hashes[:n].copy()
+        for i in range(1, BODY_SHINGLE_WORDS):
+            combined = combined * _SHINGLE_MULTIPLIER + hashes[i:i + n]
+        hashes = combined & np.uint64(_MAX_HASH)
+    return np.unique(hashes)
+
+
+def title_shingles(title: str) -> np.ndarray:
+    """Уникальные хэши символьных триграмм заголовка (без учёта регистра и пунктуации)."""
+    text = f" {' '.join(tokenize(title))} "
+    if len(text) <= TITLE_SHINGLE_CHARS:
+        return np.zeros(0, dtype=np.uint64)
+    grams = {text[i:i + TITLE_SHINGLE_CHARS] for i in range(len(text) - TITLE_SHINGLE_CHARS + 1)}
+    return _hashes(grams, len(grams))
+
+
+class MinHashLSH:
+    """
+    MinHash-подписи множеств шинглов (заданных хэшами) и LSH по полосам:
+    подпись режется на ``bands`` полос, заметки с совпавшей полосой попадают
+    в кандидаты, а сходство кандидата оценивается долей совпавших позиций
+    подписи (≈ коэффициент Жаккара).
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        rng = np.random.default_rng(seed)
+        # a, b < 2^32 и хэш < 2^32: a * h + b помещается в uint64 без переполнения
+        self._a = rng.integers(1, _MAX_HASH, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_HASH, num_perm, dtype=np.uint64)
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray | None:
+        if not len(shingles):
+            return None
+        permuted = (np.multiply.outer(self._a, shingles) + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return (permuted & np.uint64(_MAX_HASH)).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        rows = self._rows
+        return ((band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands))
+
+    def add(self, key: str, shingles: np.ndarray) -> None:
+        self.remove(key)
+        signature = self.signature(shingles)
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, shingles: np.ndarray, threshold: float, exclude: str | None = None) -> List[SimilarNote]:
+        signature = self.signature(shingles)
+        if signature is None:
+            return []
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        candidates.discard(exclude)
+        found = []
+        for key in candidates:
+            score = float(np.count_nonzero(self._signatures[key] == signature)) / len(signature)
+            if score >= threshold:
+                found.append(SimilarNote(key, score))
+        found.sort(key=lambda match: match.score, reverse=True)
+        return found
+
+
+class SimilarityIndex:
+    """
+    Локальный поиск похожих заметок без обращения к API.
+
+    - «Похожие заметки»: косинус векторов TF-IDF. У каждой заметки остаются
+      ``TOP_TERMS`` самых весомых термов; векторы лежат разреженной матрицей
+      в разрезе термов (постинги: строки заметок и веса в массивах NumPy),
+      так что запрос — это сумма постингов своих термов через ``np.bincount``.
+    - Почти-дубликаты: MinHash + LSH по шинглам тела (повторные генерации)
+      и по символьным триграммам заголовка (запрос на уже знакомую тему).
+
+    Обновляется инкрементально: изменённые заметки копятся в небольшой
+    добавочной части и вливаются в матрицу пачкой (``MERGE_THRESHOLD``).
+    Частоты термов (df) при удалении не уменьшаются — небольшой дрейф IDF
+    исчезает при следующей полной сборке.
+    """
+
+    def __init__(self, top_terms: int = TOP_TERMS, merge_threshold: int = MERGE_THRESHOLD):
+        self.top_terms = top_terms
+        self.merge_threshold = merge_threshold
+        self._reset()
+
+    def _reset(self) -> None:
+        # терм -> номер; df — в скольких заметках встречался терм
+        self._vocabulary: Dict[str, int] = {}
+        self._df = array('i')
+        self._doc_count = 0
+        # Основная матрица: постинги терма t — _post_rows/_post_weights[_indptr[t]:_indptr[t + 1]]
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._post_rows = np.zeros(0, dtype=np.int32)
+        self._post_weights = np.zeros(0, dtype=np.float32)
+        self._row_ids: List[str] = []
+        self._base_rows: Dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        # Заметки, изменённые после сборки матрицы: note_id -> (термы, веса)
+        self._delta: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # Постинги добавочной части: терм -> [(note_id, вес)]; None — пересобрать
+        self._delta_postings: Dict[int, List[Tuple[str, float]]] | None = None
+        self._bodies = MinHashLSH(num_perm=64, bands=16)
+        self._titles = MinHashLSH(num_perm=64, bands=16)
+
+    def __len__(self) -> int:
+        return int(self._live.sum()) + len(self._delta)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._delta or (note_id in self._base_rows and self._live[self._base_rows[note_id]])
+
+    # ———— Векторы —————
+
+    @staticmethod
+    def _term_counts(note: Note, body_tokens: List[str]) -> Counter:
+        counts = Counter(body_tokens)
+        for token in tokenize(note.title):
+            counts[token] += TITLE_BOOST
+        for token in tokenize(" ".join(note.tags)):
+            counts[token] += TAGS_BOOST
+        return counts
+
+    def _idf(self, term_ids: np.ndarray) -> np.ndarray:
+        df = np.frombuffer(self._df, dtype=np.int32)[term_ids]
+        return np.log((1 + self._doc_count) / (1 + df)) + 1
+
+    def _register(self, counts: Counter, new_note: bool) -> None:
+        """Пополняет словарь; df растёт только для новой заметки — правки одной заметки его не раздувают."""
+        vocabulary = self._vocabulary
+        for term in counts:
+            term_id = vocabulary.get(term)
+            if term_id is None:
+                vocabulary[term] = term_id = len(vocabulary)
+                self._df.append(1)
+            elif new_note:
+                self._df[term_id] += 1
+
+    def _vector(self, counts: Counter) -> Tuple[np.ndarray, np.ndarray]:
+        """Нормированный вектор из ``top_terms`` самых весомых термов."""
+        vocabulary = self._vocabulary
+        # Терм, которого нет ни в одной заметке, ни с чем не совпадёт
+        items = [(vocabulary[term], tf) for term, tf in counts.items() if term in vocabulary]
+        if not items:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        term_ids = np.fromiter((term_id for term_id, _ in items), dtype=np.int32, count=len(items))
+        tf = np.fromiter((tf for _, tf in items), dtype=np.float32, count=len(items))
+        weights = (1 + np.log(tf)) * self._idf(term_ids)
+        if len(items) > self.top_terms:
+            keep = np.argpartition(-weights, self.top_terms)[:self.top_terms]
+            term_ids, weights = term_ids[keep], weights[keep]
+        weights /= np.linalg.norm(weights)
+        return term_ids, weights.astype(np.float32)
+
+    # ———— Обновление индекса —————
+
+    def rebuild(self, notes: Iterable[Note], body_text: Callable[[Note], str] | None = None) -> None:
+        """:param body_text: чем читать тело вместо ``note.body`` (например, минуя кэш тел хранилища)"""
+        self._reset()
+        vocabulary = self._vocabulary
+        # Первый проход: частоты термов всех заметок подряд в компактных массивах
+        terms, tfs, lengths = array('i'), array('f'), array('i')
+        for note in notes:
+            if note.id in self._base_rows:
+                continue
+            tokens = tokenize(note.body if body_text is None else body_text(note))
+            counts = self._term_counts(note, tokens)
+            for term in counts:
+                if term not in vocabulary:
+                    vocabulary[term] = len(vocabulary)
+            terms.extend(vocabulary[term] for term in counts)
+            tfs.extend(counts.values())
+            lengths.append(len(counts))
+            self._base_rows[note.id] = len(self._row_ids)
+            self._row_ids.append(note.id)
+            self._bodies.add(note.id, body_shingles(tokens))
+            self._titles.add(note.id, title_shingles(note.title))
+        n_docs = len(self._row_ids)
+        self._doc_count = n_docs
+        if not len(terms):
+            self._live = np.ones(n_docs, dtype=bool)
+            return
+        term_ids = np.frombuffer(terms, dtype=np.int32)
+        self._df = array('i', np.bincount(term_ids, minlength=len(vocabulary)).astype(np.int32).tobytes())
+        doc_rows = np.repeat(np.arange(n_docs, dtype=np.int32), np.frombuffer(lengths, dtype=np.int32))
+
+        # Второй проход целиком в NumPy: веса, top-k термов каждой заметки, нормировка
+        weights = (1 + np.log(np.frombuffer(tfs, dtype=np.float32))) * self._idf(term_ids)
+        order = np.lexsort((-weights, doc_rows))
+        doc_lengths = np.frombuffer(lengths, dtype=np.int32)
+        starts = np.concatenate(([0], np.cumsum(doc_lengths)[:-1]))
+        # Позиция терма среди термов своей заметки, отсортированных по убыванию веса
+        rank = np.arange(len(order)) - np.repeat(starts, doc_lengths)
+        keep = order[rank < self.top_terms]
+        self._set_matrix(doc_rows[keep], term_ids[keep], weights[keep], n_docs)
+
+    def _set_matrix(self, rows: np.ndarray, term_ids: np.ndarray, weights: np.ndarray, n_rows: int) -> None:
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_rows))
+        weights = (weights / np.maximum(norms, 1e-12)[rows]).astype(np.float32)
+        # Постинги терма — по убыванию веса: запрос берёт только самые весомые. Ключ сортировки —
+        # одно число (терм, обратный вес); при слиянии данные уже почти упорядочены, и устойчивая
+        # сортировка (timsort) проходит их почти за линейное время
+        inverted = ((1.0 - np.clip(weights, 0.0, 1.0)) * _MAX_HASH).astype(np.int64)
+        by_term = np.argsort((term_ids.astype(np.int64) << 32) | inverted, kind="stable")
+        self._post_rows = rows[by_term].astype(np.int32)
+        self._post_weights = weights[by_term]
+        counts = np.bincount(term_ids, minlength=len(self._vocabulary))
+        self._indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._live = np.ones(n_rows, dtype=bool)
+
+    def update(self, note: Note) -> None:
+        """Добавляет заметку в индекс или пересчитывает её вектор и подписи после изменения."""
+        new_note = note.id not in self
+        if new_note:
+            self._doc_count += 1
+        row = self._base_rows.get(note.id)
+        if row is not None:
+            self._live[row] = False
+        tokens = tokenize(note.body)
+        counts = self._term_counts(note, tokens)
+        self._register(counts, new_note)
+        self._delta[note.id] = self._vector(counts)
+        self._delta_postings = None
+        self._bodies.add(note.id, body_shingles(tokens))
+        self._titles.add(note.id, title_shingles(note.title))
+        if len(self._delta) >= self.merge_threshold:
+            self._merge()
+
+    def remove(self, note_id: str) -> None:
+        if note_id not in self:
+            return
+        self._doc_count -= 1
+        row = self._base_rows.get(note_id)
+        if row is not None:
+            self._live[row] = False
+        if self._delta.pop(note_id, None) is not None:
+            self._delta_postings = None
+        self._bodies.remove(note_id)
+        self._titles.remove(note_id)
+
+    def _merge(self) -> None:
+        """Вливает добавочную часть в матрицу, заодно выбрасывая строки удалённых заметок."""
+        # Постинги матрицы обратно в тройки (строка, терм, вес), без мёртвых строк
+        post_terms = np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr))
+        alive = self._live[self._post_rows]
+        new_row = np.cumsum(self._live) - 1
+        rows = [new_row[self._post_rows[alive]]]
+        terms, weights = [post_terms[alive]], [self._post_weights[alive]]
+        row_ids = [note_id for note_id, live in zip(self._row_ids, self._live) if live]
+        for note_id, (term_ids, vector) in self._delta.items():
+            rows.append(np.full(len(term_ids), len(row_ids), dtype=np.int64))
+            terms.append(term_ids)
+            weights.append(vector)
+            row_ids.append(note_id)
+        self._row_ids = row_ids
+        self._base_rows = {note_id: row for row, note_id in enumerate(row_ids)}
+        self._delta.clear()
+        self._delta_postings = None
+        # Векторы уже нормированы — _set_matrix нормирует их повторно без изменений
+        self._set_matrix(np.concatenate(rows).astype(np.int32), np.concatenate(terms),
+                         np.concatenate(weights), len(row_ids))
+
+    # ———— Запросы —————
+
+    def _scores(self, term_ids: np.ndarray, weights: np.ndarray, limit: int,
+                exclude: str | None) -> List[SimilarNote]:
+        found: List[Tuple[float, str]] = []
+        n_terms = len(self._indptr) - 1
+        in_matrix = term_ids < n_terms
+        base_terms, base_weights = term_ids[in_matrix], weights[in_matrix]
+        if len(base_terms) and len(self._row_ids):
+            starts = self._indptr[base_terms]
+            lengths = np.minimum(self._indptr[base_terms + 1] - starts, MAX_POSTINGS_PER_TERM)
+            total = int(lengths.sum())
+            if total:
+                # Номера постингов всех термов запроса одним массивом: starts[i] .. starts[i] + lengths[i]
+                offsets = np.cumsum(lengths) - lengths
+                positions = np.arange(total) + np.repeat(starts - offsets, lengths)
+                scores = np.bincount(self._post_rows[positions],
+                                     weights=self._post_weights[positions] * np.repeat(base_weights, lengths),
+                                     minlength=len(self._row_ids))
+                scores[~self._live] = 0
+                if exclude in self._base_rows:
+                    scores[self._base_rows[exclude]] = 0
+                k = min(limit, len(scores))
+                top = np.argpartition(-scores, k - 1)[:k]
+                found.extend((float(scores[row]), self._row_ids[row]) for row in top if scores[row] > 0)
+        if self._delta:
+            if self._delta_postings is None:
+                self._delta_postings = {}
+                for note_id, (delta_terms, vector) in self._delta.items():
+                    for term_id, weight in zip(delta_terms.tolist(), vector.tolist()):
+                        self._delta_postings.setdefault(term_id, []).append((note_id, weight))
+            delta_scores: Dict[str, float] = {}
+            for term_id, weight in zip(term_ids.tolist(), weights.tolist()):
+                for note_id, doc_weight in self._delta_postings.get(term_id, ()):
+                    delta_scores[note_id] = delta_scores.get(note_id, 0.0) + weight * doc_weight
+            delta_scores.pop(exclude, None)
+            found.extend((score, note_id) for note_id, score in delta_scores.items())
+        return [SimilarNote(note_id, min(1.0, score)) for score, note_id in heapq.nlargest(limit, found)]
+
+    def related(self, note: Note, limit: int = 10) -> List[SimilarNote]:
+        """Заметки, близкие к ``note`` по TF-IDF (сама заметка исключается)."""
+        term_ids, weights = self._vector(self._term_counts(note, tokenize(note.body)))
+        return self._scores(term_ids, weights, limit, exclude=note.id)
+
+    def similar_to_text(self, text: str, limit: int = 10) -> List[SimilarNote]:
+        """Заметки, близкие к произвольному тексту (например, запросу генерации)."""
+        term_ids, weights = self._vector(Counter(tokenize(text)))
+        return self._scores(term_ids, weights, limit, exclude=None)
+
+    def duplicates_of(self, note: Note, threshold: float = DUPLICATE_THRESHOLD) -> List[SimilarNote]:
+        """Заметки с почти тем же телом (оценка Жаккара по шинглам не ниже ``threshold``)."""
+        return self._bodies.query(body_shingles(tokenize(note.body)), threshold, exclude=note.id)
+
+    def similar_titles(self, text: str, threshold: float = TITLE_DUPLICATE_THRESHOLD) -> List[SimilarNote]:
+        """Заметки с почти тем же заголовком — запрос на уже знакомую тему."""
+        return self._titles.query(title_shingles(text), threshold)
+
+    def existing_for_query(self, query: str, limit: int = 5) -> List[SimilarNote]:
+        """Заметки, которые, похоже, уже раскрывают тему запроса генерации (лучшие — первыми)."""
+        scores = {match.note_id: match.score for match in self.similar_titles(query)}
+        for match in self.similar_to_text(query, limit=limit):
+            if match.score >= QUERY_SIMILARITY_THRESHOLD:
+                scores[match.note_id] = max(scores.get(match.note_id, 0.0), match.score)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [SimilarNote(note_id, score) for note_id, score in best]
@@ -0,0 +1,281 @@
+import os
+import re
+import sqlite3
+import sys
+import threading
+from typing import Dict, List
+from core.models import Note
+from core.metrics import metrics
+from core.storage import BaseNoteStorage, ExternalChanges, NoteStorage, DEFAULT_COMMIT_LATENCY
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Веса колонок FTS5 для bm25(): title, body, tags
+FTS_WEIGHTS = (3.0, 1.0, 2.0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id       TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    title    TEXT NOT NULL,
+    body     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_position ON notes(position);
+CREATE TABLE IF NOT EXISTS tags (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS note_tags (
+    note_id TEXT NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+    tag_id  INTEGER NOT NULL REFERENCES tags(id),
+    ord     INTEGER NOT NULL,
+    PRIMARY KEY (note_id, tag_id)
+);
+CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags(tag_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    title, body, tags, note_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+);
+-- Журнал изменённых заметок: другие экземпляры программы читают из него только новое
+CREATE TABLE IF NOT EXISTS note_changes (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    note_id TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS notes_changed_insert AFTER INSERT ON notes
+BEGIN INSERT INTO note_changes(note_id) VALUES (new.id); END;
+CREATE TRIGGER IF NOT EXISTS notes_changed_update AFTER UPDATE ON notes
+BEGIN INSERT INTO note_changes(note_id) VALUES (new.id); END;
+CREATE TRIGGER IF NOT EXISTS notes_changed_delete AFTER DELETE ON notes
+BEGIN INSERT INTO note_changes(note_id) VALUES (old.id); END;
+"""
+
+# Сколько последних записей журнала изменений хранить; отставший сильнее экземпляр
+# перечитывает базу целиком
+CHANGE_LOG_KEEP = 10000
+# Сколько id подставлять в один запрос «WHERE id IN (...)»
+_ID_CHUNK = 500
+
+# Параметризованные запросы — sqlite3 держит их скомпилированными в кэше соединения
+_SQL_UPSERT_NOTE = (
+    "INSERT INTO notes(id, position, title, body) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET title = excluded.title, body = excluded.body"
+)
+_SQL_DELETE_NOTE = "DELETE FROM notes WHERE id = ?"
+_SQL_DELETE_NOTE_TAGS = "DELETE FROM note_tags WHERE note_id = ?"
+_SQL_INSERT_TAG = "INSERT OR IGNORE INTO tags(name) VALUES (?)"
+_SQL_TAG_ID = "SELECT id FROM tags WHERE name = ?"
+_SQL_INSERT_NOTE_TAG = "INSERT OR IGNORE INTO note_tags(note_id, tag_id, ord) VALUES (?, ?, ?)"
+# Строка FTS имеет тот же rowid, что и строка notes: note_id в FTS не индексирован,
+# и удаление по нему просматривало бы всю таблицу
+_SQL_DELETE_FTS = "DELETE FROM notes_fts WHERE rowid = (SELECT rowid FROM notes WHERE id = ?)"
+_SQL_INSERT_FTS = (
+    "INSERT INTO notes_fts(rowid, title, body, tags, note_id) "
+    "VALUES ((SELECT rowid FROM notes WHERE id = ?), ?, ?, ?, ?)"
+)
+_SQL_NEXT_POSITION = "SELECT COALESCE(MAX(position), -1) + 1 FROM notes"
+_SQL_LAST_CHANGE = "SELECT COALESCE(MAX(seq), 0) FROM note_changes"
+_SQL_TRIM_CHANGES = "DELETE FROM note_changes WHERE seq <= (SELECT MAX(seq) FROM note_changes) - ?"
+_SQL_SEARCH = (
+    "SELECT note_id FROM notes_fts WHERE notes_fts MATCH ? "
+    "ORDER BY bm25(notes_fts, ?, ?, ?) LIMIT ?"
+)
+
+
+def fts_query(text: str) -> str:
+    """
+    Превращает пользовательский запрос в выражение FTS5: слова через OR,
+    последнее — префиксом (его ещё набирают). Кавычки защищают от синтаксиса FTS.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words[:-1]]
+    terms.append(f'"{words[-1]}"*')
+    return " OR ".join(terms)
+
+
+class SqliteNoteStorage(BaseNoteStorage):
+    """
+    Хранилище заметок в SQLite: таблица заметок, нормализованные теги,
+    полнотекстовый индекс FTS5 по заголовку/телу/тегам, режим WAL.
+    Каждое изменение — точечная запись строк, без перезаписи всего файла.
+    """
+    supports_search = True
+
+    def __init__(self, db_path: str, commit_latency: float = DEFAULT_COMMIT_LATENCY):
+        super().__init__(commit_latency)
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Соединение используется и GUI-потоком (поиск), и писателем — под общим замком
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=64)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        # PRAGMA data_version меняется только после коммитов других соединений;
+        # _last_change — последняя учтённая запись журнала note_changes
+        self._data_version: int | None = None
+        self._last_change = 0
+
+    # ———— Загрузка —————
+
+    def load_notes(self) -> List[Note]:
+        with self._lock:
+            rows = self._read_rows()
+            if self.track_changes:
+                self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                self._last_change = self._conn.execute(_SQL_LAST_CHANGE).fetchone()[0]
+        if self.track_changes:
+            self._remember_records({note_id: {'title': title, 'body': body, 'tags': tags}
+                                    for note_id, title, body, tags in rows}, replace=True)
+        return [Note(title=title, body=body, tags=tags, id=note_id) for note_id, title, body, tags in rows]
+
+    def _read_rows(self, note_ids: List[str] | None = None) -> List[tuple]:
+        """
+        (id, заголовок, тело, теги) заметок в порядке списка — всех или только
+        ``note_ids`` (вызывать под ``_lock``).
+        """
+        tags: Dict[str, List[str]] = {}
+        if note_ids is None:
+            tag_rows = self._conn.execute(
+                "SELECT nt.note_id, t.name FROM note_tags nt JOIN tags t ON t.id = nt.tag_id "
+                "ORDER BY nt.note_id, nt.ord"
+            ).fetchall()
+            rows = self._conn.execute("SELECT id, title, body FROM notes ORDER BY position").fetchall()
+        else:
+            tag_rows, rows = [], []
+            for start in range(0, len(note_ids), _ID_CHUNK):
+                chunk = note_ids[start:start + _ID_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                tag_rows += self._conn.execute(
+                    "SELECT nt.note_id, t.name FROM note_tags nt JOIN tags t ON t.id = nt.tag_id "
+                    f"WHERE nt.note_id IN ({marks}) ORDER BY nt.note_id, nt.ord", chunk
+                ).fetchall()
+                rows += self._conn.execute(
+                    f"SELECT position, id, title, body FROM notes WHERE id IN ({marks})", chunk
+                ).fetchall()
+            rows = [row[1:] for row in sorted(rows)]
+        for note_id, name in tag_rows:
+            tags.setdefault(note_id, []).append(name)
+        return [(note_id, title, body, tags.get(note_id, [])) for note_id, title, body in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    # ———— Запись —————
+
+    def _commit_batch(self, entries: List[dict]) -> None:
+        with self._lock, self._conn:
+            position = self._conn.execute(_SQL_NEXT_POSITION).fetchone()[0]
+            for entry in entries:
+                if entry['op'] == 'upsert':
+                    self._upsert(entry['note'], position)
+                    position += 1
+                elif entry['op'] == 'delete':
+                    self._delete(entry['id'])
+            self._conn.execute(_SQL_TRIM_CHANGES, (CHANGE_LOG_KEEP,))
+        self._remember_entries(entries)
+
+    def _upsert(self, note: dict, position: int) -> None:
+        conn = self._conn
+        note_id, tags = note['id'], note.get('tags', [])
+        conn.execute(_SQL_DELETE_FTS, (note_id,))
+        conn.execute(_SQL_UPSERT_NOTE, (note_id, position, note['title'], note['body']))
+        conn.execute(_SQL_DELETE_NOTE_TAGS, (note_id,))
+        for ord_, name in enumerate(tags):
+            conn.execute(_SQL_INSERT_TAG, (name,))
+            tag_id = conn.execute(_SQL_TAG_ID, (name,)).fetchone()[0]
+            conn.execute(_SQL_INSERT_NOTE_TAG, (note_id, tag_id, ord_))
+        conn.execute(_SQL_INSERT_FTS, (note_id, note['title'], note['body'], " ".join(tags), note_id))
+
+    def _delete(self, note_id: str) -> None:
+        # FTS — первой: её строка находится по rowid ещё существующей заметки
+        self._conn.execute(_SQL_DELETE_FTS, (note_id,))
+        self._conn.execute(_SQL_DELETE_NOTE_TAGS, (note_id,))
+        self._conn.execute(_SQL_DELETE_NOTE, (note_id,))
+
+    def save_notes(self, notes: List[Note]) -> None:
+        self.flush()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM note_tags")
+            self._conn.execute("DELETE FROM notes")
+            self._conn.execute("DELETE FROM notes_fts")
+            records = [note.to_dict() for note in notes]
+            for position, record in enumerate(records):
+                self._upsert(record, position)
+        self._remember_records({record['id']: record for record in records}, replace=True)
+
+    # ———— Изменения, сделанные другими процессами —————
+
+    def watch_paths(self) -> List[str]:
+        return [self.db_path, self.db_path + "-wal"]
+
+    def changed_on_disk(self) -> bool:
+        if not self._tracking:
+            return False
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version
+
+    def read_external_changes(self) -> ExternalChanges:
+        """
+        Перечитывает только заметки из журнала note_changes после последней
+        учтённой записи; если журнал уже обрезан дальше неё — всю базу.
+        """
+        if not self._tracking:
+            return ExternalChanges()
+        with self._lock, metrics.span("storage.read_external_changes") as span:
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            first, last = self._conn.execute("SELECT MIN(seq), MAX(seq) FROM note_changes").fetchone()
+            complete = first is None or first > self._last_change + 1
+            if complete:
+                rows = self._read_rows()
+            else:
+                changed = [note_id for (note_id,) in self._conn.execute(
+                    "SELECT DISTINCT note_id FROM note_changes WHERE seq > ?", (self._last_change,))]
+                rows = self._read_rows(changed)
+            self._last_change = last or 0
+            records: Dict[str, dict | None] = {} if complete else dict.fromkeys(changed)
+            records.update((note_id, {'id': note_id, 'title': title, 'body': body, 'tags': tags})
+                           for note_id, title, body, tags in rows)
+            changes = self._diff_records(records, complete=complete)
+            span.args.update(complete=complete, upserted=len(changes.upserted), deleted=len(changes.deleted))
+        return changes
+
+    # ———— Поиск —————
+
+    def search(self, query: str, limit: int | None = None) -> List[str]:
+        match = fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(_SQL_SEARCH, (match, *FTS_WEIGHTS, -1 if limit is None else limit))
+            return [note_id for (note_id,) in rows]
+
+    def close(self) -> None:
+        super().close()
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_sqlite(json_path: str, db_path: str) -> int:
+    """Переносит заметки из notes.json (с журналом) в базу SQLite. Возвращает число заметок."""
+    source = NoteStorage(json_path)
+    notes = source.load_notes()
+    source.close()
+    target = SqliteNoteStorage(db_path)
+    target.save_notes(notes)
+    target.close()
+    return len(notes)
+
+
+if __name__ == "__main__":
+    # python -m core.sqlite_storage migrate data/notes.json data/notes.db
+    if len(sys.argv) != 4 or sys.argv[1] != "migrate":
+        print("Использование: python -m core.sqlite_storage migrate <notes.json> <notes.db>")
+        sys.exit(2)
+    count = migrate_json_to_sqlite(sys.argv[2], sys.argv[3])
+    print(f"Перенесено заметок: {count}")
@@ -1,43 +1,802 @@
 import json
 import os
-from typing import List
-from core.models import Note
-from dataclasses import asdict
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List
+from core.models import Note, new_note_id
+from core.metrics import metrics
+from core.compression import (
+    COMPRESSION_MODES, MIN_TRAIN_NOTES, TRAIN_SAMPLE, XZ_MAGIC, BodyCodec, pack_file, train_dictionary, unpack_file
+)
 
-class NoteStorage:
+# Порог размера журнала (в байтах), после которого запускается фоновая компакция
+DEFAULT_COMPACT_THRESHOLD = 4 * 1024 * 1024
+# Сколько (в секундах) писатель копит изменения перед групповой фиксацией
+DEFAULT_COMMIT_LATENCY = 0.5
+# Пауза перед повтором неудавшейся фиксации: удваивается с каждой неудачей подряд
+RETRY_INITIAL_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+
+def _fsync_directory(directory: str) -> None:
+    # На POSIX переименование становится надёжным только после fsync каталога
+    if os.name != 'posix':
+        return
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_fingerprint(path: str) -> tuple | None:
+    """(inode, размер, mtime в нс) файла или None, если файла нет — дешёвая проверка «файл менялся»."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+@dataclass
+class ExternalChanges:
+    """Заметки, изменённые или удалённые в хранилище другим процессом."""
+    upserted: List[Note] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.upserted or self.deleted)
+
+
+def atomic_write(path: str, write: Callable, mode: str = 'w') -> None:
     """
-    Отвечает за загрузку и сохранение списка заметок в JSON-файл.
+    Записывает файл через временный файл в том же каталоге + fsync + rename,
+    чтобы при сбое на диске оставалась либо старая, либо новая версия целиком.
     """
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+    directory = os.path.dirname(path)
+    encoding = None if 'b' in mode else 'utf-8'
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory or '.')
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+            written = os.fstat(f.fileno()).st_size
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+    metrics.observe("storage.bytes_written", written, "B")
+
+
+class StorageWriter(threading.Thread):
+    """
+    Фоновый поток записи. Принимает «грязные» записи от GUI-потока,
+    схлопывает повторные изменения одной заметки и фиксирует их пачкой
+    не позже чем через ``max_latency`` секунд после первого изменения.
+
+    Если фиксация не удалась, пачка возвращается в очередь (кроме заметок,
+    которые успели изменить ещё раз, — их новая версия уже ждёт записи)
+    и повторяется с нарастающей паузой. Об ошибке сразу сообщает
+    ``on_error`` — он вызывается из потока писателя.
+    """
+    def __init__(self, commit: Callable[[List[dict]], None], max_latency: float = DEFAULT_COMMIT_LATENCY,
+                 on_error: Callable[[BaseException], None] | None = None):
+        super().__init__(name="NoteStorageWriter", daemon=True)
+        self._commit = commit
+        self.max_latency = max_latency
+        self.on_error = on_error
+        self._cond = threading.Condition()
+        self._pending: Dict[str, dict] = {}
+        self._first_dirty_at: float | None = None
+        self._in_flight = False
+        self._flush_requested = False
+        self._closed = False
+        # Неудачных фиксаций подряд и момент, раньше которого не повторять
+        self._failures = 0
+        self._retry_at: float | None = None
+        # Всего неудачных фиксаций — по нему flush замечает новую ошибку
+        self._failed_commits = 0
+        self.last_error: BaseException | None = None
+
+    def submit(self, key: str, entry: dict) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("NoteStorageWriter уже остановлен")
+            # Более новое изменение той же заметки заменяет старое
+            self._pending.pop(key, None)
+            self._pending[key] = entry
+            if self._first_dirty_at is None:
+                self._first_dirty_at = time.monotonic()
+            self._cond.notify_all()
+
+    def flush(self) -> None:
+        """
+        Блокирует вызывающий поток, пока все накопленные изменения не записаны.
+        Если фиксация не удалась, бросает её ошибку; изменения остаются в очереди.
+        """
+        with self._cond:
+            self._flush_requested = True
+            # flush не ждёт паузы перед повтором: пробуем записать сразу
+            self._retry_at = None
+            self._cond.notify_all()
+            # Первая же неудача после запроса прерывает ожидание — иначе оно было бы вечным
+            failed_before = self._failed_commits
+            while (self._pending or self._in_flight) and self._failed_commits == failed_before:
+                self._cond.wait()
+            self._flush_requested = False
+            error, self.last_error = self.last_error, None
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join()
+        if self.last_error is not None:
+            error, self.last_error = self.last_error, None
+            raise error
+
+    def run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # Групповая фиксация: ждём остаток окна, если никто не просит flush;
+                # после неудачи — паузу перед повтором
+                while not self._closed and (self._retry_at is not None or not self._flush_requested):
+                    if self._retry_at is not None:
+                        deadline = self._retry_at
+                    else:
+                        deadline = self._first_dirty_at + self.max_latency
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = dict(self._pending)
+                self._pending.clear()
+                self._first_dirty_at = None
+                self._in_flight = True
+            try:
+                with metrics.span("storage.commit", entries=len(batch)):
+                    self._commit(list(batch.values()))
+            except BaseException as exc:
+                self._requeue(batch, exc)
+                if self.on_error is not None:
+                    self.on_error(exc)
+            else:
+                with self._cond:
+                    self._failures = 0
+                    self._retry_at = None
+                    self.last_error = None
+            finally:
+                with self._cond:
+                    self._in_flight = False
+                    self._cond.notify_all()
+            with self._cond:
+                # При остановке не повторяем: непринятые записи и ошибка достаются close()
+                if self._closed and self.last_error is not None:
+                    return
+
+    def _requeue(self, batch: Dict[str, dict], exc: BaseException) -> None:
+        with self._cond:
+            metrics.count("storage.commit_failures")
+            # Заметки, изменённые во время фиксации, уже ждут в очереди в новой версии
+            newer, self._pending = self._pending, {}
+            for key, entry in batch.items():
+                if key not in newer:
+                    self._pending[key] = entry
+            self._pending.update(newer)
+            if self._first_dirty_at is None:
+                self._first_dirty_at = time.monotonic()
+            self._failures += 1
+            self._failed_commits += 1
+            delay = min(RETRY_INITIAL_DELAY * 2 ** (self._failures - 1), RETRY_MAX_DELAY)
+            self._retry_at = time.monotonic() + delay
+            self.last_error = exc
+
+
+class BaseNoteStorage(ABC):
+    """
+    Общий интерфейс хранилищ заметок.
+
+    ``save_note`` / ``delete_note`` только ставят изменение в очередь
+    фонового писателя (:class:`StorageWriter`); конкретное хранилище
+    реализует ``_commit_batch`` — запись пачки upsert/delete — а также
+    ``load_notes`` и ``save_notes``. Перед выходом нужно вызвать ``close``.
+
+    Если ``track_changes`` включён до ``load_notes``, хранилище помнит, какими
+    заметки были на диске после его собственных чтений и записей, и
+    ``read_external_changes`` возвращает только чужие изменения (синхронизация,
+    второй экземпляр программы, скрипт).
+    """
+    # Умеет ли хранилище само искать заметки (см. ``search``)
+    supports_search = False
+    # Тела читаются с диска по требованию (LazyNote); индексы читают их через ``peek_body``
+    lazy_bodies = False
 
+    def __init__(self, commit_latency: float = DEFAULT_COMMIT_LATENCY):
+        self.commit_latency = commit_latency
+        self._writer: StorageWriter | None = None
+        # Вызывается из потока писателя при каждой неудачной фиксации (см. StorageWriter)
+        self.on_error: Callable[[BaseException], None] | None = None
+        self.track_changes = False
+        # note_id -> запись заметки или её хэш в том виде, в каком она на диске по мнению
+        # этого процесса; записи заменяются хэшами в start_change_tracking
+        self._disk_state: Dict[str, dict | int] = {}
+        self._state_lock = threading.Lock()
+        self._tracking = False
+        # Файлы, которые последняя загрузка не смогла прочитать и отложила (повреждённые части)
+        self.damaged: List[str] = []
+
+    @abstractmethod
     def load_notes(self) -> List[Note]:
+        """Прочитать все заметки в порядке списка."""
+
+    @abstractmethod
+    def save_notes(self, notes: List[Note]) -> None:
+        """Полностью заменить содержимое хранилища."""
+
+    def search(self, query: str, limit: int | None = None) -> List[str]:
+        """id заметок по убыванию релевантности (только если ``supports_search``)."""
+        raise NotImplementedError(
+            f"{type(self).__name__} не умеет искать сам (supports_search = False) — "
+            "ищите по SearchIndex в памяти")
+
+    @abstractmethod
+    def _commit_batch(self, entries: List[dict]) -> None:
+        """Записать пачку upsert/delete из очереди писателя (вызывается фоновым потоком)."""
+
+    def save_note(self, note: Note) -> None:
+        """
+        Ставит актуальную версию заметки в очередь записи.
+        Копия данных снимается сразу, сама запись выполняется фоновым потоком.
+        """
+        self._submit(note.id, self._upsert_entry(note))
+
+    def _upsert_entry(self, note: Note) -> dict:
+        """Запись upsert для ``_commit_batch`` со снятой копией данных заметки."""
+        return {'op': 'upsert', 'note': note.to_dict()}
+
+    def append_notes(self, notes: Iterable[Note], batch_size: int = 1000) -> int:
+        """
+        Массово дописывает заметки (импорт) пачками по ``batch_size`` прямо
+        в вызывающем потоке, минуя очередь писателя. В памяти одновременно
+        держится только одна пачка. Возвращает число записанных заметок.
+        """
+        self.flush()
+        count = 0
+        batch: List[dict] = []
+        for note in notes:
+            batch.append(self._upsert_entry(note))
+            if len(batch) >= batch_size:
+                self._commit_batch(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._commit_batch(batch)
+            count += len(batch)
+        return count
+
+    def delete_note(self, note_id: str) -> None:
+        """Ставит удаление заметки в очередь записи."""
+        self._submit(note_id, {'op': 'delete', 'id': note_id})
+
+    def _submit(self, note_id: str, entry: dict) -> None:
+        if self._writer is None:
+            self._writer = StorageWriter(self._commit_batch, self.commit_latency, self.on_error)
+            self._writer.start()
+        self._writer.submit(note_id, entry)
+
+    def flush(self) -> None:
+        """Дожидается записи всех изменений, поставленных в очередь."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self) -> None:
+        """Записывает накопленные изменения и останавливает фоновые потоки."""
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.close()
+
+    def peek_body(self, note: Note) -> str:
+        """Тело заметки для построения индексов в фоне."""
+        return note.body
+
+    # ———— Изменения, сделанные другими процессами —————
+
+    def watch_paths(self) -> List[str]:
+        """Файлы, изменение которых означает, что хранилище могли изменить извне."""
+        return []
+
+    def start_change_tracking(self) -> None:
+        """
+        Включить отслеживание чужих изменений (после ``load_notes``). Хэширует
+        запомненные при загрузке записи — это проход по всем телам, поэтому
+        вызывается из фонового потока, когда запуск уже завершён.
+        """
+        with self._state_lock:
+            state = self._disk_state
+            for note_id, record in state.items():
+                if isinstance(record, dict):
+                    state[note_id] = self._record_hash(record)
+            self._tracking = True
+
+    def changed_on_disk(self) -> bool:
+        """Дешёвая проверка (без чтения заметок): не изменил ли хранилище кто-то другой."""
+        return False
+
+    def read_external_changes(self) -> ExternalChanges:
+        """Чужие изменения с прошлой проверки; можно вызывать из фонового потока."""
+        return ExternalChanges()
+
+    def _record_hash(self, record: dict) -> int:
+        return hash((record.get('title', ''), record.get('body', ''), tuple(record.get('tags', ()))))
+
+    def _remember_records(self, records: Dict[str, dict], replace: bool = False) -> None:
+        """Записи, которые этот процесс прочитал с диска или сам записал целиком."""
+        if not self.track_changes:
+            return
+        with self._state_lock:
+            if replace:
+                self._disk_state = {}
+            if self._tracking:
+                self._disk_state.update((note_id, self._record_hash(record)) for note_id, record in records.items())
+            else:
+                self._disk_state.update(records)
+
+    def _remember_entries(self, entries: List[dict]) -> None:
+        """Собственная пачка upsert/delete: эти изменения не считаются чужими."""
+        if not self.track_changes:
+            return
+        with self._state_lock:
+            for entry in entries:
+                if entry['op'] == 'upsert':
+                    record = entry['note']
+                    self._disk_state[record['id']] = self._record_hash(record) if self._tracking else record
+                else:
+                    self._disk_state.pop(entry['id'], None)
+
+    def _diff_records(self, records: Dict[str, dict | None], complete: bool) -> ExternalChanges:
+        """
+        Сравнить прочитанные с диска записи с запомненными. None — запись удалена;
+        ``complete`` — прочитано всё хранилище, и пропавшие заметки тоже удалены.
+        """
+        changes = ExternalChanges()
+        with self._state_lock:
+            state = self._disk_state
+            for note_id, record in records.items():
+                if record is None:
+                    if state.pop(note_id, None) is not None:
+                        changes.deleted.append(note_id)
+                    continue
+                digest = self._record_hash(record)
+                if state.get(note_id) != digest:
+                    state[note_id] = digest
+                    changes.upserted.append(self._note_from_record(record))
+            if complete:
+                for note_id in [note_id for note_id in state if note_id not in records]:
+                    del state[note_id]
+                    changes.deleted.append(note_id)
+        return changes
+
+    def _note_from_record(self, record: dict) -> Note:
+        return Note(title=record.get('title', ''), body=record.get('body', ''), tags=record.get('tags', []),
+                    id=record['id'])
+
+
+class NoteStorage(BaseNoteStorage):
+    """
+    Отвечает за загрузку и сохранение заметок в JSON.
+
+    Хранилище состоит из двух файлов:
+    - снимок (``notes.json``) — полный список заметок в прежнем формате;
+    - журнал (``notes.journal``) — построчные записи upsert/delete,
+      которые дописываются в конец при каждом изменении заметки.
+
+    При загрузке журнал проигрывается поверх снимка. Когда журнал
+    разрастается больше порога, он в фоне сворачивается в новый снимок.
+    Старый ``notes.json`` без журнала читается как обычно.
+
+    Запись в журнал выполняет отдельный поток (:class:`StorageWriter`),
+    поэтому ``save_note`` не ждёт диска. Перед выходом нужно вызвать ``close``.
+
+    ``compression`` (см. :mod:`core.compression`): ``zlib`` хранит тело каждой
+    заметки отдельным фреймом (поле ``bz``) со словарём, обученным на заметках
+    при полной перезаписи; ``lzma`` сжимает файл снимка целиком. Читаются
+    все варианты независимо от настройки; при её смене хранилище один раз
+    переписывается при загрузке.
+    """
+    def __init__(self, file_path: str, compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+                 commit_latency: float = DEFAULT_COMMIT_LATENCY, compression: str = "none"):
+        super().__init__(commit_latency)
+        if compression not in COMPRESSION_MODES:
+            raise ValueError(f"Неизвестный способ сжатия: {compression}")
+        self.file_path = file_path
+        self.journal_path = os.path.splitext(file_path)[0] + ".journal"
+        self.compression = compression
+        self.codec = BodyCodec(os.path.splitext(file_path)[0] + ".dicts")
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compactor: threading.Thread | None = None
+        # Какими файлы были после последнего собственного чтения или записи
+        # (см. file_fingerprint) и докуда журнал уже учтён
+        self._fingerprints: Dict[str, tuple | None] = {}
+        self._journal_offset = 0
+
+    @property
+    def _rotated_journal_path(self) -> str:
+        return self.journal_path + ".old"
+
+    def _ensure_directory(self) -> None:
         directory = os.path.dirname(self.file_path)
         if directory and not os.path.exists(directory):
             os.makedirs(directory, exist_ok=True)
 
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+    # ———— Загрузка —————
+
+    def load_notes(self) -> List[Note]:
+        self._ensure_directory()
+
+        if not os.path.exists(self.file_path) and not os.path.exists(self.journal_path):
+            with self._lock:
+                self._write_snapshot([])
+                self._adopt_files()
             return []
 
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        fingerprints = self._file_fingerprints()
+        records, legacy = self._read_snapshot()
+        self._replay_journal(self._rotated_journal_path, records)
+        offset = self._replay_journal(self.journal_path, records)
 
-        notes: List[Note] = []
-        for item in data:
-            title = item.get('title', '')
-            body = item.get('body', '')
-            tags = item.get('tags', [])  # <- вот эта строка
-            notes.append(Note(title=title, body=body, tags=tags))
+        notes = [self._note_from_record(item) for item in records.values()]
+        if legacy or self._encoding_outdated(records):
+            # Старый файл без идентификаторов: один раз переписываем его,
+            # чтобы записи журнала ссылались на стабильные id.
+            # Так же хранилище переходит на другой способ сжатия
+            self.save_notes(notes)
+        elif self.track_changes:
+            # Отпечатки сняты до чтения: если файл меняли во время загрузки, проверка это увидит
+            with self._lock:
+                self._fingerprints, self._journal_offset = fingerprints, offset
+            self._remember_records(records, replace=True)
         return notes
 
+    def _read_snapshot(self) -> tuple[Dict[str, dict], bool]:
+        records: Dict[str, dict] = {}
+        legacy = False
+        if not os.path.exists(self.file_path):
+            return records, legacy
+        with open(self.file_path, 'rb') as f:
+            data = json.loads(unpack_file(f.read()))
+        for item in data:
+            if not item.get('id'):
+                item['id'] = new_note_id()
+                legacy = True
+            records[item['id']] = item
+        return records, legacy
+
+    @classmethod
+    def _replay_journal(cls, path: str, records: Dict[str, dict | None], offset: int = 0,
+                        keep_deleted: bool = False) -> int:
+        """
+        Проигрывает журнал с байта ``offset`` поверх ``records``. ``keep_deleted`` —
+        удалённые заметки остаются в ``records`` со значением None.
+        Возвращает смещение конца последней полной строки.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if line.endswith(b'\n'):
+                    offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Недописанная строка после аварийного завершения — пропускаем
+                    continue
+                op = entry.get('op')
+                if op == 'upsert':
+                    note = entry.get('note') or {}
+                    if note.get('id'):
+                        records[note['id']] = note
+                elif op == 'delete':
+                    if keep_deleted:
+                        records[entry.get('id')] = None
+                    else:
+                        records.pop(entry.get('id'), None)
+        return offset
+
+    def _note_from_record(self, record: dict) -> Note:
+        if 'bz' in record:
+            return Note(title=record.get('title', ''), body=self.codec.decode(record['bz']),
+                        tags=record.get('tags', []), id=record['id'])
+        return super()._note_from_record(record)
+
+    def _record_hash(self, record: dict) -> int:
+        if 'bz' in record:
+            # Сравниваем записи в том виде, в каком они на диске, не распаковывая тела
+            return hash((record.get('title', ''), record['bz'], tuple(record.get('tags', ()))))
+        return super()._record_hash(record)
+
+    def _snapshot_packed(self) -> bool:
+        """Снимок сжат целиком (lzma)."""
+        try:
+            with open(self.file_path, 'rb') as f:
+                return f.read(len(XZ_MAGIC)) == XZ_MAGIC
+        except FileNotFoundError:
+            return False
+
+    def _encoding_outdated(self, records: Dict[str, dict]) -> bool:
+        """Записи или снимок сжаты не так, как требует ``compression``."""
+        per_note = self.compression == "zlib"
+        if any(('body' if per_note else 'bz') in record for record in records.values()):
+            return True
+        return (self.compression == "lzma") != self._snapshot_packed()
+
+    # ———— Запись —————
+
+    def _encode_record(self, record: dict) -> dict:
+        """Запись с телом в виде zlib-фрейма, если включено сжатие zlib."""
+        if self.compression != "zlib" or 'body' not in record:
+            return record
+        encoded = {key: value for key, value in record.items() if key != 'body'}
+        encoded['bz'] = self.codec.encode(record['body'])
+        return encoded
+
+    def _commit_batch(self, entries: List[dict]) -> None:
+        self._ensure_directory()
+        if self.compression == "zlib":
+            # Сжатие — здесь, в потоке писателя, а не в save_note
+            entries = [dict(entry, note=self._encode_record(entry['note'])) if entry['op'] == 'upsert' else entry
+                       for entry in entries]
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with self._lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                start = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+                inode = os.fstat(f.fileno()).st_ino
+            if self.track_changes:
+                self._remember_entries(entries)
+                known = self._fingerprints.get(self.journal_path)
+                # Свою запись принимаем как известную, только если до неё в журнал никто не писал
+                if start == self._journal_offset and (known is None or known[0] == inode):
+                    self._journal_offset = size
+                    self._fingerprints[self.journal_path] = file_fingerprint(self.journal_path)
+        metrics.observe("storage.bytes_written", size - start, "B")
+        if size >= self.compact_threshold:
+            self.compact_in_background()
+
+    def close(self) -> None:
+        super().close()
+        self.wait_for_compaction()
+
     def save_notes(self, notes: List[Note]) -> None:
-        # Гарантируем существование директории
-        directory = os.path.dirname(self.file_path)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory, exist_ok=True)
+        """Полностью переписывает снимок и очищает журнал."""
+        self.flush()
+        self.wait_for_compaction()
+        self._ensure_directory()
+        records = [note.to_dict() for note in notes]
+        if self.compression == "zlib":
+            if len(records) >= MIN_TRAIN_NOTES:
+                # Полная перезапись — повод обучить словарь на текущих заметках
+                step = max(1, len(records) // TRAIN_SAMPLE)
+                self.codec.use(train_dictionary(record['body'] for record in records[::step]))
+            records = [self._encode_record(record) for record in records]
+        with self._lock:
+            self._write_snapshot(records)
+            for path in (self.journal_path, self._rotated_journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._adopt_files()
+        if self.compression == "zlib":
+            # Все записи теперь со свежим словарём — старые больше не нужны
+            self.codec.prune()
+        self._remember_records({record['id']: record for record in records}, replace=True)
+
+    def _write_snapshot(self, records: Iterable[dict]) -> None:
+        data = list(records)
+        if self.compression == "none":
+            atomic_write(self.file_path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2))
+            return
+        # Сжатый снимок всё равно не читается глазами — без отступов
+        payload = pack_file(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                            self.compression)
+        atomic_write(self.file_path, lambda f: f.write(payload), mode='wb')
+
+    # ———— Изменения, сделанные другими процессами —————
+
+    def watch_paths(self) -> List[str]:
+        return [self.file_path, self.journal_path]
+
+    def _file_fingerprints(self) -> Dict[str, tuple | None]:
+        return {path: file_fingerprint(path)
+                for path in (self.file_path, self._rotated_journal_path, self.journal_path)}
+
+    def _files_unchanged(self) -> bool:
+        """Файлы такие же, какими их последним видел этот процесс (вызывать под ``_lock``)."""
+        return all(self._fingerprints.get(path) == fingerprint
+                   for path, fingerprint in self._file_fingerprints().items())
+
+    def _adopt_files(self) -> None:
+        """Файлы только что целиком записаны этим процессом (вызывать под ``_lock``)."""
+        self._fingerprints = self._file_fingerprints()
+        self._journal_offset = (self._fingerprints[self.journal_path] or (0, 0))[1]
+
+    def changed_on_disk(self) -> bool:
+        if not self._tracking:
+            return False
+        with self._lock:
+            return not self._files_unchanged()
+
+    def read_external_changes(self) -> ExternalChanges:
+        """
+        Если снимок не менялся, а в журнал только дописали, читается лишь хвост
+        журнала; иначе (снимок заменили, журнал свернули) — всё хранилище,
+        но в результат попадают только заметки, отличающиеся от известных.
+        """
+        if not self._tracking:
+            return ExternalChanges()
+        with self._lock, metrics.span("storage.read_external_changes") as span:
+            current = self._file_fingerprints()
+            known = self._fingerprints
+            journal, known_journal = current[self.journal_path], known.get(self.journal_path)
+            appended = (
+                journal is not None
+                and all(current[path] == known.get(path) for path in (self.file_path, self._rotated_journal_path))
+                and (known_journal is None and self._journal_offset == 0
+                     or known_journal is not None and known_journal[0] == journal[0]
+                     and journal[1] >= self._journal_offset)
+            )
+            records: Dict[str, dict | None] = {}
+            if appended:
+                offset = self._replay_journal(self.journal_path, records, self._journal_offset, keep_deleted=True)
+            else:
+                try:
+                    records, _ = self._read_snapshot()
+                except (OSError, ValueError):
+                    # Снимок сейчас переписывают не атомарно — прочитаем при следующей проверке
+                    return ExternalChanges()
+                self._replay_journal(self._rotated_journal_path, records)
+                offset = self._replay_journal(self.journal_path, records)
+            self._fingerprints, self._journal_offset = current, offset
+            changes = self._diff_records(records, complete=not appended)
+            span.args.update(tail=appended, upserted=len(changes.upserted), deleted=len(changes.deleted))
+        return changes
+
+    # ———— Компакция —————
+
+    def compact_in_background(self) -> None:
+        """
+        Сворачивает журнал в новый снимок в отдельном потоке.
+        Текущий журнал переименовывается, новые записи идут в свежий файл.
+        """
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            if os.path.exists(self._rotated_journal_path):
+                # Прошлая компакция не свернула .old целиком — его записи снова идут в работу
+                self._fold_rotated_journal()
+            if not os.path.exists(self.journal_path):
+                return
+            unchanged = self._files_unchanged()
+            os.replace(self.journal_path, self._rotated_journal_path)
+            if unchanged:
+                # Переименование сохраняет inode и mtime: отпечаток переходит к .old
+                self._fingerprints[self._rotated_journal_path] = self._fingerprints.get(self.journal_path)
+                self._fingerprints[self.journal_path] = None
+                self._journal_offset = 0
+            self._compactor = threading.Thread(
+                target=self._compact_rotated, name="NoteStorageCompactor", daemon=True
+            )
+            self._compactor.start()
+
+    def _fold_rotated_journal(self) -> None:
+        """Возвращает записи .old в начало журнала (вызывать под ``_lock``)."""
+        unchanged = self._files_unchanged()
+
+        def write(f):
+            for path in (self._rotated_journal_path, self.journal_path):
+                if os.path.exists(path):
+                    with open(path, 'rb') as src:
+                        shutil.copyfileobj(src, f)
+
+        atomic_write(self.journal_path, write, mode='wb')
+        os.remove(self._rotated_journal_path)
+        if unchanged:
+            # Записи те же, только переехали из .old в журнал, — это не чужое изменение
+            self._adopt_files()
+
+    def _compact_rotated(self) -> None:
+        with self._lock:
+            unchanged = self._files_unchanged()
+        records, _ = self._read_snapshot()
+        self._replay_journal(self._rotated_journal_path, records)
+        self._write_snapshot(records.values())
+        os.remove(self._rotated_journal_path)
+        with self._lock:
+            if unchanged:
+                # Новый снимок содержит то же, что снимок + .old, — это не чужое изменение
+                self._fingerprints[self.file_path] = file_fingerprint(self.file_path)
+                self._fingerprints[self._rotated_journal_path] = None
+
+    def wait_for_compaction(self) -> None:
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+
+def open_storage(backend: str = "json", directory: str = "data",
+                 body_budget: int | None = None, track_changes: bool = False,
+                 compression: str | None = None) -> BaseNoteStorage:
+    """
+    Открыть хранилище заметок выбранного типа:
+    - ``json`` — notes.json + журнал (по умолчанию);
+    - ``sqlite`` — notes.db; при первом запуске туда переносится notes.json;
+    - ``indexed`` — индекс notes.idx.json + файл тел notes.bodies с ленивой
+      загрузкой; при первом запуске туда переносится notes.json.
+      ``body_budget`` — сколько байт тел держать в памяти;
+    - ``sharded`` — каталог notes.shards: части по id, манифест с контрольными
+      суммами и журнал; при первом запуске туда переносится notes.json.
+
+    ``track_changes`` — отслеживать изменения, сделанные другими процессами
+    (см. :meth:`BaseNoteStorage.read_external_changes`).
+
+    ``compression`` — сжатие для ``json`` и ``sharded`` (none, zlib, lzma),
+    по умолчанию ``config.storage_compression``.
+    """
+    if compression is None:
+        from config import storage_compression
+        compression = storage_compression
+    storage = _open_backend(backend, directory, body_budget, compression)
+    storage.track_changes = track_changes
+    return storage
+
 
-        data = [asdict(note) for note in notes]
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+def _open_backend(backend: str, directory: str, body_budget: int | None, compression: str) -> BaseNoteStorage:
+    json_path = os.path.join(directory, "notes.json")
+    if backend == "json":
+        return NoteStorage(json_path, compression=compression)
+    if backend == "indexed":
+        from core.lazy_storage import IndexedNoteStorage, DEFAULT_BODY_BUDGET
+        storage = IndexedNoteStorage(os.path.join(directory, "notes.idx.json"),
+                                     os.path.join(directory, "notes.bodies"),
+                                     body_budget or DEFAULT_BODY_BUDGET)
+        if not os.path.exists(storage.file_path) and os.path.exists(json_path):
+            source = NoteStorage(json_path)
+            storage.import_notes(source.load_notes())
+            source.close()
+        return storage
+    if backend == "sharded":
+        from config import storage_shards, storage_load_processes
+        from core.sharded_storage import ShardedNoteStorage
+        storage = ShardedNoteStorage(os.path.join(directory, "notes.shards"), storage_shards,
+                                     processes=storage_load_processes, compression=compression)
+        if not os.path.exists(storage.file_path) and os.path.exists(json_path):
+            source = NoteStorage(json_path)
+            storage.save_notes(source.load_notes())
+            source.close()
+        return storage
+    if backend == "sqlite":
+        from core.sqlite_storage import SqliteNoteStorage, migrate_json_to_sqlite
+        db_path = os.path.join(directory, "notes.db")
+        if not os.path.exists(db_path) and os.path.exists(json_path):
+            migrate_json_to_sqlite(json_path, db_path)
+        return SqliteNoteStorage(db_path)
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
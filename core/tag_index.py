@@ -0,0 +1,226 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+from core.models import Note, normalize_tag
+
+TAG_PREFIX = "tag:"
+EXCLUDE_PREFIX = "-" + TAG_PREFIX
+
+
+@dataclass
+class TagQuery:
+    """
+    Запрос, разобранный на теговые фильтры и обычный текст.
+
+    ``tag:docker tag:k8s`` — обе метки (И), ``tag:docker,podman`` — любая
+    из меток (ИЛИ), ``-tag:draft`` — без метки. Если запрос ещё набирают
+    (нет пробела в конце), последний тег трактуется как префикс.
+    """
+    text: str = ""
+    # Группы вариантов: заметка должна иметь хотя бы один тег из каждой группы
+    include: List[Tuple[str, ...]] = field(default_factory=list)
+    exclude: Tuple[str, ...] = ()
+    # Тег, который ещё набирают, и остальные варианты его группы
+    prefix: str | None = None
+    prefix_group: Tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.include or self.exclude or self.prefix)
+
+
+def _split_tags(value: str) -> Tuple[str, ...]:
+    return tuple(key for key in (normalize_tag(tag) for tag in value.split(",")) if key)
+
+
+def parse_tag_query(query: str, complete: bool = False) -> TagQuery:
+    """
+    :param complete: запрос введён целиком (командная строка) — последний тег
+        не считается префиксом
+    """
+    parsed = TagQuery()
+    words = query.split()
+    typing_last = not complete and bool(query) and not query[-1].isspace()
+    rest, exclude = [], []
+    for i, word in enumerate(words):
+        lowered = word.lower()
+        if lowered.startswith(EXCLUDE_PREFIX):
+            exclude.extend(_split_tags(word[len(EXCLUDE_PREFIX):]))
+        elif lowered.startswith(TAG_PREFIX):
+            group = _split_tags(word[len(TAG_PREFIX):])
+            if typing_last and i == len(words) - 1 and group and not word.endswith(","):
+                parsed.prefix, parsed.prefix_group = group[-1], group[:-1]
+            elif group:
+                parsed.include.append(group)
+        else:
+            rest.append(word)
+    parsed.text = " ".join(rest)
+    parsed.exclude = tuple(exclude)
+    return parsed
+
+
+class TagSelection:
+    """
+    Результат теговых фильтров — битовая маска по порядковым номерам заметок
+    в индексе. Число совпадений и первые id в порядке добавления получаются
+    без обхода всех заметок; множество id строится только при проверке ``in``.
+    """
+
+    __slots__ = ("bits", "_ids", "_members")
+
+    def __init__(self, bits: int, ids: List[str | None]):
+        self.bits = bits
+        self._ids = ids
+        self._members: FrozenSet[str] | None = None
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __contains__(self, note_id: str) -> bool:
+        if self._members is None:
+            self._members = frozenset(self.ids())
+        return note_id in self._members
+
+    def ids(self, limit: int | None = None) -> List[str]:
+        """id заметок в порядке их добавления в индекс (для первых ``limit``)."""
+        # Символ i развёрнутой двоичной записи — бит заметки с номером i
+        flags = format(self.bits, "b")[::-1]
+        result = []
+        position = flags.find("1")
+        while position >= 0 and (limit is None or len(result) < limit):
+            result.append(self._ids[position])
+            position = flags.find("1", position + 1)
+        return result
+
+
+def _bitmask(positions: Iterable[int], size: int) -> int:
+    mask = bytearray((size + 7) // 8)
+    for position in positions:
+        mask[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(mask, "little")
+
+
+class TagIndex:
+    """
+    Фасетный индекс тегов. Каждой заметке присваивается порядковый номер,
+    каждому нормализованному тегу — битовая маска заметок с этим тегом.
+
+    Теговые фильтры сводятся к побитовым операциям над масками (И между
+    группами, ИЛИ между вариантами, И-НЕ для исключений): на 100 тыс. заметок
+    это единицы микросекунд, независимо от того, сколько заметок подошло.
+    Обновляется инкрементально, как и :class:`~core.search_index.SearchIndex`.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        # тег -> маска заметок с этим тегом
+        self._tag_bits: Dict[str, int] = {}
+        # note_id -> порядковый номер; номера удалённых заметок не переиспользуются
+        self._positions: Dict[str, int] = {}
+        # порядковый номер -> note_id (None — заметка удалена)
+        self._ids: List[str | None] = []
+        # note_id -> нормализованные теги заметки
+        self._doc_tags: Dict[str, Tuple[str, ...]] = {}
+        # Маска всех заметок индекса — для запросов только с исключениями
+        self._all = 0
+        # Отсортированный список тегов для поиска по префиксу; None — пересобрать
+        self._sorted_tags: List[str] | None = None
+
+    def __len__(self) -> int:
+        return len(self._doc_tags)
+
+    # ———— Обновление индекса —————
+
+    def rebuild(self, notes: Iterable[Note]) -> None:
+        self._reset()
+        tag_positions: Dict[str, List[int]] = {}
+        for note in notes:
+            if note.id in self._positions:
+                continue
+            position = self._positions[note.id] = len(self._ids)
+            self._ids.append(note.id)
+            keys = self._doc_tags[note.id] = note.tag_keys
+            for tag in keys:
+                tag_positions.setdefault(tag, []).append(position)
+        # Маски собираются целиком из байтов: побитовое ИЛИ по одной заметке было бы квадратичным
+        size = len(self._ids)
+        self._tag_bits = {tag: _bitmask(positions, size) for tag, positions in tag_positions.items()}
+        self._all = (1 << size) - 1
+
+    def update(self, note: Note) -> None:
+        """Добавляет заметку в индекс или обновляет её теги после изменения."""
+        keys = note.tag_keys
+        position = self._positions.get(note.id)
+        if position is None:
+            position = self._positions[note.id] = len(self._ids)
+            self._ids.append(note.id)
+            self._all |= 1 << position
+            old = ()
+        else:
+            old = self._doc_tags[note.id]
+            if old == keys:
+                return
+        self._doc_tags[note.id] = keys
+        bit = 1 << position
+        for tag in set(old) - set(keys):
+            self._clear(tag, bit)
+        for tag in set(keys) - set(old):
+            if tag not in self._tag_bits:
+                self._sorted_tags = None
+            self._tag_bits[tag] = self._tag_bits.get(tag, 0) | bit
+
+    def remove(self, note_id: str) -> None:
+        position = self._positions.pop(note_id, None)
+        if position is None:
+            return
+        bit = 1 << position
+        for tag in set(self._doc_tags.pop(note_id)):
+            self._clear(tag, bit)
+        self._ids[position] = None
+        self._all &= ~bit
+
+    def _clear(self, tag: str, bit: int) -> None:
+        bits = self._tag_bits[tag] & ~bit
+        if bits:
+            self._tag_bits[tag] = bits
+        else:
+            del self._tag_bits[tag]
+            self._sorted_tags = None
+
+    # ———— Запросы —————
+
+    def tags(self) -> Dict[str, int]:
+        """Все теги с числом заметок, по убыванию частоты."""
+        counts = ((tag, bits.bit_count()) for tag, bits in self._tag_bits.items())
+        return dict(sorted(counts, key=lambda item: (-item[1], item[0])))
+
+    def tags_with_prefix(self, prefix: str) -> List[str]:
+        if self._sorted_tags is None:
+            self._sorted_tags = sorted(self._tag_bits)
+        tags = self._sorted_tags
+        start = bisect_left(tags, prefix)
+        end = start
+        while end < len(tags) and tags[end].startswith(prefix):
+            end += 1
+        return tags[start:end]
+
+    def match(self, query: TagQuery) -> TagSelection:
+        """Заметки, проходящие теговые фильтры запроса."""
+        bits = self._all
+        for group in query.include:
+            bits &= self._union(group)
+        if query.prefix is not None:
+            bits &= self._union(query.prefix_group) | self._union(self.tags_with_prefix(query.prefix))
+        for tag in query.exclude:
+            bits &= ~self._tag_bits.get(tag, 0)
+        return TagSelection(bits, self._ids)
+
+    def _union(self, tags: Iterable[str]) -> int:
+        bits = 0
+        for tag in tags:
+            bits |= self._tag_bits.get(tag, 0)
+        return bits
@@ -0,0 +1,146 @@
+# ui/diagnostics_dialog.py
+
+from PyQt5 import QtCore, QtWidgets
+from config import startup_target_ms
+from core.metrics import Metrics
+
+# Как часто (мс) обновляется таблица, пока окно открыто
+REFRESH_INTERVAL_MS = 1000
+
+COLUMNS = ("Метрика", "Кол-во", "p50", "p90", "p99", "Макс", "Последнее", "Сумма")
+
+
+def _format(value: float, unit: str) -> str:
+    if unit == "ms":
+        return f"{value:.1f} мс" if value < 1000 else f"{value / 1000:.2f} с"
+    if unit == "B":
+        if value >= 1024 * 1024:
+            return f"{value / (1024 * 1024):.1f} МБ"
+        return f"{value / 1024:.1f} КБ" if value >= 1024 else f"{value:.0f} Б"
+    return f"{value:g}"
+
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    """
+    Немодальное окно с метриками горячих путей: перцентили по окну последних
+    замеров, счётчики (попадания в кэш), запись и экспорт трассы в формате
+    Chrome Trace для разбора в chrome://tracing или Perfetto.
+    """
+
+    def __init__(self, metrics: Metrics, parent: QtWidgets.QWidget | None = None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.setWindowTitle("Диагностика производительности")
+        self.resize(760, 420)
+
+        # 1) Таблица метрик
+        self.table = QtWidgets.QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.counters_label = QtWidgets.QLabel()
+        self.counters_label.setWordWrap(True)
+
+        # 2) Управление записью и трассой
+        self.enabled_box = QtWidgets.QCheckBox("Собирать метрики")
+        self.enabled_box.setChecked(metrics.enabled)
+        self.enabled_box.toggled.connect(self._set_enabled)
+        self.trace_box = QtWidgets.QCheckBox("Записывать трассу")
+        self.trace_box.setChecked(metrics.tracing)
+        self.trace_box.toggled.connect(self._set_tracing)
+        export_btn = QtWidgets.QPushButton("Экспорт трассы…")
+        export_btn.clicked.connect(self.export_trace)
+        reset_btn = QtWidgets.QPushButton("Сбросить")
+        reset_btn.clicked.connect(self.reset)
+        close_btn = QtWidgets.QPushButton("Закрыть")
+        close_btn.clicked.connect(self.reject)
+
+        controls = QtWidgets.QHBoxLayout()
+        controls.addWidget(self.enabled_box)
+        controls.addWidget(self.trace_box)
+        controls.addStretch(1)
+        controls.addWidget(export_btn)
+        controls.addWidget(reset_btn)
+        controls.addWidget(close_btn)
+
+        # 3) Компоновка
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addWidget(self.counters_label)
+        layout.addLayout(controls)
+
+        # 4) Обновление, только пока окно видно
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL_MS)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        stats = self.metrics.snapshot()
+        self.table.setRowCount(len(stats))
+        for row, item in enumerate(stats):
+            values = (
+                item.name, str(item.count),
+                *(_format(value, item.unit) for value in (item.p50, item.p90, item.p99, item.max, item.last)),
+                _format(item.total, item.unit) if item.unit == "B" else "",
+            )
+            for column, text in enumerate(values):
+                cell = QtWidgets.QTableWidgetItem(text)
+                if column:
+                    cell.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(row, column, cell)
+
+        lines = []
+        first_window = next((item for item in stats if item.name == "startup.first_window"), None)
+        if first_window is not None and first_window.last > startup_target_ms:
+            lines.append(f"Запуск: окно появилось через {_format(first_window.last, 'ms')} — "
+                         f"дольше цели {_format(startup_target_ms, 'ms')} (STARTUP_TARGET_MS)")
+        counters = self.metrics.counters()
+        hits, misses = counters.get("response_cache.hit", 0), counters.get("response_cache.miss", 0)
+        if hits + misses:
+            lines.append(f"Кэш ответов GigaChat: {hits} попаданий, {misses} промахов ({hits / (hits + misses):.0%})")
+        other = {name: value for name, value in counters.items() if not name.startswith("response_cache.")}
+        if other:
+            lines.append(", ".join(f"{name}: {value}" for name, value in other.items()))
+        if self.metrics.tracing:
+            lines.append(f"Событий в трассе: {self.metrics.trace_events}")
+        self.counters_label.setText("\n".join(lines))
+
+    def _set_enabled(self, enabled: bool):
+        self.metrics.enabled = enabled
+        self.trace_box.setEnabled(enabled)
+
+    def _set_tracing(self, tracing: bool):
+        self.metrics.tracing = tracing
+
+    def reset(self):
+        self.metrics.reset()
+        self.refresh()
+
+    def export_trace(self):
+        if not self.metrics.trace_events:
+            QtWidgets.QMessageBox.information(
+                self, "Трасса пуста",
+                "Включите «Записывать трассу», повторите медленное действие и экспортируйте снова."
+            )
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Экспорт трассы", "sobnotes-trace.json", "Chrome Trace (*.json)"
+        )
+        if not path:
+            return
+        count = self.metrics.export_chrome_trace(path)
+        QtWidgets.QMessageBox.information(
+            self, "Трасса сохранена",
+            f"Событий: {count}\n{path}\n\nОткройте файл в chrome://tracing или ui.perfetto.dev."
+        )
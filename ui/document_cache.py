@@ -0,0 +1,73 @@
+# ui/document_cache.py
+
+from collections import OrderedDict
+from PyQt5.QtCore import QObject
+from PyQt5.QtGui import QFont, QTextDocument
+from core.metrics import metrics
+
+# Сколько памяти занимает QTextDocument превью на символ Markdown (с разметкой
+# и раскладкой строк) — замерено на корпусе бенчмарков, ~18–20 байт
+DOCUMENT_BYTES_PER_CHAR = 20
+
+
+class DocumentCache:
+    """
+    LRU готовых документов превью (QTextDocument после setMarkdown) с бюджетом
+    памяти. Ключ — id заметки; документ отдаётся, только если совпадают хэш
+    текста и шрифт, так что правка заметки или смена темы просто дают промах.
+
+    Показанный документ из кэша забирается (``take``) и возвращается
+    (``put``), когда превью переключается на другой, — вытеснение никогда
+    не удаляет документ, который сейчас на экране. Только для GUI-потока.
+    """
+
+    def __init__(self, max_bytes: int, owner: QObject):
+        """
+        :param max_bytes: бюджет памяти; 0 — кэш выключен
+        :param owner: родитель документов в кэше
+        """
+        self.max_bytes = max_bytes
+        self.owner = owner
+        self.size_bytes = 0
+        # id заметки -> (хэш текста, шрифт, документ, оценка размера)
+        self._entries: OrderedDict[str, tuple[int, str, QTextDocument, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def contains(self, key: str, text: str, font: QFont) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] == hash(text) and entry[1] == font.key()
+
+    def take(self, key: str, text: str, font: QFont) -> QTextDocument | None:
+        """Забрать документ для показа; None — его нет или он построен по другому тексту."""
+        hit = self.contains(key, text, font)
+        metrics.count("preview.cache_hits" if hit else "preview.cache_misses")
+        if not hit:
+            return None
+        _, _, doc, cost = self._entries.pop(key)
+        self.size_bytes -= cost
+        return doc
+
+    def put(self, key: str, text: str, font: QFont, doc: QTextDocument) -> None:
+        """Положить документ, построенный по ``text``; прежний документ этой заметки удаляется."""
+        self._discard(key)
+        cost = len(text) * DOCUMENT_BYTES_PER_CHAR
+        if cost > self.max_bytes:
+            doc.deleteLater()
+            return
+        doc.setParent(self.owner)
+        self._entries[key] = (hash(text), font.key(), doc, cost)
+        self.size_bytes += cost
+        while self.size_bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[3]
+            entry[2].deleteLater()
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._discard(key)
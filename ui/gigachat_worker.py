@@ -0,0 +1,74 @@
+# ui/gigachat_worker.py
+
+from PyQt5 import QtCore
+from config import gigachat_max_concurrency
+from core.gigachat import (
+    generate_note_with_gigachat, stream_note_with_gigachat, get_default_client, PROMPT_TEMPLATE
+)
+from core.response_cache import ResponseCache, CachedGenerator
+from core.generation_queue import GenerationQueue, GenerationJob, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+
+
+class GigachatWorker(QtCore.QObject):
+    """
+    Qt-обёртка над GenerationQueue: один долгоживущий фоновый event loop
+    выполняет generate_note_with_gigachat для очереди запросов,
+    а состояние задач и результаты приходят в GUI-поток сигналами.
+    """
+    progress = QtCore.pyqtSignal(str, str, str)       # job_id, query, state
+    result_ready = QtCore.pyqtSignal(str, str, str)   # job_id, title, body
+    error = QtCore.pyqtSignal(str, str)               # job_id, traceback
+    delta = QtCore.pyqtSignal(str, str)               # job_id, кусок текста (потоковый режим)
+
+    def __init__(self, cache: ResponseCache | None = None,
+                 max_concurrency: int = gigachat_max_concurrency, parent=None):
+        super().__init__(parent)
+        generate, stream = generate_note_with_gigachat, stream_note_with_gigachat
+        self.cache = cache
+        if cache is not None:
+            # Кэш ответов перед GigaChat: повторный запрос не тратит квоту API
+            cached = CachedGenerator(cache, generate, stream, PROMPT_TEMPLATE, get_default_client().model)
+            generate, stream = cached.generate, cached.stream
+        self.queue = GenerationQueue(
+            generate,
+            max_concurrency=max_concurrency,
+            on_progress=self._on_progress,
+            on_result=lambda job, title, body: self.result_ready.emit(job.job_id, title, body),
+            # Эмитим полный traceback для подробного разбора ошибки
+            on_error=lambda job, tb: self.error.emit(job.job_id, tb),
+            stream=stream,
+            on_delta=lambda job, text: self.delta.emit(job.job_id, text),
+        )
+
+    def _on_progress(self, job: GenerationJob):
+        self.progress.emit(job.job_id, job.query, job.state)
+
+    def submit(self, query: str, priority: int = PRIORITY_INTERACTIVE, stream: bool = False,
+               force_refresh: bool = False) -> str:
+        options = {"force_refresh": True} if force_refresh and self.cache is not None else {}
+        return self.queue.submit(query, priority, stream, **options)
+
+    def submit_many(self, queries: list[str], priority: int = PRIORITY_BATCH) -> list[str]:
+        return self.queue.submit_many(queries, priority)
+
+    def cancel(self, job_id: str):
+        self.queue.cancel(job_id)
+
+    def cancel_all(self):
+        self.queue.cancel_all()
+
+    @property
+    def pending(self) -> int:
+        return self.queue.pending
+
+    def shutdown(self):
+        if self.queue.pending:
+            self.queue.cancel_all()
+        # Закрываем пул соединений в том же цикле, где он был создан
+        try:
+            self.queue.run_coroutine(get_default_client().aclose()).result(timeout=2)
+        except Exception:
+            pass
+        self.queue.shutdown()
+        if self.cache is not None:
+            self.cache.close()
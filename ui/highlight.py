@@ -0,0 +1,72 @@
+# ui/highlight.py
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+# Фон совпадений с поисковым запросом — заметен и в светлой, и в тёмной теме
+HIGHLIGHT_COLOR = QtGui.QColor(255, 193, 7, 110)
+
+
+def extra_selections(edit: QtWidgets.QPlainTextEdit | QtWidgets.QTextEdit,
+                     spans: list[tuple[int, int]]) -> list[QtWidgets.QTextEdit.ExtraSelection]:
+    """Подсветка диапазонов текста виджета через extraSelections (документ не меняется)."""
+    selections = []
+    document = edit.document()
+    for start, end in spans:
+        selection = QtWidgets.QTextEdit.ExtraSelection()
+        cursor = QtGui.QTextCursor(document)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+        selection.cursor = cursor
+        selection.format.setBackground(HIGHLIGHT_COLOR)
+        selections.append(selection)
+    return selections
+
+
+class HighlightDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    Рисует строку списка как обычно, но подсвечивает диапазоны текста,
+    которые модель отдаёт по роли ``highlight_role`` (список (начало, конец)).
+    """
+
+    def __init__(self, highlight_role: int, parent: QtCore.QObject | None = None):
+        super().__init__(parent)
+        self.highlight_role = highlight_role
+
+    def paint(self, painter: QtGui.QPainter, option: QtWidgets.QStyleOptionViewItem, index: QtCore.QModelIndex):
+        spans = index.data(self.highlight_role)
+        if not spans:
+            return super().paint(painter, option, index)
+
+        opt = QtWidgets.QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        text, opt.text = opt.text, ""
+        widget = opt.widget
+        style = widget.style() if widget is not None else QtWidgets.QApplication.style()
+        # Фон, выделение и фокус рисует стиль, текст — мы сами
+        style.drawControl(QtWidgets.QStyle.CE_ItemViewItem, opt, painter, widget)
+        rect = style.subElementRect(QtWidgets.QStyle.SE_ItemViewItemText, opt, widget)
+
+        formats = []
+        for start, end in spans:
+            fmt = QtGui.QTextCharFormat()
+            fmt.setBackground(HIGHLIGHT_COLOR)
+            fmt.setFontWeight(QtGui.QFont.Bold)
+            range_ = QtGui.QTextLayout.FormatRange()
+            range_.start, range_.length, range_.format = start, end - start, fmt
+            formats.append(range_)
+
+        layout = QtGui.QTextLayout(text, opt.font)
+        layout.setFormats(formats)
+        layout.beginLayout()
+        line = layout.createLine()
+        line.setLineWidth(rect.width())
+        layout.endLayout()
+
+        selected = opt.state & QtWidgets.QStyle.State_Selected
+        role = QtGui.QPalette.HighlightedText if selected else QtGui.QPalette.Text
+        painter.save()
+        painter.setClipRect(rect)
+        painter.setPen(opt.palette.color(role))
+        top = rect.top() + (rect.height() - line.height()) / 2
+        layout.draw(painter, QtCore.QPointF(rect.left(), top))
+        painter.restore()
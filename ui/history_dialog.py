@@ -0,0 +1,84 @@
+# ui/history_dialog.py
+
+import time
+from PyQt5 import QtWidgets
+from core.history import Revision, RevisionHistory
+
+REASON_LABELS = {
+    "baseline": "исходная",
+    "edit": "правка",
+    "rename": "переименование",
+    "delete": "удаление",
+    "restore": "восстановление",
+    "external": "с диска",
+}
+
+
+def _format_time(timestamp: float) -> str:
+    return time.strftime("%d.%m.%Y %H:%M", time.localtime(timestamp))
+
+
+class HistoryDialog(QtWidgets.QDialog):
+    """
+    Список версий с предпросмотром выбранной. Используется и для истории
+    одной заметки, и для списка удалённых заметок (последняя версия каждой).
+    После ``exec_`` выбранная для восстановления версия — в ``selected``.
+    """
+
+    def __init__(self, history: RevisionHistory, revisions: list[Revision], title: str,
+                 parent: QtWidgets.QWidget | None = None):
+        super().__init__(parent)
+        self.history = history
+        self.revisions = revisions
+        self.selected: Revision | None = None
+        self.setWindowTitle(title)
+        self.resize(760, 460)
+
+        # 1) Список версий
+        self.list = QtWidgets.QListWidget()
+        for revision in revisions:
+            label = REASON_LABELS.get(revision.reason, revision.reason)
+            item = QtWidgets.QListWidgetItem(
+                f"{_format_time(revision.updated_at)}  ·  {label}  ·  {revision.title or 'Без названия'}"
+            )
+            item.setToolTip(f"Версия {revision.rev}: {revision.size} симв., на диске {revision.stored_bytes} Б")
+            self.list.addItem(item)
+        self.list.currentRowChanged.connect(self._show_revision)
+
+        # 2) Предпросмотр тела версии
+        self.preview = QtWidgets.QPlainTextEdit()
+        self.preview.setReadOnly(True)
+
+        splitter = QtWidgets.QSplitter()
+        splitter.addWidget(self.list)
+        splitter.addWidget(self.preview)
+        splitter.setSizes([300, 460])
+
+        # 3) Кнопки
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Cancel)
+        self.restore_btn = buttons.addButton("Восстановить", QtWidgets.QDialogButtonBox.AcceptRole)
+        self.restore_btn.setEnabled(False)
+        buttons.accepted.connect(self._restore)
+        buttons.rejected.connect(self.reject)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        if not revisions:
+            layout.addWidget(QtWidgets.QLabel("История пуста"))
+        layout.addWidget(splitter)
+        layout.addWidget(buttons)
+        if revisions:
+            self.list.setCurrentRow(0)
+
+    def _show_revision(self, row: int):
+        if row < 0:
+            self.restore_btn.setEnabled(False)
+            return
+        revision = self.revisions[row]
+        self.preview.setPlainText(self.history.body_at(revision.note_id, revision.rev))
+        self.restore_btn.setEnabled(True)
+
+    def _restore(self):
+        row = self.list.currentRow()
+        if row >= 0:
+            self.selected = self.revisions[row]
+            self.accept()
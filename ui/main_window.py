@@ -1,62 +1,220 @@
+import dataclasses
 import os
-import asyncio
-import traceback
+import threading
+import time
+from collections import Counter
 from PyQt5 import QtWidgets, QtCore, QtGui
-from core.storage import NoteStorage
+from config import (
+    gigachat_stream, response_cache_ttl_days, response_cache_max_mb, storage_backend,
+    note_body_cache_mb, preview_cache_mb, fuzzy_search_bodies, startup_target_ms, similar_notes, history_max_mb,
+    history_coalesce_seconds, watch_storage
+)
+from core.storage import BaseNoteStorage, ExternalChanges, open_storage
 from core.search_handler import SearchHandler
-from core.gigachat import generate_note_with_gigachat
+from core.search_index import SearchIndex, term_counts, tokenize
+from core.fuzzy_index import FuzzyIndex
+from core.tag_index import TagIndex, TagSelection, parse_tag_query
+from core.metrics import metrics
+from core.query_cache import QueryCancelled, QueryResult
+from core.history import RevisionHistory, REASON_DELETE, REASON_EXTERNAL, REASON_RENAME, REASON_RESTORE
 from ui.note_editor import NoteEditor
+from ui.note_list_model import NoteListModel, NoteSearchProxyModel, NoteRole, HighlightRole
+from ui.highlight import HighlightDelegate
+from ui.diagnostics_dialog import DiagnosticsDialog
+from ui.related_notes_panel import RelatedNotesPanel
+from ui.history_dialog import HistoryDialog
+from ui.storage_watcher import StorageWatcher
+from ui.search_runner import SearchRunner
 from core.models import Note
 
+# Сколько лучших совпадений показывать в списке при поиске
+SEARCH_RESULT_LIMIT = 500
+# Если точных результатов меньше стольких, к ним добавляются нечёткие (с опечатками)
+FUZZY_MIN_RESULTS = 5
+FUZZY_RESULT_LIMIT = 50
+# Сколько заметок добавляется в список за один проход цикла событий при старте
+LIST_POPULATE_CHUNK = 5000
+# Поиск по заголовкам проверяет, не устарел ли запрос, через каждые столько заметок
+TITLE_SCAN_CHECK_EVERY = 2000
+# Панель похожих заметок: сколько показывать и с какого косинуса TF-IDF
+RELATED_NOTES_LIMIT = 8
+RELATED_MIN_SCORE = 0.1
+# Превью каких заметок готовить заранее: лучшие результаты поиска и соседи открытой в списке
+PREFETCH_TOP_HITS = 3
+PREFETCH_NEIGHBOURS = 2
 
-class GigachatWorker(QtCore.QThread):
-    """
-    Запускает асинхронную функцию generate_note_with_gigachat в отдельном потоке
-    и по завершении отдаёт заголовок и тело заметки.
-    """
-    result_ready = QtCore.pyqtSignal(str, str)
-    error = QtCore.pyqtSignal(str)
+# Общий стиль + тема, собранные в один QSS; файлы читаются один раз на тему
+_stylesheets: dict[str, str] = {}
+
+
+def _read_qss(path: str) -> str:
+    if not os.path.exists(path):
+        return ""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def theme_stylesheet(theme_name: str) -> str:
+    stylesheet = _stylesheets.get(theme_name)
+    if stylesheet is None:
+        base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        style = _read_qss(os.path.join(base, "assets", "style.qss"))
+        theme = _read_qss(os.path.join(base, "assets", "themes", f"{theme_name}.qss"))
+        stylesheet = _stylesheets[theme_name] = style + "\n" + theme
+    return stylesheet
+
+
+class _StorageSignals(QtCore.QObject):
+    # Текст ошибки фиксации — из потока писателя в GUI-поток
+    commit_failed = QtCore.pyqtSignal(str)
 
-    def __init__(self, query: str, parent=None):
-        super().__init__(parent)
-        self.query = query
+
+class _IndexSignals(QtCore.QObject):
+    # SearchIndex или None (поиск ведёт хранилище), FuzzyIndex
+    finished = QtCore.pyqtSignal(object, object)
+    # SearchIndex с телами — у хранилища с ленивыми телами первый индекс только по заголовкам и тегам
+    bodies_indexed = QtCore.pyqtSignal(object)
+    # SimilarityIndex — строится последним, когда поиск уже работает
+    similarity_ready = QtCore.pyqtSignal(object)
+
+
+def _no_body_terms(note: Note) -> tuple[Counter, int]:
+    return Counter(), 0
+
+
+class _IndexBuildTask(QtCore.QRunnable):
+    """Строит поисковые индексы по снимку списка заметок в пуле потоков."""
+
+    def __init__(self, notes: list[Note], storage: BaseNoteStorage, with_similarity: bool,
+                 signals: _IndexSignals):
+        super().__init__()
+        self.notes = notes
+        self.storage = storage
+        self.with_similarity = with_similarity
+        self.signals = signals
 
     def run(self):
-        try:
-            title, body = asyncio.run(generate_note_with_gigachat(self.query))
-            self.result_ready.emit(title, body)
-        except Exception:
-            # Эмитим полный traceback для подробного разбора ошибки
-            tb = traceback.format_exc()
-            self.error.emit(tb)
+        # Ленивые тела при запуске не читаются: сначала индекс по заголовкам и тегам,
+        # тела индексируются следом — через peek_body, не вытесняя открытые заметки из кэша тел
+        lazy = self.storage.lazy_bodies
+        search_index = None
+        if not self.storage.supports_search:
+            search_index = SearchIndex()
+            with metrics.span("search.index_build", notes=len(self.notes)):
+                search_index.rebuild(self.notes, _no_body_terms if lazy else None)
+        fuzzy_index = FuzzyIndex(include_bodies=fuzzy_search_bodies)
+        with metrics.span("search.fuzzy_index_build", notes=len(self.notes)):
+            fuzzy_index.rebuild(self.notes)
+        self.signals.finished.emit(search_index, fuzzy_index)
+        if lazy and search_index is not None:
+            search_index = SearchIndex()
+            with metrics.span("search.body_index_build", notes=len(self.notes)):
+                search_index.rebuild(self.notes, lambda note: term_counts(self.storage.peek_body(note)))
+            self.signals.bodies_indexed.emit(search_index)
+        if self.with_similarity:
+            # numpy импортируется здесь, в фоне, а не при запуске приложения
+            from core.similarity import SimilarityIndex
+            similarity_index = SimilarityIndex()
+            with metrics.span("similarity.index_build", notes=len(self.notes)):
+                similarity_index.rebuild(self.notes, self.storage.peek_body)
+            self.signals.similarity_ready.emit(similarity_index)
 
 
 class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    """
+    Главное окно. Запуск разбит на этапы, чтобы окно появлялось сразу:
+    в конструкторе создаются только виджеты; заметки читаются после первого
+    показа и добавляются в список порциями, поисковые индексы строятся
+    в фоне, а сетевой стек (httpx, GigaChat) импортируется при первой генерации.
+    """
+
+    def __init__(self, theme: str = "dark", started_at: float | None = None):
+        """
+        :param theme: тема оформления (light или dark)
+        :param started_at: time.perf_counter() в момент запуска процесса — от него
+            считается время до первого окна
+        """
         super().__init__()
+        self._started_at = started_at if started_at is not None else time.perf_counter()
+        self._theme: str | None = None
         self.setWindowTitle("SobNotes")
         self.setMinimumSize(900, 600)
-        self.setWindowIcon(QtGui.QIcon(os.path.join("assets", "DarkIcon.png")))
-        self.change_theme("dark")
+        # Стиль применяется до создания виджетов — им не нужна повторная перерисовка
+        self.change_theme(theme)
 
         # 1) Меню
         self._create_menu()
 
-        # 2) Данные
-        self.storage = NoteStorage("data/notes.json")
-        self.notes: list[Note] = self.storage.load_notes()
+        # 2) Данные: заметки читаются после первого показа окна (_start_loading)
+        self.storage = open_storage(storage_backend, "data", int(note_body_cache_mb * 1024 * 1024),
+                                    track_changes=watch_storage)
+        # Неудачная запись повторяется писателем сама; пользователь видит ошибку сразу
+        self._storage_signals = _StorageSignals(self)
+        self._storage_signals.commit_failed.connect(self._on_storage_error)
+        self.storage.on_error = lambda exc: self._storage_signals.commit_failed.emit(str(exc))
+        # Изменения хранилища другими процессами; слежение включается после запуска
+        self.storage_watcher: StorageWatcher | None = None
+        self._merging_external = False
+        self._deferred_changes: list[ExternalChanges] = []
+        self.notes: list[Note] = []
+        # Хранилище с собственным полнотекстовым поиском (SQLite FTS5) заменяет индекс в памяти;
+        # пока индексы строятся, поиск идёт по заголовкам
+        self.search_index: SearchIndex | None = None
+        # Нечёткий поиск по заголовкам и тегам — для запросов с опечатками
+        self.fuzzy_index: FuzzyIndex | None = None
+        # Тег -> маска заметок: фильтры вида «tag:docker tag:k8s» без обхода списка.
+        # Строится сразу при загрузке — это дёшево, в отличие от полнотекстовых индексов
+        self.tag_index = TagIndex()
+        # Поиск идёт в отдельном потоке; индексы выше GUI-поток меняет только под этой блокировкой
+        self._search_lock = threading.Lock()
+        # Изменения заметок за время фоновой сборки индексов: id -> заметка или None (удалена)
+        self._index_pending: dict[str, Note | None] | None = None
+        # То же за время индексации тел (хранилище с ленивыми телами)
+        self._body_index_pending: dict[str, Note | None] | None = None
+        self._index_signals = _IndexSignals(self)
+        self._index_signals.finished.connect(self._on_indexes_built)
+        self._index_signals.bodies_indexed.connect(self._on_bodies_indexed)
+        self._index_signals.similarity_ready.connect(self._on_similarity_built)
+        # Похожие заметки и почти-дубликаты (core.similarity.SimilarityIndex) и правки за время его сборки
+        self.similarity_index = None
+        self._similarity_pending: dict[str, Note | None] | None = None
+        self._loading_started = False
+        self._pending_notes: list[Note] = []
+        self.startup_complete = False
+        self._first_window_ms = 0.0
+        self.diagnostics_dialog: DiagnosticsDialog | None = None
+        # Для текущего запроса нашлись только похожие (с опечаткой) заметки
+        self._fuzzy_only = False
+        # Запрос, для которого Enter уже открыл похожую заметку вместо генерации
+        self._fuzzy_enter_query: str | None = None
 
         # 3) Виджеты
         self.search_bar = QtWidgets.QLineEdit()
         self.search_bar.setPlaceholderText("Поиск...")
-        self.list_view = QtWidgets.QListWidget()
+        self.note_model = NoteListModel(self.notes, self)
+        self.note_proxy = NoteSearchProxyModel(self)
+        self.note_proxy.setSourceModel(self.note_model)
+        self.list_view = QtWidgets.QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setModel(self.note_proxy)
+        self.list_view.setItemDelegate(HighlightDelegate(HighlightRole, self.list_view))
         self.list_view.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.list_view.customContextMenuRequested.connect(self.on_context_menu)
-        self.editor = NoteEditor()
+        self.editor = NoteEditor(preview_cache_bytes=int(preview_cache_mb * 1024 * 1024))
+        self.related_panel = RelatedNotesPanel()
+        self.related_panel.note_activated.connect(self.open_note_by_id)
+        self.related_panel.setVisible(similar_notes)
+        # Похожие пересчитываются не на каждое нажатие клавиши, а после паузы
+        self.related_timer = QtCore.QTimer(self)
+        self.related_timer.setSingleShot(True)
+        self.related_timer.setInterval(400)
+        self.related_timer.timeout.connect(self.update_related_notes)
 
         # 4) Поиск с автосбросом (5s)
         self.search_handler = SearchHandler(reset_seconds=5)
         self.search_handler.attach_line_edit(self.search_bar)
+        self.search_runner = SearchRunner(self._run_query, self._refines, self._search_lock, self)
+        self.search_runner.result_ready.connect(self._show_query_result)
         self.search_bar.textChanged.connect(self.filter_notes)
 
         # 4.1) Таймер автозакрытия (3s) — открыть лучший матч
@@ -69,8 +227,26 @@ class MainWindow(QtWidgets.QMainWindow):
         # 4.2) Enter в поиске — генерация через GigaChat
         self.search_bar.returnPressed.connect(self.on_search_enter)
 
+        # 4.3) Кэш ответов и очередь генерации создаются при первом обращении
+        self._response_cache = None
+        self._giga_worker = None
+        self._interactive_jobs: set[str] = set()
+        # job_id -> заметка, в которую дописывается потоковый ответ
+        self._streaming_notes: dict[str, Note] = {}
+        self._batch_total = 0
+        self._batch_finished = 0
+        self._batch_failed = 0
+
+        # 4.4) История версий (открывается при первой правке); в неё пишется после паузы в наборе
+        self._history = None
+        self.history_timer = QtCore.QTimer(self)
+        self.history_timer.setSingleShot(True)
+        self.history_timer.setInterval(2000)
+        self.history_timer.timeout.connect(lambda: self.history.flush())
+
         # 5) Сигналы
-        self.list_view.itemClicked.connect(self.load_selected_note)
+        self.list_view.clicked.connect(self.load_selected_note)
+        self.editor.editing_started.connect(lambda note: self.history.track(note))
         self.editor.note_changed.connect(self.save_note)
 
         # 6) Кнопка новой заметки
@@ -85,10 +261,14 @@ class MainWindow(QtWidgets.QMainWindow):
         left_pane = QtWidgets.QWidget()
         left_pane.setLayout(left_layout)
 
-        # 8) Сплиттер
+        # 8) Сплиттеры: список | редактор над панелью похожих заметок
+        right_splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
+        right_splitter.addWidget(self.editor)
+        right_splitter.addWidget(self.related_panel)
+        right_splitter.setSizes([480, 120])
         splitter = QtWidgets.QSplitter()
         splitter.addWidget(left_pane)
-        splitter.addWidget(self.editor)
+        splitter.addWidget(right_splitter)
         splitter.setSizes([250, 650])
 
         # 9) Центральный виджет
@@ -97,36 +277,390 @@ class MainWindow(QtWidgets.QMainWindow):
         hl.addWidget(splitter)
         hl.setContentsMargins(4, 4, 4, 4)
         self.setCentralWidget(container)
-        self.statusBar().showMessage("Готово")
+        self.statusBar().showMessage("Загрузка заметок…")
 
-        self.populate_note_list()
+    # ———— Запуск —————
+
+    def _startup_ms(self) -> float:
+        return (time.perf_counter() - self._started_at) * 1000
+
+    def showEvent(self, event: QtGui.QShowEvent):
+        super().showEvent(event)
+        if not self._loading_started:
+            self._loading_started = True
+            # Нулевой таймер срабатывает, когда первый кадр окна уже отрисован
+            QtCore.QTimer.singleShot(0, self._start_loading)
+
+    def _start_loading(self):
+        # Промах мимо STARTUP_TARGET_MS показывают итоговое сообщение о запуске и окно диагностики
+        self._first_window_ms = self._startup_ms()
+        metrics.observe("startup.first_window", self._first_window_ms, "ms")
+        with metrics.span("storage.load_notes", backend=storage_backend) as span:
+            notes = self.storage.load_notes()
+            span.args["notes"] = len(notes)
+        metrics.observe("startup.notes_loaded", self._startup_ms(), "ms")
+        if self.storage.damaged:
+            self._warn_damaged_storage(self.storage.damaged)
+        with self._search_lock, metrics.span("search.tag_index_build", notes=len(notes)):
+            self.tag_index.rebuild(notes)
+        self._pending_notes = notes
+        self._index_pending = {}
+        lazy_index = self.storage.lazy_bodies and not self.storage.supports_search
+        self._body_index_pending = {} if lazy_index else None
+        self._similarity_pending = {} if similar_notes else None
+        QtCore.QThreadPool.globalInstance().start(
+            _IndexBuildTask(list(notes), self.storage, similar_notes, self._index_signals)
+        )
+        self._populate_step()
+
+    def _warn_damaged_storage(self, damaged: list[str]):
+        # Немодально: список заметок продолжает заполняться
+        dlg = QtWidgets.QMessageBox(self)
+        dlg.setIcon(QtWidgets.QMessageBox.Warning)
+        dlg.setWindowTitle("Повреждённые файлы заметок")
+        dlg.setText("Часть файлов хранилища не удалось прочитать. Остальные заметки загружены, "
+                    "повреждённые файлы сохранены рядом с суффиксом .corrupt.")
+        dlg.setDetailedText("\n".join(damaged))
+        dlg.open()
+
+    def _populate_step(self):
+        # Порция заметок в список; остальное — на следующем проходе цикла событий
+        chunk = self._pending_notes[:LIST_POPULATE_CHUNK]
+        del self._pending_notes[:LIST_POPULATE_CHUNK]
+        self.note_model.append_notes(chunk)
+        if self._pending_notes:
+            QtCore.QTimer.singleShot(0, self._populate_step)
+            return
+        metrics.observe("startup.list_populated", self._startup_ms(), "ms")
+        self.statusBar().showMessage(f"Заметок: {len(self.notes)}. Строится поисковый индекс…")
+        self._finish_startup()
+
+    def _on_indexes_built(self, search_index: SearchIndex | None, fuzzy_index: FuzzyIndex):
+        # Правки, сделанные во время сборки, применяем поверх готовых индексов
+        for note_id, note in self._index_pending.items():
+            for index in (search_index, fuzzy_index):
+                if index is None:
+                    continue
+                if note is None:
+                    index.remove(note_id)
+                else:
+                    index.update(note)
+        with self._search_lock:
+            self._index_pending = None
+            self.search_index, self.fuzzy_index = search_index, fuzzy_index
+        # Результаты поиска по заголовкам индексу не годятся ни как ответ, ни как основа для уточнений
+        self.search_runner.invalidate()
+        metrics.observe("startup.index_ready", self._startup_ms(), "ms")
+        if self.search_bar.text().strip():
+            # Запрос набран до готовности индекса — показываем полноценный результат
+            self.filter_notes(self.search_bar.text())
+        self._finish_startup()
+
+    def _on_bodies_indexed(self, search_index: SearchIndex):
+        # Индекс по заголовкам и тегам уже работает — подменяем его полным
+        for note_id, note in self._body_index_pending.items():
+            if note is None:
+                search_index.remove(note_id)
+            else:
+                search_index.update(note)
+        with self._search_lock:
+            self._body_index_pending = None
+            self.search_index = search_index
+        self.search_runner.invalidate()
+        metrics.observe("startup.body_index_ready", self._startup_ms(), "ms")
+        if self.search_bar.text().strip():
+            self.filter_notes(self.search_bar.text())
+        self._finish_startup()
+
+    def _on_similarity_built(self, similarity_index):
+        for note_id, note in self._similarity_pending.items():
+            if note is None:
+                similarity_index.remove(note_id)
+            else:
+                similarity_index.update(note)
+        self._similarity_pending = None
+        self.similarity_index = similarity_index
+        metrics.observe("startup.similarity_ready", self._startup_ms(), "ms")
+        self.update_related_notes()
+        self._finish_startup()
+
+    def _finish_startup(self):
+        if self._pending_notes or self._index_pending is not None or self.startup_complete:
+            return
+        if self._body_index_pending is not None:
+            self.statusBar().showMessage(f"Заметок: {len(self.notes)}. Индексируются тексты заметок…")
+            return
+        if self._similarity_pending is not None:
+            self.statusBar().showMessage(f"Заметок: {len(self.notes)}. Ищутся похожие заметки…")
+            return
+        self.startup_complete = True
+        total = self._startup_ms()
+        metrics.observe("startup.ready", total, "ms")
+        message = f"Готово — заметок: {len(self.notes)}, запуск {total / 1000:.1f} с"
+        if self._first_window_ms > startup_target_ms:
+            message += f"; окно появилось через {self._first_window_ms:.0f} мс (цель {startup_target_ms:.0f} мс)"
+        self.statusBar().showMessage(message, 5000)
+        if watch_storage:
+            self.storage_watcher = StorageWatcher(self.storage, self)
+            self.storage_watcher.changes_detected.connect(self.apply_external_changes)
+            self.storage_watcher.start()
+
+    # ———— Изменения хранилища извне —————
+
+    def apply_external_changes(self, changes: ExternalChanges):
+        """
+        Влить изменения, сделанные другим процессом: новые, изменённые и удалённые
+        заметки точечно обновляются в списке, индексах и редакторе. Если открытую
+        заметку правили и здесь, и там — решает пользователь (_resolve_conflict).
+        """
+        if self._merging_external:
+            # Диалог конфликта крутит свой цикл событий — следующая пачка подождёт
+            self._deferred_changes.append(changes)
+            return
+        self._merging_external = True
+        try:
+            conflicts = self._merge_changes(changes)
+            for note, incoming in conflicts:
+                self._resolve_conflict(note, incoming)
+        finally:
+            self._merging_external = False
+        if self._deferred_changes:
+            self.apply_external_changes(self._deferred_changes.pop(0))
+
+    def _merge_changes(self, changes: ExternalChanges) -> list[tuple[Note, Note | None]]:
+        current = self.editor.current_note
+        added, conflicts = [], []
+        with metrics.span("storage.merge_external", upserted=len(changes.upserted), deleted=len(changes.deleted)):
+            for incoming in changes.upserted:
+                note = self.note_model.note_by_id(incoming.id)
+                if note is None:
+                    added.append(incoming)
+                elif note is current and self.editor.edited:
+                    conflicts.append((note, incoming))
+                else:
+                    self._take_external(note, incoming)
+            if added:
+                self.note_model.append_notes(added)
+                for note in added:
+                    self._index_note(note)
+            for note_id in changes.deleted:
+                note = self.note_model.note_by_id(note_id)
+                if note is None:
+                    continue
+                if note is current and self.editor.edited:
+                    conflicts.append((note, None))
+                else:
+                    self._remove_external(note)
+            if self.note_proxy.is_filtered:
+                # Результаты поиска пересчитываются по обновлённым индексам
+                self.filter_notes(self.search_bar.text())
+        count = len(changes.upserted) + len(changes.deleted)
+        self.statusBar().showMessage(f"Подхвачены изменения с диска: {count}", 3000)
+        return conflicts
+
+    def _take_external(self, note: Note, incoming: Note):
+        note.assign(incoming)
+        self._index_note(note)
+        self.note_model.note_changed(note)
+        if self._history is not None and self.history.has_history(note.id):
+            self.history.record(note, REASON_EXTERNAL)
+        if note is self.editor.current_note:
+            self.editor.reload_note()
+            self.related_timer.start()
+
+    def _remove_external(self, note: Note):
+        # Последнее состояние — в историю: удалённую извне заметку можно восстановить
+        self.history.record(note, REASON_DELETE)
+        self.note_model.remove_note(note)
+        self._unindex_note(note.id)
+        if note is self.editor.current_note:
+            self.editor.load_note(Note(title="", body="", tags=[]))
+
+    def _resolve_conflict(self, note: Note, incoming: Note | None):
+        """Открытую заметку изменили (incoming) или удалили (None) извне, пока её правили здесь."""
+        dlg = QtWidgets.QMessageBox(self)
+        dlg.setIcon(QtWidgets.QMessageBox.Warning)
+        dlg.setWindowTitle("Конфликт изменений")
+        action = "удалили" if incoming is None else "изменили"
+        dlg.setText(f"Заметку «{note.title}» {action} в другом месте, пока вы её редактировали.")
+        dlg.setInformativeText("Обе версии сохраняются в истории заметки.")
+        keep_btn = dlg.addButton("Оставить мою", QtWidgets.QMessageBox.RejectRole)
+        if incoming is None:
+            take_btn = dlg.addButton("Удалить", QtWidgets.QMessageBox.DestructiveRole)
+            both_btn = None
+        else:
+            take_btn = dlg.addButton("Взять версию с диска", QtWidgets.QMessageBox.AcceptRole)
+            both_btn = dlg.addButton("Сохранить обе", QtWidgets.QMessageBox.ActionRole)
+        dlg.setDefaultButton(keep_btn)
+        dlg.exec_()
+        clicked = dlg.clickedButton()
+        # Локальные правки уже в истории (save_note) — запись внешней версии их сохранит
+        if clicked is take_btn:
+            if incoming is None:
+                self._remove_external(note)
+            else:
+                self._take_external(note, incoming)
+            return
+        if incoming is not None:
+            self.history.record(incoming, REASON_EXTERNAL)
+        self.history.record(note)
+        if clicked is both_btn:
+            copy = Note(title=f"{incoming.title} (с диска)", body=incoming.body, tags=incoming.tags)
+            self.note_model.append_note(copy)
+            self.storage.save_note(copy)
+            self._index_note(copy)
+        # Своя версия записывается поверх чужой — вместе с телом: хранилище с ленивыми
+        # телами уже ссылается на тело с диска и иначе не перезаписало бы его
+        note.mark_dirty()
+        self.storage.save_note(note)
 
     # ———— Заполнение и фильтрация списка заметок —————
 
     def populate_note_list(self):
-        self.list_view.clear()
-        for note in self.notes:
-            item = QtWidgets.QListWidgetItem(note.title)
-            item.setData(QtCore.Qt.UserRole, note)
-            self.list_view.addItem(item)
+        # Снимаем фильтр: модель уже содержит все заметки, виджеты не пересоздаются
+        self.search_runner.cancel()
+        self._fuzzy_only = False
+        if self.note_proxy.is_filtered:
+            self.note_model.set_highlight()
+            self.note_proxy.set_filter(None)
 
     def filter_notes(self, text: str):
-        self.list_view.clear()
-        tokens = [tok.lower() for tok in text.split() if tok.strip()]
-        if not tokens:
+        tag_query = parse_tag_query(text)
+        if not tag_query.text.strip() and not tag_query:
             return self.populate_note_list()
-        for note in self.notes:
-            hay = " ".join([
-                note.title.lower(),
-                note.body.lower(),
-                " ".join(tag.lower() for tag in note.tags)
-            ])
-            if any(tok in hay for tok in tokens):
-                item = QtWidgets.QListWidgetItem(note.title)
-                if hasattr(note, 'tags') and note.tags:
-                    item.setToolTip("Теги: " + ", ".join(note.tags))
-                item.setData(QtCore.Qt.UserRole, note)
-                self.list_view.addItem(item)
+        # Результат покажет _show_query_result: сразу, если запрос есть в кэше, иначе из потока поиска
+        self.search_runner.submit(text)
+
+    def _run_query(self, query: str, base: QueryResult | None, cancelled) -> QueryResult:
+        """
+        Поиск для ``SearchRunner`` (поток поиска, под ``_search_lock``). ``base`` —
+        полный результат запроса, который ``query`` уточняет: тогда ищем только среди него.
+        """
+        tag_query = parse_tag_query(query)
+        text = tag_query.text
+        within = base.exact_ids if base is not None else None
+        with metrics.span("search.query") as span:
+            # Теговые фильтры: подходящие заметки; None — фильтров нет
+            allowed = self.tag_index.match(tag_query) if tag_query else None
+            # С фильтром берём все совпадения: лимит применяется уже к отфильтрованным
+            limit = SEARCH_RESULT_LIMIT if allowed is None else None
+            if not text.strip():
+                # Только теги — заметки в порядке списка
+                note_ids = allowed.ids(SEARCH_RESULT_LIMIT)
+            # Результаты уже отсортированы по релевантности (BM25)
+            elif self.storage.supports_search:
+                note_ids = self.storage.search(text, limit=limit)
+            elif self.search_index is not None:
+                note_ids = [note_id for note_id, _ in self.search_index.search_scored(text, limit, within)]
+            else:
+                note_ids = self._title_matches(text, allowed, within, cancelled)
+            if allowed is not None:
+                note_ids = [note_id for note_id in note_ids if note_id in allowed][:SEARCH_RESULT_LIMIT]
+            tokens = tokenize(text)
+            words = set(tokens)
+            exact_count = len(note_ids)
+            if text.strip() and exact_count < FUZZY_MIN_RESULTS and self.fuzzy_index is not None:
+                if cancelled():
+                    raise QueryCancelled()
+                # Точный поиск почти ничего не нашёл — возможно, в запросе опечатка
+                shown = set(note_ids)
+                for match in self.fuzzy_index.search(text, limit=FUZZY_RESULT_LIMIT):
+                    if allowed is not None and match.note_id not in allowed:
+                        continue
+                    words.update(match.words)
+                    if match.note_id not in shown:
+                        note_ids.append(match.note_id)
+                        shown.add(match.note_id)
+            span.args.update(exact=exact_count, fuzzy=len(note_ids) - exact_count, tags=bool(tag_query),
+                             refined=base is not None)
+        # Последнее слово ещё набирают — подсвечиваем и слова с таким префиксом
+        return QueryResult(tuple(note_ids), exact_count, frozenset(words), tokens[-1] if tokens else None,
+                           complete=exact_count < SEARCH_RESULT_LIMIT)
+
+    def _refines(self, old: str, new: str) -> bool:
+        """Результаты запроса ``new`` заведомо есть среди результатов ``old`` (поток поиска)."""
+        old_tags, new_tags = parse_tag_query(old), parse_tag_query(new)
+        if not old_tags.text.strip():
+            return False
+        # Теговые фильтры должны совпадать: меняется только текст
+        if dataclasses.replace(old_tags, text="") != dataclasses.replace(new_tags, text=""):
+            return False
+        if self.storage.supports_search:
+            # Поиск хранилища нельзя ограничить списком заметок
+            return False
+        if self.search_index is not None:
+            return self.search_index.refines(old_tags.text, new_tags.text)
+        return old_tags.text.strip().casefold() in new_tags.text.strip().casefold()
+
+    def _show_query_result(self, query: str, result: QueryResult):
+        metrics.observe("search.results", len(result.note_ids))
+        # Нашлись только похожие заметки — Enter сначала откроет лучшую из них
+        self._fuzzy_only = result.exact_count == 0 and bool(result.note_ids)
+        self.note_model.set_highlight(result.words, result.prefix)
+        self.note_proxy.set_filter(list(result.note_ids))
+        # Лучшее совпадение откроют Enter или таймер автооткрытия — его превью готовим первым
+        self._prefetch_rows(range(PREFETCH_TOP_HITS))
+
+    def _title_matches(self, text: str, allowed: TagSelection | None = None,
+                       within: tuple[str, ...] | None = None, cancelled=None) -> list[str]:
+        """Поиск по вхождению в заголовок — пока поисковый индекс ещё строится."""
+        needle = text.strip().casefold()
+        if within is None:
+            notes = self.notes
+        else:
+            notes = [note for note in map(self.note_model.note_by_id, within) if note is not None]
+        matches = []
+        for position, note in enumerate(notes):
+            if cancelled is not None and position % TITLE_SCAN_CHECK_EVERY == 0 and cancelled():
+                raise QueryCancelled()
+            if needle in note.title_key and (allowed is None or note.id in allowed):
+                matches.append(note.id)
+                if len(matches) >= SEARCH_RESULT_LIMIT:
+                    break
+        return matches
+
+
+    def _index_note(self, note: Note):
+        if self._similarity_pending is not None:
+            self._similarity_pending[note.id] = note
+        elif self.similarity_index is not None:
+            self.similarity_index.update(note)
+        with self._search_lock:
+            self.tag_index.update(note)
+            if self._body_index_pending is not None:
+                self._body_index_pending[note.id] = note
+            if self._index_pending is not None:
+                self._index_pending[note.id] = note
+            else:
+                if self.search_index is not None:
+                    self.search_index.update(note)
+                if self.fuzzy_index is not None:
+                    self.fuzzy_index.update(note)
+        self.search_runner.invalidate()
+
+    def _unindex_note(self, note_id: str):
+        if self._similarity_pending is not None:
+            self._similarity_pending[note_id] = None
+        elif self.similarity_index is not None:
+            self.similarity_index.remove(note_id)
+        with self._search_lock:
+            self.tag_index.remove(note_id)
+            if self._body_index_pending is not None:
+                self._body_index_pending[note_id] = None
+            if self._index_pending is not None:
+                self._index_pending[note_id] = None
+            else:
+                if self.search_index is not None:
+                    self.search_index.remove(note_id)
+                if self.fuzzy_index is not None:
+                    self.fuzzy_index.remove(note_id)
+        self.search_runner.invalidate()
+
+    def select_note(self, note: Note):
+        index = self.note_proxy.mapFromSource(self.note_model.index_of(note.id))
+        if index.isValid():
+            self.list_view.setCurrentIndex(index)
+            self.list_view.scrollTo(index)
 
     # ———— Авто‑открытие лучшей заметки —————
 
@@ -136,43 +670,211 @@ class MainWindow(QtWidgets.QMainWindow):
         if text.strip():
             self.open_timer.start()
 
+    def _prefetch_rows(self, rows):
+        notes = []
+        for row in rows:
+            index = self.note_proxy.index(row)
+            if index.isValid():
+                notes.append(index.data(NoteRole))
+        self.editor.prefetch(notes)
+
+    def _prefetch_neighbours(self, row: int):
+        # Ближайшие сначала: вниз по списку листают чаще, чем вверх
+        offsets = [offset for distance in range(1, PREFETCH_NEIGHBOURS + 1) for offset in (distance, -distance)]
+        self._prefetch_rows(row + offset for offset in offsets if row + offset >= 0)
+
     def open_top_match(self):
-        if self.list_view.count() > 0:
-            item = self.list_view.item(0)
-            self.list_view.setCurrentItem(item)
-            self.load_selected_note(item)
+        self.search_runner.wait()
+        index = self.note_proxy.index(0)
+        if index.isValid():
+            self.list_view.setCurrentIndex(index)
+            self.load_selected_note(index)
 
     # ———— Генерация заметки по Enter —————
 
+    @property
+    def response_cache(self):
+        if self._response_cache is None:
+            from core.response_cache import ResponseCache
+            self._response_cache = ResponseCache(
+                "data/response_cache.sqlite3",
+                max_bytes=int(response_cache_max_mb * 1024 * 1024),
+                ttl=response_cache_ttl_days * 24 * 3600,
+            )
+        return self._response_cache
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._history = RevisionHistory(
+                "data/history.sqlite3",
+                max_bytes=int(history_max_mb * 1024 * 1024),
+                coalesce_seconds=history_coalesce_seconds,
+            )
+        return self._history
+
+    @property
+    def giga_worker(self):
+        """Фоновая очередь генерации (один event loop на всё приложение); сетевой стек грузится здесь."""
+        if self._giga_worker is None:
+            with metrics.span("gigachat.worker_start"):
+                from ui.gigachat_worker import GigachatWorker
+                self._giga_worker = GigachatWorker(self.response_cache, parent=self)
+            self._giga_worker.progress.connect(self.on_giga_progress)
+            self._giga_worker.result_ready.connect(self.on_giga_result)
+            self._giga_worker.error.connect(self.on_giga_error)
+            self._giga_worker.delta.connect(self.on_giga_delta)
+        return self._giga_worker
+
     def on_search_enter(self):
         query = self.search_bar.text().strip()
         if not query:
             return
+        # Решение (открыть похожую или генерировать) — по результату именно этого запроса
+        if not self.search_runner.wait():
+            # Поиск не дал результата — флаг остался от прошлого запроса
+            self._fuzzy_only = False
         # Останавливаем авто‑таймеры
         self.search_handler._timer.stop()
         self.open_timer.stop()
-        # Запускаем GigaChatWorker
+        if parse_tag_query(query):
+            # Запрос с теговыми фильтрами — это выборка, а не тема для генерации
+            self.open_top_match()
+            return
+        if self._fuzzy_only and self._fuzzy_enter_query != query:
+            # Похоже на опечатку: сначала открываем похожую заметку, повторный Enter — генерация
+            self._fuzzy_enter_query = query
+            self.open_top_match()
+            self.statusBar().showMessage(
+                f"Открыта похожая заметка. Enter ещё раз — сгенерировать «{query}» через GigaChat", 5000
+            )
+            return
+        self._fuzzy_enter_query = None
+        # Shift+Enter — сгенерировать заново в обход кэша ответов
+        force_refresh = bool(QtWidgets.QApplication.keyboardModifiers() & QtCore.Qt.ShiftModifier)
+        # Тема уже раскрыта в заметках — сначала предлагаем их, а не тратим запрос к API
+        existing = self.existing_notes_for(query) if not force_refresh else []
+        if existing and not self._confirm_generation(query, existing):
+            return
+        # Ставим запрос в очередь GigaChat впереди пакетных задач
         self.statusBar().showMessage("Генерация заметки через GigaChat…")
-        self._worker = GigachatWorker(query)
-        self._worker.result_ready.connect(self.on_giga_result)
-        self._worker.error.connect(self.on_giga_error)
-        self._worker.start()
+        from core.generation_queue import PRIORITY_INTERACTIVE
+        job_id = self.giga_worker.submit(query, PRIORITY_INTERACTIVE, stream=gigachat_stream,
+                                         force_refresh=force_refresh)
+        self._interactive_jobs.add(job_id)
 
-    def on_giga_result(self, title: str, body: str):
+    def _confirm_generation(self, query: str, existing: list[tuple[Note, float]]) -> bool:
+        """Диалог «похожие заметки уже есть»: True — всё равно генерировать."""
+        dlg = QtWidgets.QMessageBox(self)
+        dlg.setIcon(QtWidgets.QMessageBox.Question)
+        dlg.setWindowTitle("Похожие заметки уже есть")
+        dlg.setText(f"По теме «{query}» уже есть заметки:")
+        dlg.setInformativeText("\n".join(f"• {note.title} — {score:.0%}" for note, score in existing))
+        open_btn = dlg.addButton("Открыть первую", QtWidgets.QMessageBox.AcceptRole)
+        generate_btn = dlg.addButton("Всё равно сгенерировать", QtWidgets.QMessageBox.ActionRole)
+        dlg.addButton(QtWidgets.QMessageBox.Cancel)
+        dlg.setDefaultButton(open_btn)
+        dlg.exec_()
+        if dlg.clickedButton() is generate_btn:
+            return True
+        if dlg.clickedButton() is open_btn:
+            self.open_note_by_id(existing[0][0].id)
+        return False
+
+    def _add_generated_note(self, title: str, body: str) -> Note:
         note = Note(title=title, body=body)
-        self.notes.append(note)
-        self.storage.save_notes(self.notes)
+        self.note_model.append_note(note)
+        self.storage.save_note(note)
+        self._index_note(note)
+        return note
+
+    def on_giga_progress(self, job_id: str, query: str, state: str):
+        if job_id in self._interactive_jobs:
+            if gigachat_stream and state == "running":
+                self._start_streaming_note(job_id, query)
+            elif state == "cancelled":
+                self._interactive_jobs.discard(job_id)
+                self._finish_streaming_note(job_id, None)
+            return
+        if state in ("queued", "running"):
+            return
+        self._batch_finished += 1
+        if state == "failed":
+            self._batch_failed += 1
+        self._show_batch_status()
+
+    def _open_generated_note(self, note: Note):
         self.populate_note_list()
-        # Открываем новую заметку
-        items = self.list_view.findItems(title, QtCore.Qt.MatchExactly)
-        if items:
-            self.list_view.setCurrentItem(items[0])
-            self.editor.load_note(note)
-        self.statusBar().showMessage("Заметка сгенерирована и добавлена", 3000)
+        self.select_note(note)
+        self.editor.load_note(note)
+        self.related_timer.start()
         self.search_bar.clear()
         QtCore.QTimer.singleShot(200, lambda: self.search_bar.setFocus())
 
-    def on_giga_error(self, error_msg: str):
+    def _start_streaming_note(self, job_id: str, query: str):
+        # Заметка создаётся сразу, текст дописывается по мере прихода кусочков
+        note = self._add_generated_note(query.strip(), "")
+        self._streaming_notes[job_id] = note
+        self._open_generated_note(note)
+        self.statusBar().showMessage("GigaChat пишет заметку…")
+
+    def on_giga_delta(self, job_id: str, text: str):
+        note = self._streaming_notes.get(job_id)
+        if note is None:
+            return
+        note.body += text
+        if self.editor.current_note is note:
+            self.editor.body_edit.appendText(text)
+
+    def _finish_streaming_note(self, job_id: str, body: str | None) -> Note | None:
+        """
+        Завершить потоковую заметку. body=None — поток оборвался: оставляем
+        то, что успело прийти, а пустую заметку удаляем.
+        """
+        note = self._streaming_notes.pop(job_id, None)
+        if note is None:
+            return None
+        note.body = body if body is not None else note.body.strip()
+        if not note.body and body is None:
+            self.note_model.remove_note(note)
+            self.storage.delete_note(note.id)
+            self._unindex_note(note.id)
+            if self.editor.current_note is note:
+                self.editor.load_note(Note(title="", body="", tags=[]))
+            return None
+        self.storage.save_note(note)
+        self._index_note(note)
+        if self.editor.current_note is note:
+            self.editor.load_note(note)
+        if body is None:
+            self.statusBar().showMessage("Генерация прервана, частичный результат сохранён", 5000)
+        return note
+
+    def on_giga_result(self, job_id: str, title: str, body: str):
+        if job_id in self._streaming_notes:
+            self._interactive_jobs.discard(job_id)
+            note = self._finish_streaming_note(job_id, body)
+            self.statusBar().showMessage("Заметка сгенерирована и добавлена", 3000)
+            if note is not None:
+                self._warn_if_duplicate(note)
+            return
+        if job_id not in self._interactive_jobs:
+            # Пакетная генерация: просто добавляем заметку, не трогая редактор и поиск
+            self._add_generated_note(title, body)
+            return
+        self._interactive_jobs.discard(job_id)
+        note = self._add_generated_note(title, body)
+        # Открываем новую заметку
+        self._open_generated_note(note)
+        self.statusBar().showMessage("Заметка сгенерирована и добавлена", 3000)
+        self._warn_if_duplicate(note)
+
+    def on_giga_error(self, job_id: str, error_msg: str):
+        if job_id not in self._interactive_jobs:
+            # Ошибки пакетной генерации учитываются в on_giga_progress, без диалога на каждую
+            return
+        self._interactive_jobs.discard(job_id)
+        partial = self._finish_streaming_note(job_id, None)
         dlg = QtWidgets.QMessageBox(self)
         dlg.setIcon(QtWidgets.QMessageBox.Warning)
         dlg.setWindowTitle("Ошибка GigaChat")
@@ -180,63 +882,177 @@ class MainWindow(QtWidgets.QMainWindow):
         dlg.setInformativeText("Нажмите «Подробнее», чтобы увидеть детали.")
         dlg.setDetailedText(error_msg)
         dlg.exec_()
-        self.statusBar().showMessage("Не удалось сгенерировать заметку", 3000)
+        if partial is None:
+            self.statusBar().showMessage("Не удалось сгенерировать заметку", 3000)
         QtCore.QTimer.singleShot(200, lambda: self.search_bar.setFocus())
 
+    # ———— Пакетная генерация —————
+
+    def import_query_list(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Список тем для генерации", "", "Текстовые файлы (*.txt *.md);;Все файлы (*)"
+        )
+        if not path:
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        if not queries:
+            self.statusBar().showMessage("В файле нет запросов", 3000)
+            return
+        if not self.giga_worker.pending:
+            self._batch_total = self._batch_finished = self._batch_failed = 0
+        self._batch_total += len(queries)
+        from core.generation_queue import PRIORITY_BATCH
+        self.giga_worker.submit_many(queries, PRIORITY_BATCH)
+        self._show_batch_status()
+
+    def cancel_generation(self):
+        if self._giga_worker is not None:
+            self._giga_worker.cancel_all()
+        self.statusBar().showMessage("Генерация отменена", 3000)
+
+    def _show_batch_status(self):
+        if not self._batch_total:
+            return
+        message = f"Пакетная генерация: {self._batch_finished} из {self._batch_total}"
+        if self._batch_failed:
+            message += f" (ошибок: {self._batch_failed})"
+        if self._batch_finished >= self._batch_total:
+            self.statusBar().showMessage(message + " — завершено", 5000)
+            self._batch_total = self._batch_finished = self._batch_failed = 0
+        else:
+            self.statusBar().showMessage(message)
+
     # ———— Работа с заметками —————
 
-    def load_selected_note(self, item: QtWidgets.QListWidgetItem):
-        note = item.data(QtCore.Qt.UserRole)
+    def load_selected_note(self, index: QtCore.QModelIndex):
+        note = index.data(NoteRole)
         self.editor.load_note(note)
+        # Подсвечиваем в тексте те же совпадения с запросом, что и в списке
+        self.editor.body_edit.set_highlight(self.note_model.highlight_words, self.note_model.highlight_prefix)
         self.statusBar().showMessage(f"Открыта: {note.title}")
+        self.related_timer.start()
+        self._prefetch_neighbours(index.row())
         QtCore.QTimer.singleShot(2000, lambda: self.search_bar.setFocus())
 
+    def open_note_by_id(self, note_id: str):
+        note = self.note_model.note_by_id(note_id)
+        if note is None:
+            return
+        self.select_note(note)
+        self.editor.load_note(note)
+        self.statusBar().showMessage(f"Открыта: {note.title}")
+        if self.list_view.currentIndex().isValid():
+            self._prefetch_neighbours(self.list_view.currentIndex().row())
+        self.related_timer.start()
+
+    def _on_storage_error(self, message: str):
+        # Изменения остались в очереди писателя и будут записаны при следующей попытке
+        self.statusBar().showMessage(f"Не удалось сохранить изменения, повтор позже: {message}", 10000)
+
+    # ———— Похожие заметки —————
+
+    def update_related_notes(self):
+        if not similar_notes:
+            return
+        note = self.editor.current_note
+        if note is None or not (note.title or note.body):
+            self.related_panel.show_message("откройте заметку")
+            return
+        if self.similarity_index is None:
+            self.related_panel.show_message("индекс ещё строится…")
+            return
+        with metrics.span("similarity.related") as span:
+            related = [match for match in self.similarity_index.related(note, limit=RELATED_NOTES_LIMIT)
+                       if match.score >= RELATED_MIN_SCORE]
+            duplicates = {match.note_id: match.score for match in self.similarity_index.duplicates_of(note)}
+            span.args.update(related=len(related), duplicates=len(duplicates))
+        # Почти-дубликаты — первыми, даже если по TF-IDF они не попали в top-k
+        items = [(note_id, score, True) for note_id, score in duplicates.items()]
+        items += [(match.note_id, match.score, False) for match in related if match.note_id not in duplicates]
+        rows = [(self.note_model.note_by_id(note_id), score, duplicate) for note_id, score, duplicate in items]
+        self.related_panel.show_related([row for row in rows if row[0] is not None])
+
+    def existing_notes_for(self, query: str) -> list[tuple[Note, float]]:
+        """Заметки, которые, похоже, уже раскрывают тему запроса генерации (лучшие — первыми)."""
+        if self.similarity_index is None:
+            return []
+        with metrics.span("similarity.check_query"):
+            matches = self.similarity_index.existing_for_query(query)
+        found = [(self.note_model.note_by_id(match.note_id), match.score) for match in matches]
+        return [(note, score) for note, score in found if note is not None]
+
+    def _warn_if_duplicate(self, note: Note):
+        if self.similarity_index is None:
+            return
+        duplicates = self.similarity_index.duplicates_of(note)
+        original = self.note_model.note_by_id(duplicates[0].note_id) if duplicates else None
+        if original is not None:
+            self.statusBar().showMessage(
+                f"Новая заметка почти совпадает с «{original.title}» ({duplicates[0].score:.0%})", 8000
+            )
+
     def create_new_note(self):
         note = Note(title="Новая заметка", body="")
-        self.notes.append(note)
+        self.note_model.append_note(note)
+        self._index_note(note)
         self.populate_note_list()
+        self.select_note(note)
         self.editor.load_note(note)
         self.statusBar().showMessage("Создана новая заметка")
 
     def save_note(self, note: Note):
-        self.storage.save_notes(self.notes)
-        self.populate_note_list()
+        self.storage.save_note(note)
+        self.history.record(note)
+        self.history_timer.start()
+        self._index_note(note)
+        # Перерисовываем только строку этой заметки — выделение сохраняется
+        self.note_model.note_changed(note)
+        self.related_timer.start()
         self.statusBar().showMessage(f"Сохранено: {note.title}", 2000)
 
     # ———— Контекстное меню для заметок —————
 
     def on_context_menu(self, point: QtCore.QPoint):
-        item = self.list_view.itemAt(point)
-        if not item:
+        index = self.list_view.indexAt(point)
+        if not index.isValid():
             return
         menu = QtWidgets.QMenu(self)
         copy_act = menu.addAction("Копировать")
         rename_act = menu.addAction("Переименовать")
+        history_act = menu.addAction("История версий…")
         delete_act = menu.addAction("Удалить")
         action = menu.exec_(self.list_view.mapToGlobal(point))
-        note = item.data(QtCore.Qt.UserRole)
+        note = index.data(NoteRole)
         if action == copy_act:
             self.copy_note(note)
         elif action == rename_act:
-            self.rename_note(note, item)
+            self.rename_note(note)
+        elif action == history_act:
+            self.show_note_history(note)
         elif action == delete_act:
             self.delete_note(note)
 
     def copy_note(self, note: Note):
-        new = Note(title=note.title + " (копия)", body=note.body, tags=getattr(note, 'tags', []))
-        self.notes.append(new)
-        self.storage.save_notes(self.notes)
-        self.populate_note_list()
+        new = Note(title=note.title + " (копия)", body=note.body, tags=list(getattr(note, 'tags', [])))
+        self.note_model.append_note(new)
+        self.storage.save_note(new)
+        self._index_note(new)
         self.statusBar().showMessage(f"Скопировано: {note.title}", 2000)
 
-    def rename_note(self, note: Note, item: QtWidgets.QListWidgetItem):
+    def rename_note(self, note: Note):
         text, ok = QtWidgets.QInputDialog.getText(
             self, "Переименовать заметку", "Новый заголовок:", text=note.title
         )
         if ok and text.strip():
+            self.history.track(note)
             note.title = text.strip()
-            self.storage.save_notes(self.notes)
-            item.setText(note.title)
+            self.storage.save_note(note)
+            self.history.record(note, REASON_RENAME)
+            self._index_note(note)
+            self.note_model.note_changed(note)
+            if self.editor.current_note is note:
+                self.editor.load_note(note)
             self.statusBar().showMessage(f"Переименовано: {note.title}", 2000)
 
     def delete_note(self, note: Note):
@@ -246,16 +1062,81 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
         )
         if reply == QtWidgets.QMessageBox.Yes:
-            self.notes.remove(note)
-            self.storage.save_notes(self.notes)
-            self.populate_note_list()
+            # Последнее состояние остаётся в истории — заметку можно восстановить
+            self.history.record(note, REASON_DELETE)
+            self.note_model.remove_note(note)
+            self.storage.delete_note(note.id)
+            self._unindex_note(note.id)
             self.editor.load_note(Note(title="", body="", tags=[]))
-            self.statusBar().showMessage("Заметка удалена", 2000)
+            self.statusBar().showMessage("Заметка удалена (Файл → Удалённые заметки)", 3000)
+
+    # ———— История версий —————
+
+    def show_note_history(self, note: Note):
+        dlg = HistoryDialog(self.history, self.history.revisions(note.id), f"История: {note.title}", self)
+        if dlg.exec_() == QtWidgets.QDialog.Accepted and dlg.selected is not None:
+            self.restore_revision(note, dlg.selected.rev)
+
+    def restore_revision(self, note: Note, rev: int):
+        """Вернуть заметке заголовок, теги и текст версии ``rev`` (текущее состояние остаётся в истории)."""
+        self.history.track(note)
+        self.history.record(note)
+        restored = self.history.note_at(note.id, rev)
+        note.title, note.body, note.tags = restored.title, restored.body, restored.tags
+        self.storage.save_note(note)
+        self.history.record(note, REASON_RESTORE)
+        self._index_note(note)
+        self.note_model.note_changed(note)
+        if self.editor.current_note is note:
+            self.editor.load_note(note)
+        self.statusBar().showMessage(f"Восстановлена версия: {note.title}", 3000)
+
+    def show_deleted_notes(self):
+        dlg = HistoryDialog(self.history, self.history.deleted_notes(), "Удалённые заметки", self)
+        if dlg.exec_() != QtWidgets.QDialog.Accepted or dlg.selected is None:
+            return
+        note = self.history.note_at(dlg.selected.note_id, dlg.selected.rev)
+        self.note_model.append_note(note)
+        self.storage.save_note(note)
+        self.history.record(note, REASON_RESTORE)
+        self._index_note(note)
+        self.populate_note_list()
+        self.select_note(note)
+        self.editor.load_note(note)
+        self.statusBar().showMessage(f"Восстановлена: {note.title}", 3000)
+
+    # ———— Завершение работы —————
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        # Останавливаем генерацию и дописываем на диск всё, что ещё лежит в очереди писателя
+        if self._giga_worker is not None:
+            self._giga_worker.shutdown()
+        elif self._response_cache is not None:
+            self._response_cache.close()
+        if self.storage_watcher is not None:
+            self.storage_watcher.stop()
+        self.search_runner.stop()
+        if self._history is not None:
+            self._history.close()
+        self.storage.close()
+        super().closeEvent(event)
 
     # ———— Меню и тема —————
 
     def _create_menu(self):
         menubar = self.menuBar()
+        file_menu = menubar.addMenu("Файл")
+        batch_act = QtWidgets.QAction("Сгенерировать заметки из списка…", self)
+        batch_act.triggered.connect(self.import_query_list)
+        cancel_act = QtWidgets.QAction("Отменить генерацию", self)
+        cancel_act.triggered.connect(self.cancel_generation)
+        file_menu.addAction(batch_act)
+        file_menu.addAction(cancel_act)
+        file_menu.addSeparator()
+        deleted_act = QtWidgets.QAction("Удалённые заметки…", self)
+        deleted_act.triggered.connect(self.show_deleted_notes)
+        file_menu.addAction(deleted_act)
+
         settings = menubar.addMenu("Настройки")
         theme_menu = settings.addMenu("Тема")
         light_act = QtWidgets.QAction("Светлая", self)
@@ -265,20 +1146,59 @@ class MainWindow(QtWidgets.QMainWindow):
         theme_menu.addAction(light_act)
         theme_menu.addAction(dark_act)
 
+        cache_menu = settings.addMenu("Кэш ответов GigaChat")
+        cache_stats_act = QtWidgets.QAction("Статистика", self)
+        cache_stats_act.triggered.connect(self.show_cache_stats)
+        cache_clear_act = QtWidgets.QAction("Очистить", self)
+        cache_clear_act.triggered.connect(self.clear_response_cache)
+        cache_menu.addAction(cache_stats_act)
+        cache_menu.addAction(cache_clear_act)
+
+        self.diagnostics_act = QtWidgets.QAction("Диагностика производительности", self)
+        self.diagnostics_act.setCheckable(True)
+        self.diagnostics_act.toggled.connect(self.toggle_diagnostics)
+        settings.addAction(self.diagnostics_act)
+
         help_menu = menubar.addMenu("Help")
         about_act = QtWidgets.QAction("О программе", self)
         about_act.triggered.connect(self.show_about)
         help_menu.addAction(about_act)
 
+    def show_cache_stats(self):
+        st = self.response_cache.stats()
+        QtWidgets.QMessageBox.information(
+            self,
+            "Кэш ответов GigaChat",
+            f"Записей: {st['entries']}\n"
+            f"Размер: {st['bytes'] / 1024:.1f} КБ\n"
+            f"Попаданий: {st['hits']}, промахов: {st['misses']} "
+            f"({st['hit_rate']:.0%})\n\n"
+            "Shift+Enter в строке поиска генерирует заметку заново в обход кэша."
+        )
+
+    def toggle_diagnostics(self, visible: bool):
+        if self.diagnostics_dialog is None:
+            if not visible:
+                return
+            self.diagnostics_dialog = DiagnosticsDialog(metrics, self)
+            # Закрытие окна крестиком снимает галочку в меню
+            self.diagnostics_dialog.finished.connect(lambda _: self.diagnostics_act.setChecked(False))
+        self.diagnostics_dialog.setVisible(visible)
+
+    def clear_response_cache(self):
+        self.response_cache.clear()
+        self.statusBar().showMessage("Кэш ответов очищен", 2000)
+
     def change_theme(self, theme_name: str):
-        app = QtWidgets.QApplication.instance()
-        base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        # применяем QSS
-        style = self._load_qss(os.path.join(base, "assets", "style.qss"))
-        theme = self._load_qss(os.path.join(base, "assets", "themes", f"{theme_name}.qss"))
-        app.setStyleSheet(style + "\n" + theme)
+        if theme_name == self._theme:
+            # Повторное применение того же QSS заново стилизует все виджеты — пропускаем
+            return
+        self._theme = theme_name
+        with metrics.span("ui.apply_stylesheet", theme=theme_name):
+            QtWidgets.QApplication.instance().setStyleSheet(theme_stylesheet(theme_name))
 
         # смена иконки окна
+        base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         icon_file = "LightIcon.png" if theme_name == "dark" else "DarkIcon.png"
         icon_path = os.path.join(base, "assets", icon_file)
         if os.path.exists(icon_path):
@@ -286,12 +1206,6 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.statusBar().showMessage(f"Тема: {theme_name}", 1500)
 
-    def _load_qss(self, path: str) -> str:
-        if not os.path.exists(path):
-            return ""
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-
     def show_about(self):
         QtWidgets.QMessageBox.about(
             self,
@@ -1,14 +1,85 @@
 from PyQt5.QtWidgets import (
     QWidget, QStackedWidget, QPlainTextEdit, QTextEdit, QVBoxLayout
 )
-from PyQt5.QtCore import Qt
+from collections import deque
+from typing import Iterable
+from PyQt5.QtCore import Qt, QTimer, QObject, QRunnable, QThreadPool, QThread, pyqtSignal, pyqtBoundSignal
+from PyQt5.QtGui import QTextCursor, QTextDocument, QFont
+from PyQt5 import sip
+from core.fuzzy_index import match_spans
+from core.metrics import metrics
+from core.models import Note
+from ui.document_cache import DocumentCache
+from ui.highlight import extra_selections
+
+# Не чаще чем раз в столько мс перерисовываем превью при потоковом дописывании
+STREAM_PREVIEW_INTERVAL_MS = 200
+# Пауза в наборе (мс), после которой перерисовывается видимое превью
+PREVIEW_DEBOUNCE_MS = 300
+# Документы короче этого (в символах) разбираются сразу в GUI-потоке —
+# для них поток дороже самого разбора
+SYNC_RENDER_LIMIT = 20_000
+# Пауза (мс) после выбора заметки или результата поиска, после которой
+# в фоне готовятся превью заметок, которые, вероятно, откроют следующими
+PREFETCH_DELAY_MS = 250
+
+
+class _RenderSignals(QObject):
+    # generation, готовый QTextDocument (уже перенесён в GUI-поток)
+    finished = pyqtSignal(int, object)
+    # id заметки, текст, шрифт, документ — заготовка для кэша превью
+    prefetched = pyqtSignal(str, str, object, object)
+
+
+class _MarkdownRenderTask(QRunnable):
+    """
+    Разбирает Markdown в QTextDocument в пуле потоков и отдаёт его в GUI-поток:
+    ``done.emit(*args, doc)``. Раскладку строк Qt в фоновом потоке не переносит —
+    она остаётся GUI-потоку.
+    """
+
+    def __init__(self, markdown: str, font: QFont, target_thread: QThread, done: pyqtBoundSignal, *args):
+        super().__init__()
+        self.markdown = markdown
+        self.font = QFont(font)
+        self.target_thread = target_thread
+        self.done = done
+        self.args = args
+
+    def run(self):
+        with metrics.span("preview.render", chars=len(self.markdown), background=True):
+            doc = build_markdown_document(self.markdown, self.font)
+        doc.moveToThread(self.target_thread)
+        self.done.emit(*self.args, doc)
+
+
+def build_markdown_document(markdown: str, font: QFont | None = None) -> QTextDocument:
+    """Промежуточное представление превью: QTextDocument с разобранным Markdown."""
+    doc = QTextDocument()
+    if font is not None:
+        doc.setDefaultFont(font)
+    # Qt ≥5.14 умеет напрямую рендерить Markdown:
+    doc.setMarkdown(markdown)
+    return doc
+
 
 class MarkdownEditor(QWidget):
     """
     Комбинированный виджет: в режиме preview показывает отрендеренный Markdown,
     а когда фокус попадает в него — переключается на raw‑редактор.
+
+    Превью строится лениво: пока открыт raw‑редактор, набор текста только
+    помечает превью устаревшим. Видимое превью перерисовывается с задержкой
+    после паузы в наборе, а большие документы разбираются в пуле потоков
+    и подменяются целиком (setDocument), когда готовы.
+
+    Документы превью заметок (``setPlainText`` с ``key``) после показа
+    остаются в :class:`DocumentCache`: повторное открытие заметки не разбирает
+    Markdown заново и не раскладывает строки. ``prefetch`` заранее готовит
+    в фоне документы заметок, которые, вероятно, откроют следующими.
     """
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, cache_bytes: int = 0):
+        """:param cache_bytes: бюджет кэша документов превью; 0 — без кэша"""
         super().__init__(parent)
 
         # 1) Собираем стек из двух виджетов
@@ -31,13 +102,55 @@ class MarkdownEditor(QWidget):
         self.raw.focusOutEvent  = self._on_raw_focus_out
         self.preview.mousePressEvent = self._on_preview_click
 
-        # 4) Обновление превью при изменении текста
-        self.raw.textChanged.connect(self._update_preview)
+        # 4) Превью только помечается устаревшим при изменении текста
+        self._preview_dirty = True
+        self._generation = 0
+        self._preview_doc: QTextDocument | None = None
+        # id заметки в редакторе и (id, текст, шрифт) документа на экране — по ним документ уходит в кэш
+        self._key: str | None = None
+        self._preview_source: tuple[str | None, str, QFont] | None = None
+        # Текст и шрифт документа, который разбирается в фоне для текущего generation
+        self._render_source: tuple[str | None, str, QFont] | None = None
+        self.documents = DocumentCache(cache_bytes, self)
+        # Сохранять ли прокрутку при подмене документа (False после загрузки другой заметки)
+        self._keep_scroll = False
+        self._render_signals = _RenderSignals(self)
+        self._render_signals.finished.connect(self._on_render_finished)
+        self._render_signals.prefetched.connect(self._on_prefetched)
+        self.raw.textChanged.connect(self._on_raw_text_changed)
+        # Подсветка совпадений с поиском: слова и префикс последнего слова запроса
+        self._highlight_words: frozenset[str] = frozenset()
+        self._highlight_prefix: str | None = None
+
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self._debounce_timer.timeout.connect(self._update_preview)
+
+        # 5) Троттлинг превью при потоковом дописывании текста
+        self._stream_timer = QTimer(self)
+        self._stream_timer.setSingleShot(True)
+        self._stream_timer.setInterval(STREAM_PREVIEW_INTERVAL_MS)
+        self._stream_timer.timeout.connect(self._update_preview)
+
+        # 6) Фоновая подготовка превью: отдельный поток, чтобы не мешать сборке индексов
+        self._prefetch_queue: deque[Note] = deque()
+        self._prefetch_pool = QThreadPool(self)
+        self._prefetch_pool.setMaxThreadCount(1)
+        self._prefetching = False
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(PREFETCH_DELAY_MS)
+        self._prefetch_timer.timeout.connect(self._prefetch_next)
 
         # Изначально показываем preview
         self.stack.setCurrentIndex(0)
         self._update_preview()
 
+    @property
+    def preview_visible(self) -> bool:
+        return self.stack.currentIndex() == 0
+
     def _on_preview_click(self, event):
         # При клике в превью — переключаем на raw‑режим и даём фокус
         self.stack.setCurrentIndex(1)
@@ -49,23 +162,146 @@ class MarkdownEditor(QWidget):
         QPlainTextEdit.focusInEvent(self.raw, event)
 
     def _on_raw_focus_out(self, event):
-        # уходим из raw — переключаем обратно в preview
+        # уходим из raw — превью сейчас станет видимым, обновляем его
         QPlainTextEdit.focusOutEvent(self.raw, event)
-        self._update_preview()
+        if sip.isdeleted(self):
+            # Фокус теряется при разрушении окна — превью уже не нужно
+            return
+        self._debounce_timer.stop()
+        if self._preview_dirty:
+            self._update_preview()
         self.stack.setCurrentIndex(0)
 
+    def _on_raw_text_changed(self):
+        self._preview_dirty = True
+        self._keep_scroll = True
+        # В raw‑режиме превью не видно — работа откладывается до переключения
+        if self.preview_visible:
+            self._debounce_timer.start()
+
     def _update_preview(self):
+        """Перестроить превью сейчас: маленький документ — сразу, большой — в фоне."""
+        self._stream_timer.stop()
+        self._debounce_timer.stop()
+        self._preview_dirty = False
+        self._generation += 1
         md = self.raw.toPlainText()
-        # Qt ≥5.14 умеет напрямую рендерить Markdown:
-        self.preview.setMarkdown(md)
+        font = QFont(self.preview.font())
+        source = (self._key, md, font)
+        cached = self.documents.take(self._key, md, font) if self._key is not None else None
+        if cached is not None:
+            self._swap_document(cached, source)
+            return
+        if len(md) <= SYNC_RENDER_LIMIT:
+            with metrics.span("preview.render", chars=len(md)):
+                self._swap_document(build_markdown_document(md, font), source)
+            return
+        self._render_source = source
+        task = _MarkdownRenderTask(md, font, self.thread(), self._render_signals.finished, self._generation)
+        QThreadPool.globalInstance().start(task)
+
+    def _on_render_finished(self, generation: int, doc: QTextDocument):
+        if generation != self._generation:
+            # Текст успел измениться — результат устарел
+            doc.deleteLater()
+            return
+        self._swap_document(doc, self._render_source)
+
+    def _swap_document(self, doc: QTextDocument, source: tuple[str | None, str, QFont]):
+        # Подменяем документ целиком; при правке той же заметки сохраняем прокрутку
+        scroll = self.preview.verticalScrollBar().value() if self._keep_scroll else 0
+        doc.setParent(self)
+        self.preview.setDocument(doc)
+        if self._preview_doc is not None:
+            key, text, font = self._preview_source
+            if key is not None and self.documents.max_bytes:
+                # Прежний документ уже разобран и разложен — пригодится при возврате к заметке
+                self.documents.put(key, text, font, self._preview_doc)
+            else:
+                self._preview_doc.deleteLater()
+        self._preview_doc = doc
+        self._preview_source = source
+        self.preview.verticalScrollBar().setValue(scroll)
+        self._apply_highlight(self.preview)
+
+    # ———— Подготовка превью заранее —————
+
+    def prefetch(self, notes: Iterable[Note]):
+        """
+        Подготовить в фоне документы превью этих заметок (по порядку), когда
+        пользователь сделает паузу. Новый вызов заменяет прежнюю очередь.
+        """
+        if not self.documents.max_bytes:
+            return
+        self._prefetch_queue = deque(notes)
+        self._prefetch_timer.start()
+
+    def _prefetch_next(self):
+        if self._prefetching:
+            # Очередь продолжится, когда текущий документ будет готов
+            return
+        font = QFont(self.preview.font())
+        while self._prefetch_queue:
+            note = self._prefetch_queue.popleft()
+            body = note.body
+            if note.id == self._key or self.documents.contains(note.id, body, font):
+                continue
+            self._prefetching = True
+            self._prefetch_pool.start(_MarkdownRenderTask(body, font, self.thread(), self._render_signals.prefetched,
+                                                          note.id, body, font))
+            return
+
+    def _on_prefetched(self, key: str, text: str, font: QFont, doc: QTextDocument):
+        self._prefetching = False
+        metrics.count("preview.prefetched")
+        self.documents.put(key, text, font, doc)
+        if self._prefetch_queue:
+            # По одному документу за проход цикла событий
+            QTimer.singleShot(0, self._prefetch_next)
+
+    # ———— Подсветка совпадений —————
+
+    def set_highlight(self, words=(), prefix: str | None = None):
+        """Подсветить слова (и слова с префиксом) в raw‑тексте и в превью."""
+        self._highlight_words = frozenset(words)
+        self._highlight_prefix = prefix or None
+        self._apply_highlight(self.raw)
+        self._apply_highlight(self.preview)
+
+    def _apply_highlight(self, edit):
+        spans = match_spans(edit.toPlainText(), self._highlight_words, self._highlight_prefix)
+        edit.setExtraSelections(extra_selections(edit, spans))
 
     def toPlainText(self) -> str:
         """Позволяет получить текущий Markdown."""
         return self.raw.toPlainText()
 
-    def setPlainText(self, text: str):
-        """Установить Markdown‑текст в raw‑виджете."""
+    def setPlainText(self, text: str, key: str | None = None):
+        """
+        Установить Markdown‑текст в raw‑виджете.
+        :param key: id заметки — готовое превью берётся из кэша и после показа возвращается в него
+        """
+        self._key = key
         self.raw.blockSignals(True)
         self.raw.setPlainText(text)
         self.raw.blockSignals(False)
-        self._update_preview()
+        self._apply_highlight(self.raw)
+        self._preview_dirty = True
+        self._keep_scroll = False
+        if self.preview_visible:
+            self._update_preview()
+
+    def appendText(self, text: str):
+        """
+        Дописать кусок текста в конец (потоковая генерация) без сигналов textChanged.
+        Превью перерисовывается не чаще STREAM_PREVIEW_INTERVAL_MS.
+        """
+        cursor = QTextCursor(self.raw.document())
+        cursor.movePosition(QTextCursor.End)
+        self.raw.blockSignals(True)
+        cursor.insertText(text)
+        self.raw.blockSignals(False)
+        self._preview_dirty = True
+        self._keep_scroll = True
+        if self.preview_visible and not self._stream_timer.isActive():
+            self._stream_timer.start()
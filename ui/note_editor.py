@@ -10,13 +10,17 @@ class NoteEditor(QtWidgets.QWidget):
     - QLineEdit для заголовка
     - QLineEdit для тегов
     - MarkdownEditor (raw + preview) для тела заметки
-    Эмитит сигнал note_changed при любом изменении.
+    Эмитит сигнал note_changed при любом изменении, а перед первым изменением
+    открытой заметки — editing_started (заметка ещё в прежнем состоянии).
     """
     note_changed = QtCore.pyqtSignal(Note)
+    editing_started = QtCore.pyqtSignal(Note)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, preview_cache_bytes: int = 0):
+        """:param preview_cache_bytes: бюджет кэша готовых превью заметок (см. MarkdownEditor)"""
         super().__init__(parent)
         self.current_note: Note | None = None
+        self._editing = False
 
         # Основной layout
         layout = QtWidgets.QVBoxLayout(self)
@@ -34,7 +38,7 @@ class NoteEditor(QtWidgets.QWidget):
         layout.addWidget(self.tags_edit)
 
         # Тело заметки — комбинированный Markdown‑редактор
-        self.body_edit = MarkdownEditor()
+        self.body_edit = MarkdownEditor(cache_bytes=preview_cache_bytes)
         # Устанавливаем placeholder в raw‑режиме
         self.body_edit.raw.setPlaceholderText("Текст заметки (Markdown)...")
         layout.addWidget(self.body_edit)
@@ -50,6 +54,9 @@ class NoteEditor(QtWidgets.QWidget):
         """
         if not self.current_note:
             return
+        if not self._editing:
+            self._editing = True
+            self.editing_started.emit(self.current_note)
 
         # Заголовок
         self.current_note.title = self.title_edit.text()
@@ -61,12 +68,26 @@ class NoteEditor(QtWidgets.QWidget):
         # Эмитим обновлённую заметку
         self.note_changed.emit(self.current_note)
 
+    @property
+    def edited(self) -> bool:
+        """Открытую заметку правили с момента её загрузки в редактор."""
+        return self._editing
+
+    def reload_note(self):
+        """Перечитать поля текущей заметки (её изменили извне), сохранив позицию курсора."""
+        position = self.body_edit.raw.textCursor().position()
+        self.load_note(self.current_note)
+        cursor = self.body_edit.raw.textCursor()
+        cursor.setPosition(min(position, len(self.body_edit.raw.toPlainText())))
+        self.body_edit.raw.setTextCursor(cursor)
+
     def load_note(self, note: Note):
         """
         Загружает данные из Note в виджет.
         Блокируем сигналы, чтобы избежать лишних emit-ов при setText/ setPlainText.
         """
         self.current_note = note
+        self._editing = False
 
         # Блокируем сигналы
         self.title_edit.blockSignals(True)
@@ -76,9 +97,13 @@ class NoteEditor(QtWidgets.QWidget):
         # Устанавливаем значения
         self.title_edit.setText(note.title)
         self.tags_edit.setText(', '.join(note.tags))
-        self.body_edit.setPlainText(note.body)
+        self.body_edit.setPlainText(note.body, note.id)
 
         # Снимаем блокировку сигналов
         self.title_edit.blockSignals(False)
         self.tags_edit.blockSignals(False)
         self.body_edit.raw.blockSignals(False)
+
+    def prefetch(self, notes: list[Note]):
+        """Подготовить превью заметок, которые, вероятно, откроют следующими."""
+        self.body_edit.prefetch(notes)
@@ -0,0 +1,255 @@
+# ui/note_list_model.py
+
+from PyQt5 import QtCore
+from core.models import Note
+from core.fuzzy_index import match_spans
+from core.metrics import metrics
+
+# Роль, по которой из индекса достаётся сам объект Note
+NoteRole = QtCore.Qt.UserRole
+NoteIdRole = QtCore.Qt.UserRole + 1
+# Диапазоны заголовка [(начало, конец)], совпавшие с поисковым запросом
+HighlightRole = QtCore.Qt.UserRole + 2
+
+
+class NoteListModel(QtCore.QAbstractListModel):
+    """
+    Модель списка заметок поверх общего списка ``MainWindow.notes``.
+    Все изменения проходят через методы модели, чтобы представление получало
+    точечные сигналы (rowsInserted / rowsRemoved / dataChanged) вместо полной перестройки.
+    """
+
+    def __init__(self, notes: list[Note], parent: QtCore.QObject | None = None):
+        super().__init__(parent)
+        self.notes = notes
+        self._rows: dict[str, int] = {}
+        # Слова для подсветки в заголовках и префикс последнего слова запроса
+        self.highlight_words: frozenset[str] = frozenset()
+        self.highlight_prefix: str | None = None
+        self._reindex()
+
+    def _reindex(self, start: int = 0):
+        for row in range(start, len(self.notes)):
+            self._rows[self.notes[row].id] = row
+
+    # ———— Интерфейс QAbstractListModel —————
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.notes)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self.notes):
+            return None
+        note = self.notes[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return note.title
+        if role == QtCore.Qt.ToolTipRole:
+            return "Теги: " + ", ".join(note.tags) if note.tags else None
+        if role == NoteRole:
+            return note
+        if role == NoteIdRole:
+            return note.id
+        if role == HighlightRole:
+            return match_spans(note.title, self.highlight_words, self.highlight_prefix)
+        return None
+
+    def set_highlight(self, words=(), prefix: str | None = None):
+        """
+        Задать слова, которые подсвечиваются в заголовках. Перерисовку вызывает
+        следом идущий сброс прокси-фильтра, поэтому сигналов здесь нет.
+        """
+        self.highlight_words = frozenset(words)
+        self.highlight_prefix = prefix or None
+
+    # ———— Изменение данных —————
+
+    def row_of(self, note_id: str) -> int:
+        """Номер строки заметки или -1, если её нет в модели."""
+        return self._rows.get(note_id, -1)
+
+    def index_of(self, note_id: str) -> QtCore.QModelIndex:
+        row = self.row_of(note_id)
+        return self.index(row) if row >= 0 else QtCore.QModelIndex()
+
+    def note_at(self, row: int) -> Note:
+        return self.notes[row]
+
+    def note_by_id(self, note_id: str) -> Note | None:
+        row = self.row_of(note_id)
+        return self.notes[row] if row >= 0 else None
+
+    def append_note(self, note: Note):
+        row = len(self.notes)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.notes.append(note)
+        self._rows[note.id] = row
+        self.endInsertRows()
+
+    def append_notes(self, notes: list[Note]):
+        """Добавить пачку заметок в конец одним сигналом rowsInserted."""
+        if not notes:
+            return
+        first = len(self.notes)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(notes) - 1)
+        self.notes.extend(notes)
+        self._reindex(first)
+        self.endInsertRows()
+
+    def remove_note(self, note: Note):
+        row = self.row_of(note.id)
+        if row < 0:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.notes[row]
+        del self._rows[note.id]
+        self._reindex(row)
+        self.endRemoveRows()
+
+    def note_changed(self, note: Note):
+        """Перерисовать одну строку после изменения заголовка или тегов."""
+        index = self.index_of(note.id)
+        if index.isValid():
+            self.dataChanged.emit(index, index, [QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole])
+
+    def reset_notes(self, notes: list[Note]):
+        """Полная замена содержимого (например, после перечитывания хранилища)."""
+        self.beginResetModel()
+        self.notes[:] = notes
+        self._rows = {}
+        self._reindex()
+        self.endResetModel()
+
+
+class NoteSearchProxyModel(QtCore.QAbstractProxyModel):
+    """
+    Прокси-фильтр в духе QSortFilterProxyModel, но управляемый готовым
+    результатом поиска: в режиме фильтра показывает только переданные заметки
+    в порядке их релевантности, без режима — все строки исходной модели.
+    В отличие от QSortFilterProxyModel не вызывает Python-колбэк на каждую
+    из десятков тысяч строк при смене запроса.
+    """
+
+    def __init__(self, parent: QtCore.QObject | None = None):
+        super().__init__(parent)
+        # None — фильтр выключен, иначе список исходных строк в порядке показа
+        self._rows: list[int] | None = None
+        self._proxy_rows: dict[int, int] = {}
+
+    def setSourceModel(self, model: NoteListModel):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.dataChanged.connect(self._on_data_changed)
+        model.rowsAboutToBeInserted.connect(self._on_rows_about_to_be_inserted)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._on_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._on_rows_removed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._on_model_reset)
+        self._rows = None
+        self._proxy_rows = {}
+        self.endResetModel()
+
+    # ———— Управление фильтром —————
+
+    @property
+    def is_filtered(self) -> bool:
+        return self._rows is not None
+
+    def set_filter(self, note_ids: list[str] | None):
+        """Показать только заметки с указанными id (в этом порядке) или все, если None."""
+        with metrics.span("list.rebuild") as span:
+            self.beginResetModel()
+            if note_ids is None:
+                self._rows = None
+            else:
+                source: NoteListModel = self.sourceModel()
+                rows = (source.row_of(note_id) for note_id in note_ids)
+                self._rows = [row for row in rows if row >= 0]
+            self._rebuild_mapping()
+            self.endResetModel()
+            span.args["rows"] = self.rowCount()
+
+    def _rebuild_mapping(self):
+        self._proxy_rows = {} if self._rows is None else {src: i for i, src in enumerate(self._rows)}
+
+    # ———— Интерфейс QAbstractProxyModel —————
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return self.sourceModel().rowCount() if self._rows is None else len(self._rows)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else 1
+
+    def index(self, row: int, column: int = 0, parent: QtCore.QModelIndex = QtCore.QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < self.rowCount():
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index: QtCore.QModelIndex = QtCore.QModelIndex()):
+        return QtCore.QModelIndex()
+
+    def mapToSource(self, proxy_index: QtCore.QModelIndex) -> QtCore.QModelIndex:
+        if not proxy_index.isValid() or self.sourceModel() is None:
+            return QtCore.QModelIndex()
+        row = proxy_index.row() if self._rows is None else self._rows[proxy_index.row()]
+        return self.sourceModel().index(row, 0)
+
+    def mapFromSource(self, source_index: QtCore.QModelIndex) -> QtCore.QModelIndex:
+        if not source_index.isValid():
+            return QtCore.QModelIndex()
+        if self._rows is None:
+            return self.index(source_index.row())
+        row = self._proxy_rows.get(source_index.row())
+        return QtCore.QModelIndex() if row is None else self.index(row)
+
+    # ———— Проброс сигналов исходной модели —————
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        if self._rows is None:
+            self.dataChanged.emit(self.index(top_left.row()), self.index(bottom_right.row()), roles)
+            return
+        for src in range(top_left.row(), bottom_right.row() + 1):
+            row = self._proxy_rows.get(src)
+            if row is not None:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, roles)
+
+    def _on_rows_about_to_be_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QtCore.QModelIndex(), first, last)
+
+    def _on_rows_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.endInsertRows()
+            return
+        # Новые строки в результат поиска не попадают, но сдвигают номера исходных строк
+        count = last - first + 1
+        self._rows = [row + count if row >= first else row for row in self._rows]
+        self._rebuild_mapping()
+
+    def _on_rows_about_to_be_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            return
+        # Удаляем из прокси по одной строке, начиная с конца, чтобы номера оставались верными
+        for proxy_row in sorted((self._proxy_rows[src] for src in range(first, last + 1)
+                                 if src in self._proxy_rows), reverse=True):
+            self.beginRemoveRows(QtCore.QModelIndex(), proxy_row, proxy_row)
+            del self._rows[proxy_row]
+            self._rebuild_mapping()
+            self.endRemoveRows()
+
+    def _on_rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self.endRemoveRows()
+            return
+        count = last - first + 1
+        self._rows = [row - count if row > last else row for row in self._rows]
+        self._rebuild_mapping()
+
+    def _on_model_reset(self):
+        self._rows = None
+        self._rebuild_mapping()
+        self.endResetModel()
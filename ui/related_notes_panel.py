@@ -0,0 +1,48 @@
+# ui/related_notes_panel.py
+
+from PyQt5 import QtCore, QtWidgets
+from core.models import Note
+
+
+class RelatedNotesPanel(QtWidgets.QWidget):
+    """
+    Панель «Похожие заметки» под редактором: заметки, близкие к открытой
+    по TF-IDF, с отметкой почти-дубликатов. Клик открывает заметку.
+    """
+    note_activated = QtCore.pyqtSignal(str)  # note_id
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+
+        self.header = QtWidgets.QLabel("Похожие заметки")
+        layout.addWidget(self.header)
+
+        self.list = QtWidgets.QListWidget()
+        self.list.setUniformItemSizes(True)
+        self.list.itemClicked.connect(self._on_item_clicked)
+        layout.addWidget(self.list)
+
+    def show_message(self, text: str):
+        self.list.clear()
+        self.header.setText(f"Похожие заметки — {text}")
+
+    def show_related(self, related: list[tuple[Note, float, bool]]):
+        """:param related: (заметка, сходство от 0 до 1, почти-дубликат ли)"""
+        self.list.clear()
+        if not related:
+            self.show_message("нет")
+            return
+        self.header.setText(f"Похожие заметки ({len(related)})")
+        for note, score, duplicate in related:
+            mark = "  ≈ дубликат" if duplicate else ""
+            item = QtWidgets.QListWidgetItem(f"{note.title or 'Без названия'}  ·  {score:.0%}{mark}")
+            item.setData(QtCore.Qt.UserRole, note.id)
+            if duplicate:
+                item.setToolTip("Текст почти совпадает с открытой заметкой")
+            self.list.addItem(item)
+
+    def _on_item_clicked(self, item: QtWidgets.QListWidgetItem):
+        self.note_activated.emit(item.data(QtCore.Qt.UserRole))
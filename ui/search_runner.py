@@ -0,0 +1,126 @@
+# ui/search_runner.py
+
+import threading
+from typing import Callable
+from PyQt5 import QtCore
+from core.metrics import metrics
+from core.query_cache import QueryCache, QueryCancelled, QueryResult
+
+# (запрос, результат уточняемого запроса или None, «запрос устарел?») -> результат
+SearchFunction = Callable[[str, QueryResult | None, Callable[[], bool]], QueryResult]
+
+
+class _SearchSignals(QtCore.QObject):
+    # Номер запроса, запрос, QueryResult
+    finished = QtCore.pyqtSignal(int, str, object)
+
+
+class _SearchTask(QtCore.QRunnable):
+    def __init__(self, runner: "SearchRunner", seq: int, query: str):
+        super().__init__()
+        self.runner = runner
+        self.seq = seq
+        self.query = query
+
+    def run(self):
+        self.runner._execute(self.seq, self.query)
+
+
+class SearchRunner(QtCore.QObject):
+    """
+    Поиск по мере набора вне GUI-потока. Запросы выполняются по одному
+    в собственном потоке; новый запрос отменяет ещё не начатые, а начатый
+    поиск сам проверяет, не устарел ли он, и бросает работу. Показывается
+    только результат последнего запроса (``result_ready``).
+
+    Результаты последних запросов хранит :class:`QueryCache`: стёртый символ
+    возвращает прежний результат сразу, без потока, а уточнённый запрос
+    ищется среди результатов более короткого.
+    """
+    result_ready = QtCore.pyqtSignal(str, object)  # запрос, QueryResult
+
+    def __init__(self, search: SearchFunction, refines: Callable[[str, str], bool],
+                 lock: threading.Lock, parent: QtCore.QObject | None = None):
+        """
+        :param search: сам поиск; вызывается в потоке поиска под ``lock``
+        :param refines: ``refines(старый, новый)`` — результаты нового запроса
+            заведомо есть среди результатов старого
+        :param lock: блокировка индексов, которые GUI-поток меняет при правке заметок
+        """
+        super().__init__(parent)
+        self._search = search
+        self._refines = refines
+        self._lock = lock
+        self.cache = QueryCache()
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _SearchSignals(self)
+        self._signals.finished.connect(self._on_finished)
+        # Номер последнего запроса: поиск с другим номером устарел
+        self._seq = 0
+        # Номер запроса, чей результат уже показан (result_ready)
+        self._shown_seq = -1
+        # Последний результат потока поиска: wait() показывает его, не дожидаясь сигнала
+        self._finished: tuple[int, str, QueryResult] | None = None
+
+    def submit(self, query: str) -> None:
+        self.cancel()
+        cached = self.cache.get(query)
+        if cached is not None:
+            metrics.count("search.cache_hits")
+            self._shown_seq = self._seq
+            self.result_ready.emit(query, cached)
+            return
+        self._pool.start(_SearchTask(self, self._seq, query))
+
+    def cancel(self) -> None:
+        """Забыть о запросах в работе: их результаты уже не будут показаны."""
+        self._seq += 1
+        self._pool.clear()
+
+    def invalidate(self) -> None:
+        """Заметки или индексы изменились — сохранённые результаты больше не верны."""
+        self.cache.clear()
+
+    def wait(self) -> bool:
+        """
+        Дождаться текущего поиска и показать его результат (перед действием над списком).
+        Возвращает ``True``, если ``result_ready`` для последнего запроса уже отправлен.
+        """
+        self._pool.waitForDone()
+        # Сигнал из потока поиска дойдёт только через цикл событий — показываем результат сами
+        finished, self._finished = self._finished, None
+        if finished is not None:
+            self._on_finished(*finished)
+        return self._shown_seq == self._seq
+
+    def stop(self) -> None:
+        self.cancel()
+        self._pool.waitForDone()
+
+    def _execute(self, seq: int, query: str) -> None:
+        # Поток поиска
+        def cancelled() -> bool:
+            return seq != self._seq
+
+        if cancelled():
+            return
+        generation = self.cache.generation
+        try:
+            with self._lock:
+                base = self.cache.refinement_base(query, self._refines)
+                if base is not None:
+                    metrics.count("search.refined")
+                result = self._search(query, base, cancelled)
+        except QueryCancelled:
+            metrics.count("search.cancelled")
+            return
+        self.cache.put(query, result, generation)
+        self._finished = (seq, query, result)
+        self._signals.finished.emit(seq, query, result)
+
+    def _on_finished(self, seq: int, query: str, result: QueryResult):
+        # Результат, уже показанный wait(), сигнал повторно не показывает
+        if seq == self._seq and seq != self._shown_seq:
+            self._shown_seq = seq
+            self.result_ready.emit(query, result)
@@ -0,0 +1,118 @@
+# ui/storage_watcher.py
+
+import os
+from typing import Callable
+from PyQt5 import QtCore
+from core.storage import BaseNoteStorage
+
+# Файловые события приходят пачкой (запись + переименование) — проверяем после паузы
+DEBOUNCE_MS = 300
+# Запасной опрос: на сетевых дисках и у части программ синхронизации события не приходят
+POLL_INTERVAL_MS = 5000
+
+
+class _WatcherSignals(QtCore.QObject):
+    tracking_started = QtCore.pyqtSignal(object)
+    # ExternalChanges
+    changes_read = QtCore.pyqtSignal(object)
+
+
+class _StorageTask(QtCore.QRunnable):
+    """Вызов метода хранилища в пуле потоков; результат уходит сигналом."""
+
+    def __init__(self, fn: Callable, signal: QtCore.pyqtBoundSignal):
+        super().__init__()
+        self.fn = fn
+        self.signal = signal
+
+    def run(self):
+        self.signal.emit(self.fn())
+
+
+class StorageWatcher(QtCore.QObject):
+    """
+    Следит за файлами хранилища (QFileSystemWatcher + редкий опрос) и сообщает
+    об изменениях, сделанных другими процессами.
+
+    Проверка «менялось ли» дешёвая (отпечатки файлов, ``PRAGMA data_version``)
+    и выполняется в GUI-потоке; собственные записи приложения хранилище
+    отличает само. Чтение изменений идёт в отдельном пуле, чтобы не ждать
+    сборку индексов в глобальном.
+    """
+    changes_detected = QtCore.pyqtSignal(object)  # ExternalChanges
+
+    def __init__(self, storage: BaseNoteStorage, parent: QtCore.QObject | None = None):
+        super().__init__(parent)
+        self.storage = storage
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _WatcherSignals(self)
+        self._signals.tracking_started.connect(self._on_tracking_started)
+        self._signals.changes_read.connect(self._on_changes_read)
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._schedule_check)
+        self._watcher.directoryChanged.connect(self._schedule_check)
+        self._debounce = QtCore.QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(DEBOUNCE_MS)
+        self._debounce.timeout.connect(self.check)
+        self._poll = QtCore.QTimer(self)
+        self._poll.setInterval(POLL_INTERVAL_MS)
+        self._poll.timeout.connect(self.check)
+        self._reading = False
+        self._check_again = False
+        self._stopped = False
+
+    def start(self):
+        # Хэширование заметок для сравнения — в фоне; следить начинаем, когда оно готово
+        self._pool.start(_StorageTask(self.storage.start_change_tracking, self._signals.tracking_started))
+
+    def stop(self):
+        self._stopped = True
+        self._debounce.stop()
+        self._poll.stop()
+        watched = self._watcher.files() + self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+        self._pool.waitForDone()
+
+    def _on_tracking_started(self, _):
+        if self._stopped:
+            return
+        self._poll.start()
+        self.check()
+
+    def _watch_files(self):
+        # Атомарная запись (временный файл + rename) снимает наблюдение с файла — добавляем заново.
+        # Каталог нужен, чтобы увидеть появление файла, которого ещё не было
+        paths = self.storage.watch_paths()
+        paths += sorted({os.path.dirname(os.path.abspath(path)) for path in paths})
+        watched = set(self._watcher.files() + self._watcher.directories())
+        missing = [path for path in paths if path not in watched and os.path.exists(path)]
+        if missing:
+            self._watcher.addPaths(missing)
+
+    def _schedule_check(self, _path: str = ""):
+        self._debounce.start()
+
+    def check(self):
+        if self._stopped:
+            return
+        self._watch_files()
+        if self._reading:
+            self._check_again = True
+            return
+        if not self.storage.changed_on_disk():
+            return
+        self._reading = True
+        self._pool.start(_StorageTask(self.storage.read_external_changes, self._signals.changes_read))
+
+    def _on_changes_read(self, changes):
+        self._reading = False
+        if self._stopped:
+            return
+        if changes:
+            self.changes_detected.emit(changes)
+        if self._check_again:
+            self._check_again = False
+            self.check()